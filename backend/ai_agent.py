@@ -1,28 +1,16 @@
-import os
 import logging
-from openai import OpenAI
+from typing import Iterator
+from llm import complete, complete_async, stream_complete
+from llm_resilience import LLMUnavailableError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-def validate_suggestion(content: str) -> dict:
-    """
-    Validate if a suggestion is safe and actionable using OpenAI API.
-    
-    Args:
-        content: The suggestion text to validate
-        
-    Returns:
-        dict with 'approved' (bool) and 'reason' (str)
-    """
-    try:
-        logger.info(f"Validating suggestion: {content[:50]}...")
-        
-        prompt = f"""You are validating a user suggestion for a self-improving webpage project.
+def build_validation_prompt(content: str) -> str:
+    """Prompt asking the model whether a suggestion is safe and actionable"""
+    return f"""You are validating a user suggestion for a self-improving webpage project.
 
 Suggestion: "{content}"
 
@@ -34,42 +22,21 @@ Determine if this suggestion is:
 Respond with ONLY a JSON object in this exact format:
 {{"approved": true/false, "reason": "brief explanation"}}"""
 
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=200,
-            temperature=0.3
-        )
-        
-        # Parse response
-        response_text = response.choices[0].message.content.strip()
-        logger.info(f"Validation response: {response_text}")
-        
-        # Simple parsing - look for approved true/false
-        if '"approved": true' in response_text or '"approved":true' in response_text:
-            return {"approved": True, "reason": "Suggestion is safe and actionable"}
-        else:
-            return {"approved": False, "reason": "Suggestion does not meet safety or feasibility criteria"}
-            
-    except Exception as e:
-        logger.error(f"Error validating suggestion: {str(e)}")
-        return {"approved": False, "reason": f"Validation error: {str(e)}"}
 
-
-def generate_component_code(content: str) -> str:
-    """
-    Generate React TypeScript component code based on user suggestion.
+def parse_validation(response_text: str) -> dict:
+    """Turn the validation response into an approved/reason dict"""
+    logger.info(f"Validation response: {response_text}")
     
-    Args:
-        content: The approved suggestion text
-        
-    Returns:
-        str: Generated React component code
-    """
-    try:
-        logger.info(f"Generating code for: {content[:50]}...")
-        
-        prompt = f"""You are a code generation assistant for a self-improving webpage project.
+    # Simple parsing - look for approved true/false
+    if '"approved": true' in response_text or '"approved":true' in response_text:
+        return {"approved": True, "reason": "Suggestion is safe and actionable"}
+    else:
+        return {"approved": False, "reason": "Suggestion does not meet safety or feasibility criteria"}
+
+
+def build_generation_prompt(content: str) -> str:
+    """Prompt asking the model for a react-live component"""
+    return f"""You are a code generation assistant for a self-improving webpage project.
 
 User Suggestion: "{content}"
 
@@ -95,31 +62,128 @@ EXACT FORMAT TO FOLLOW:
 Return ONLY the arrow function code, no explanations, no markdown.
 Start with: () =>"""
 
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=1500,
-            temperature=0.7
-        )
+
+def clean_generated_code(code: str) -> str:
+    """Strip whitespace and markdown code fences from generated code"""
+    code = code.strip()
+    
+    # Remove markdown code fences if present
+    if code.startswith("```"):
+        lines = code.split("\n")
+        # Remove first line (```typescript or ```tsx)
+        lines = lines[1:]
+        # Remove last line if it's ```
+        if lines and lines[-1].strip() == "```":
+            lines = lines[:-1]
+        code = "\n".join(lines)
+    
+    logger.info(f"Generated {len(code)} characters of code")
+    return code
+
+
+def generation_error_code(error: Exception) -> str:
+    """Placeholder component stored when generation fails"""
+    return f"// Error generating component: {str(error)}\n\nconst ErrorComponent = () => <div>Error generating component</div>;\n\nexport default ErrorComponent;"
+
+
+def validate_suggestion(content: str) -> dict:
+    """
+    Validate if a suggestion is safe and actionable using OpenAI API.
+    
+    Args:
+        content: The suggestion text to validate
+        
+    Returns:
+        dict with 'approved' (bool) and 'reason' (str)
+        
+    Raises:
+        LLMUnavailableError: the API is unavailable; retry the suggestion later
+    """
+    try:
+        logger.info(f"Validating suggestion: {content[:50]}...")
+        
+        response_text = complete(build_validation_prompt(content), max_tokens=200, temperature=0.3)
+        
+        return parse_validation(response_text.strip())
+            
+    except LLMUnavailableError:
+        raise
+    except Exception as e:
+        logger.error(f"Error validating suggestion: {str(e)}")
+        return {"approved": False, "reason": f"Validation error: {str(e)}"}
+
+
+def generate_component_code(content: str) -> str:
+    """
+    Generate React TypeScript component code based on user suggestion.
+    
+    Args:
+        content: The approved suggestion text
         
-        code = response.choices[0].message.content.strip()
+    Returns:
+        str: Generated React component code
+        
+    Raises:
+        LLMUnavailableError: the API is unavailable; retry the suggestion later
+    """
+    try:
+        logger.info(f"Generating code for: {content[:50]}...")
+        
+        code = complete(build_generation_prompt(content), max_tokens=1500, temperature=0.7)
+        
+        return clean_generated_code(code)
+        
+    except LLMUnavailableError:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating code: {str(e)}")
+        return generation_error_code(e)
+
+
+def stream_component_code(content: str, refresh: bool = False) -> Iterator[str]:
+    """
+    Stream component code tokens as the model emits them.
+    
+    The raw text may include markdown fences; pass the joined result
+    through clean_generated_code before storing it. `refresh` asks the
+    model again instead of replaying the cached generation.
+    """
+    logger.info(f"Streaming code for: {content[:50]}...")
+    yield from stream_complete(
+        build_generation_prompt(content), max_tokens=1500, temperature=0.7, refresh=refresh
+    )
+
+
+async def validate_suggestion_async(content: str) -> dict:
+    """Async variant of validate_suggestion for the async worker mode"""
+    try:
+        logger.info(f"Validating suggestion: {content[:50]}...")
+        
+        response_text = await complete_async(build_validation_prompt(content), max_tokens=200, temperature=0.3)
+        
+        return parse_validation(response_text.strip())
+            
+    except LLMUnavailableError:
+        raise
+    except Exception as e:
+        logger.error(f"Error validating suggestion: {str(e)}")
+        return {"approved": False, "reason": f"Validation error: {str(e)}"}
+
+
+async def generate_component_code_async(content: str) -> str:
+    """Async variant of generate_component_code for the async worker mode"""
+    try:
+        logger.info(f"Generating code for: {content[:50]}...")
         
-        # Remove markdown code fences if present
-        if code.startswith("```"):
-            lines = code.split("\n")
-            # Remove first line (```typescript or ```tsx)
-            lines = lines[1:]
-            # Remove last line if it's ```
-            if lines and lines[-1].strip() == "```":
-                lines = lines[:-1]
-            code = "\n".join(lines)
+        code = await complete_async(build_generation_prompt(content), max_tokens=1500, temperature=0.7)
         
-        logger.info(f"Generated {len(code)} characters of code")
-        return code
+        return clean_generated_code(code)
         
+    except LLMUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error generating code: {str(e)}")
-        return f"// Error generating component: {str(e)}\n\nconst ErrorComponent = () => <div>Error generating component</div>;\n\nexport default ErrorComponent;"
+        return generation_error_code(e)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,6 @@
+"""
+Offline benchmarks: a fake OpenAI-compatible server (fake_openai) and a
+load driver for the API and the worker (load). Run from backend/:
+
+    python -m bench.load --help
+"""
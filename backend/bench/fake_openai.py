@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Fake OpenAI-compatible chat completions server for benchmarks.
+
+Answers POST /v1/chat/completions (plain and streamed) after a simulated
+delay: a time to first token drawn from a latency distribution, then the
+output tokens at a fixed rate. Responses are shaped after the prompt, so
+validation, file analysis, reviews, region selection, patches and code
+generation all get answers the pipeline can use.
+
+    python -m bench.fake_openai --port 8900 --latency 0.8 --distribution lognormal
+    OPENAI_BASE_URL=http://localhost:8900/v1 python worker.py
+
+GET /stats returns request counters since start.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+COMPONENT_TEMPLATE = """() => {
+  return (
+    <div className="p-4 bg-blue-100 rounded">
+      <h1 className="text-xl font-bold">Benchmark component</h1>
+    </div>
+  )
+}"""
+
+
+class LatencyProfile:
+    """
+    Simulated upstream timing.
+
+    `latency` is the mean time to first token in seconds, drawn from
+    `distribution`; lognormal has the long tail real APIs show. Output
+    then arrives at `tokens_per_second` (0 for instantly).
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        distribution: str = "lognormal",
+        tokens_per_second: float = 80.0,
+        output_tokens: int = 300,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+    ):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution: {distribution}")
+        self.latency = latency
+        self.distribution = distribution
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def first_token_delay(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        if self.distribution == "uniform":
+            return random.uniform(0, 2 * self.latency)
+        if self.distribution == "exponential":
+            return random.expovariate(1 / self.latency)
+        if self.distribution == "lognormal":
+            sigma = 0.6
+            return random.lognormvariate(math.log(self.latency) - sigma ** 2 / 2, sigma)
+        return self.latency
+
+    def token_delay(self, tokens: int) -> float:
+        return tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _fenced_block(prompt: str, after: str = "") -> str:
+    """First ``` fenced block of the prompt following `after`"""
+    start = prompt.find(after) if after else 0
+    match = re.search(r"```[^\n]*\n(.*?)\n```", prompt[max(start, 0):], re.DOTALL)
+    return match.group(1) if match else ""
+
+
+def _comment(prompt: str, text: str) -> str:
+    match = re.search(r"^File(?: to modify)?: (\S+)", prompt, re.MULTILINE)
+    return f"# {text}" if match and match.group(1).endswith(".py") else f"// {text}"
+
+
+def canned_response(prompt: str, max_tokens: int, profile: LatencyProfile) -> str:
+    """An answer in the format the prompt asks for"""
+    if "validating a user suggestion" in prompt:
+        return json.dumps({"approved": True, "reason": "Benchmark approval"})
+    if "analyzing a codebase" in prompt:
+        files = os.getenv("FAKE_OPENAI_FILES", "frontend/src/App.tsx").split(",")
+        return json.dumps({"files_to_modify": files, "reasoning": "Benchmark analysis", "complexity": "simple"})
+    if "reviewing code changes" in prompt:
+        return json.dumps({"approved": True, "issues": [], "suggestions": [], "risk_level": "low"})
+    if "Which regions must change" in prompt:
+        return json.dumps({"regions": [0]})
+    if "search/replace edit blocks" in prompt:
+        first_line = next((line for line in _fenced_block(prompt).splitlines() if line.strip()), "")
+        if first_line:
+            return (f"<<<<<<< SEARCH\n{first_line}\n=======\n{first_line}\n"
+                    f"{_comment(prompt, 'benchmark edit')}\n>>>>>>> REPLACE")
+
+    # Rewrites (whole files or regions) echo the code they were given
+    original = _fenced_block(prompt, "Region [") or _fenced_block(prompt)
+    if original:
+        return f"{original}\n{_comment(prompt, 'benchmark edit')}"
+
+    # Component generation: pad to the configured output size
+    budget = min(profile.output_tokens, max_tokens)
+    code = COMPONENT_TEMPLATE
+    padding = max(0, budget - count_tokens(code))
+    if padding:
+        code = "// " + " ".join(["bench"] * (padding * 4 // 6)) + "\n" + code
+    return code
+
+
+def create_app(profile: LatencyProfile) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+    stats = {"requests": 0, "streams": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0,
+             "completion_tokens": 0, "started_at": time.time()}
+
+    def chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    def track_start():
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+
+    @app.get("/stats")
+    def get_stats():
+        return dict(stats, uptime_seconds=round(time.time() - stats["started_at"], 1))
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "gpt-4o")
+        prompt = "\n".join(m.get("content") or "" for m in body.get("messages", []))
+        content = canned_response(prompt, body.get("max_tokens") or profile.output_tokens, profile)
+        completion_tokens = count_tokens(content)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+
+        stats["requests"] += 1
+        track_start()
+        try:
+            await asyncio.sleep(profile.first_token_delay())
+            if random.random() < profile.error_rate:
+                stats["errors"] += 1
+                return JSONResponse(
+                    status_code=profile.error_status,
+                    content={"error": {"message": "Injected benchmark error", "type": "server_error"}}
+                )
+
+            if body.get("stream"):
+                stats["streams"] += 1
+                # The stream counts itself once it starts: a client that
+                # disconnects first never runs the generator's cleanup
+                return StreamingResponse(
+                    stream_events(completion_id, model, content, completion_tokens),
+                    media_type="text/event-stream"
+                )
+
+            await asyncio.sleep(profile.token_delay(completion_tokens))
+        finally:
+            stats["in_flight"] -= 1
+
+        stats["completion_tokens"] += completion_tokens
+        prompt_tokens = count_tokens(prompt)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    async def stream_events(completion_id: str, model: str, content: str, completion_tokens: int):
+        track_start()
+        try:
+            yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+            # One chunk per ~4 characters, like real tokens
+            for i in range(0, len(content), 4):
+                await asyncio.sleep(profile.token_delay(1))
+                yield chunk(completion_id, model, {"content": content[i:i + 4]})
+            yield chunk(completion_id, model, {}, "stop")
+            yield "data: [DONE]\n\n"
+            stats["completion_tokens"] += completion_tokens
+        finally:
+            stats["in_flight"] -= 1
+
+    return app
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    """Latency profile options, shared with the load driver"""
+    parser.add_argument("--latency", type=float, default=0.5, help="mean time to first token (s)")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="output rate, 0 for instant")
+    parser.add_argument("--output-tokens", type=int, default=300, help="size of generated components")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of injected failures")
+
+
+def profile_from_args(args: argparse.Namespace) -> LatencyProfile:
+    return LatencyProfile(
+        latency=args.latency,
+        distribution=args.distribution,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(profile_from_args(args)), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Load driver for the API and the worker.
+
+api: concurrent virtual users call a running API with a weighted mix of
+operations and the latency of each is recorded. The default mix only
+lists and creates suggestions. deploy and generate-changes have side
+effects: deploy writes component files into the frontend checkout and
+generate-changes enqueues multi-agent jobs for the worker. Only add them
+against a scratch checkout and database.
+
+    python -m bench.load api --url http://localhost:8000 --concurrency 20 --requests 2000 \\
+        --mix list=6,create=2,deploy=1,generate-changes=1
+
+worker: starts the fake OpenAI server and worker.py processes, inserts
+suggestions and measures how long each takes from creation to completion.
+
+    python -m bench.load worker --suggestions 200 --mode async --concurrency 20 --latency 0.8
+
+Both talk to a real Postgres (DATABASE_URL); use a scratch database.
+Results can be saved with --json and compared to a saved run with
+--baseline; the exit status is 1 when a run regressed.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+import httpx
+
+from bench.fake_openai import add_profile_arguments
+from bench.stats import compare, format_table, save_results, summarize
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPERATIONS = ("list", "create", "deploy", "generate-changes")
+# Read and insert only; see the module docstring before adding the others
+DEFAULT_MIX = "list=6,create=2"
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """"list=6,create=2" -> {"list": 6.0, "create": 2.0}"""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def sample_ids(client: httpx.AsyncClient) -> Dict[str, List[int]]:
+    """Existing suggestion ids to deploy and generate changes for"""
+    response = await client.get("/api/suggestions", params={"limit": 200, "fields": "id,status"})
+    response.raise_for_status()
+    items = response.json()["items"]
+    return {
+        "any": [item["id"] for item in items],
+        "completed": [item["id"] for item in items if item["status"] == "completed"],
+    }
+
+
+async def request(client: httpx.AsyncClient, operation: str, ids: Dict[str, List[int]]) -> httpx.Response:
+    if operation == "list":
+        return await client.get("/api/suggestions", params={"limit": 50})
+    if operation == "create":
+        response = await client.post("/api/suggestions", json={"content": f"Benchmark suggestion {uuid.uuid4().hex}"})
+        if response.status_code == 201:
+            ids["any"].append(response.json()["id"])
+        return response
+    if operation == "deploy":
+        return await client.post(f"/api/suggestions/{random.choice(ids['completed'])}/deploy")
+    return await client.post(f"/api/suggestions/{random.choice(ids['any'])}/generate-changes")
+
+
+async def run_api(args: argparse.Namespace) -> Dict[str, Dict]:
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        ids = await sample_ids(client)
+        mix = dict(args.mix)
+        if not ids["completed"] and mix.pop("deploy", None):
+            print("No completed suggestions to deploy, leaving deploy out of the mix")
+        if not ids["any"] and "create" not in mix and mix.pop("generate-changes", None):
+            print("No suggestions to generate changes for, leaving generate-changes out of the mix")
+        operations, weights = list(mix), list(mix.values())
+
+        latencies = defaultdict(list)
+        errors = Counter()
+        remaining = args.requests
+        stop_at = time.monotonic() + args.duration if args.duration else None
+
+        async def user():
+            nonlocal remaining
+            while remaining > 0 and (stop_at is None or time.monotonic() < stop_at):
+                remaining -= 1
+                operation = random.choices(operations, weights)[0]
+                if operation == "generate-changes" and not ids["any"]:
+                    operation = "create"
+                started = time.monotonic()
+                try:
+                    response = await request(client, operation, ids)
+                    failed = response.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+                if failed:
+                    errors[operation] += 1
+                else:
+                    latencies[operation].append(time.monotonic() - started)
+
+        started = time.monotonic()
+        await asyncio.gather(*(user() for _ in range(args.concurrency)))
+        elapsed = time.monotonic() - started
+
+    results = {
+        operation: summarize(latencies[operation], errors[operation], elapsed)
+        for operation in operations if latencies[operation] or errors[operation]
+    }
+    results["total"] = summarize(
+        [latency for values in latencies.values() for latency in values], sum(errors.values()), elapsed
+    )
+    return results
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 15.0):
+    stop_at = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.get(url, timeout=1.0).raise_for_status()
+            return
+        except httpx.HTTPError:
+            if time.monotonic() > stop_at:
+                raise
+            time.sleep(0.2)
+
+
+def start_fake_server(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    """Fake OpenAI server in a subprocess; returns it and its base URL"""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "bench.fake_openai", "--port", str(port),
+         "--latency", str(args.latency), "--distribution", args.distribution,
+         "--tokens-per-second", str(args.tokens_per_second), "--output-tokens", str(args.output_tokens),
+         "--error-rate", str(args.error_rate), "--error-status", str(args.error_status)],
+        cwd=BACKEND_DIR
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    wait_for(f"{base_url}/stats")
+    return process, base_url
+
+
+def worker_env(args: argparse.Namespace, openai_url: str, replica: int) -> Dict[str, str]:
+    env = dict(os.environ)
+    # Measure the LLM path: no answers from the cache or from duplicates,
+    # and no client-side quota, unless asked for explicitly
+    env.setdefault("LLM_CACHE_ENABLED", "false")
+    env.setdefault("DEDUP_ENABLED", "false")
+    env.setdefault("LLM_RATE_LIMIT_ENABLED", "false")
+    env.setdefault("OPENAI_API_KEY", "bench")
+    env.update({
+        "OPENAI_BASE_URL": openai_url,
+        "WORKER_ID": f"bench-{os.getpid()}-{replica}",
+        "WORKER_MODE": args.mode,
+        "WORKER_QUEUES": "suggestions",
+        "WORKER_MAX_IN_FLIGHT": str(args.concurrency),
+        "WORKER_VALIDATE_CONCURRENCY": str(args.concurrency),
+        "WORKER_GENERATE_CONCURRENCY": str(args.concurrency),
+    })
+    return env
+
+
+def insert_suggestions(count: int) -> List[int]:
+    from database import SessionLocal
+    from models import Suggestion
+    import events  # noqa: F401  NOTIFY on insert wakes the workers
+
+    db = SessionLocal()
+    try:
+        run = uuid.uuid4().hex[:8]
+        suggestions = [Suggestion(content=f"Benchmark {run} suggestion {i}: add a widget") for i in range(count)]
+        db.add_all(suggestions)
+        db.flush()
+        ids = [suggestion.id for suggestion in suggestions]
+        db.commit()
+        return ids
+    finally:
+        db.close()
+
+
+def suggestion_timings(ids: List[int]) -> List[tuple]:
+    """(status, created_at, updated_at) of the given suggestions"""
+    from database import SessionLocal
+    from models import Suggestion
+
+    db = SessionLocal()
+    try:
+        return db.query(Suggestion.status, Suggestion.created_at, Suggestion.updated_at).filter(
+            Suggestion.id.in_(ids)
+        ).all()
+    finally:
+        db.close()
+
+
+def delete_suggestions(ids: List[int]):
+    from database import SessionLocal
+    from models import Suggestion
+
+    db = SessionLocal()
+    try:
+        db.query(Suggestion).filter(Suggestion.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_worker(args: argparse.Namespace) -> Dict[str, Dict]:
+    fake, fake_url = (None, None) if args.openai_url else start_fake_server(args)
+    openai_url = args.openai_url or f"{fake_url}/v1"
+    workers = [
+        subprocess.Popen([sys.executable, "worker.py"], cwd=BACKEND_DIR, env=worker_env(args, openai_url, replica))
+        for replica in range(args.replicas)
+    ]
+    ids = []
+    try:
+        # Let the workers connect and start listening before the burst
+        time.sleep(args.warmup)
+        ids = insert_suggestions(args.suggestions)
+        print(f"Inserted {len(ids)} suggestions, waiting for {args.replicas} {args.mode} worker(s)...")
+
+        stop_at = time.monotonic() + args.timeout
+        while True:
+            rows = suggestion_timings(ids)
+            done = sum(1 for status, _, _ in rows if status in ("completed", "failed"))
+            if done == len(ids) or time.monotonic() > stop_at:
+                break
+            if any(worker.poll() is not None for worker in workers):
+                raise RuntimeError("A worker process exited")
+            time.sleep(0.5)
+
+        finished = [row for row in rows if row[0] in ("completed", "failed")]
+        latencies = [(updated - created).total_seconds() for status, created, updated in finished if status == "completed"]
+        span = (max(row[2] for row in finished) - min(row[1] for row in rows)).total_seconds() if finished else 0
+        results = {
+            "suggestion": summarize(latencies, sum(1 for row in finished if row[0] == "failed"), span),
+        }
+        if len(finished) < len(ids):
+            print(f"Timed out: {len(ids) - len(finished)} suggestion(s) unfinished")
+            results["suggestion"]["unfinished"] = len(ids) - len(finished)
+        if fake_url:
+            llm = httpx.get(f"{fake_url}/stats").json()
+            print(f"LLM server: {llm['requests']} requests, {llm['errors']} injected errors, "
+                  f"{llm['max_in_flight']} max in flight")
+        return results
+    finally:
+        for process in workers + ([fake] if fake else []):
+            process.terminate()
+        for process in workers + ([fake] if fake else []):
+            process.wait()
+        if ids and not args.keep:
+            delete_suggestions(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--json", help="save results to this file")
+    parser.add_argument("--baseline", help="compare to results saved with --json")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression vs. baseline (fraction)")
+    scenarios = parser.add_subparsers(dest="scenario", required=True)
+
+    api = scenarios.add_parser("api", help="drive a running API")
+    api.add_argument("--url", default="http://localhost:8000")
+    api.add_argument("--concurrency", type=int, default=10, help="virtual users")
+    api.add_argument("--requests", type=int, default=1000, help="total requests")
+    api.add_argument("--duration", type=float, help="stop after this many seconds")
+    api.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                     help=f"weighted operations, default {DEFAULT_MIX}; deploy and generate-changes "
+                          "write files and create jobs, use a scratch checkout")
+    api.add_argument("--timeout", type=float, default=30.0, help="per request timeout (s)")
+
+    worker = scenarios.add_parser("worker", help="run workers against the fake OpenAI server")
+    worker.add_argument("--suggestions", type=int, default=100)
+    worker.add_argument("--mode", choices=("sync", "async"), default="async")
+    worker.add_argument("--replicas", type=int, default=1, help="worker processes")
+    worker.add_argument("--concurrency", type=int, default=10, help="async mode: suggestions in flight per worker")
+    worker.add_argument("--openai-url", help="use this OpenAI-compatible server instead of starting one")
+    worker.add_argument("--warmup", type=float, default=3.0, help="seconds to let workers start")
+    worker.add_argument("--timeout", type=float, default=600.0)
+    worker.add_argument("--keep", action="store_true", help="keep the inserted suggestions")
+    add_profile_arguments(worker)
+
+    args = parser.parse_args()
+    results = asyncio.run(run_api(args)) if args.scenario == "api" else run_worker(args)
+
+    print()
+    print(format_table(results))
+    if args.json:
+        save_results(args.json, results)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
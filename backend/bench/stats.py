@@ -0,0 +1,72 @@
+"""
+Latency statistics and result files for the benchmarks.
+
+Results are plain dicts, so runs can be saved as JSON and compared
+against a baseline to catch regressions.
+"""
+import json
+from typing import Dict, List, Optional
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * q // 100))  # ceil
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies: List[float], errors: int = 0, elapsed: Optional[float] = None) -> Dict:
+    """Count, errors, p50/p95/p99/max in milliseconds and rate per second"""
+    values = sorted(latencies)
+    summary = {"count": len(values), "errors": errors}
+    for q in PERCENTILES:
+        summary[f"p{q}_ms"] = round(percentile(values, q) * 1000, 1)
+    summary["max_ms"] = round(values[-1] * 1000, 1) if values else 0.0
+    if elapsed:
+        summary["per_second"] = round(len(values) / elapsed, 2)
+    return summary
+
+
+def format_table(results: Dict[str, Dict]) -> str:
+    """One row per operation"""
+    header = f"{'operation':<20}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'/s':>9}"
+    rows = [header, "-" * len(header)]
+    for name, summary in results.items():
+        rows.append(
+            f"{name:<20}{summary['count']:>8}{summary['errors']:>8}"
+            f"{summary['p50_ms']:>10}{summary['p95_ms']:>10}{summary['p99_ms']:>10}{summary['max_ms']:>10}"
+            f"{summary.get('per_second', ''):>9}"
+        )
+    return "\n".join(rows)
+
+
+def save_results(path: str, results: Dict):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def compare(results: Dict[str, Dict], baseline_path: str, tolerance: float) -> List[str]:
+    """
+    Regressions against a saved run: p95 or p99 slower, or throughput
+    lower, by more than `tolerance` (a fraction).
+
+    Returns:
+        One description per regression, empty when within tolerance
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for name, summary in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if before.get(key) and summary[key] > before[key] * (1 + tolerance):
+                regressions.append(f"{name} {key}: {before[key]} -> {summary[key]}")
+        if before.get("per_second") and summary.get("per_second", 0) < before["per_second"] * (1 - tolerance):
+            regressions.append(f"{name} per_second: {before['per_second']} -> {summary.get('per_second', 0)}")
+    return regressions
@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from typing import Optional, Set, Tuple
+
+import psycopg2
+import psycopg2.extensions
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from database import DATABASE_URL
+from models import Job, Suggestion
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Postgres channels carrying suggestion and background job notifications
+SUGGESTION_CHANNEL = "suggestion_events"
+JOB_CHANNEL = "job_events"
+
+
+def describe_change(suggestion: Suggestion, is_new: bool) -> Optional[dict]:
+    """
+    Build the notification payload for a flushed suggestion.
+
+    Returns None when nothing a viewer cares about has changed.
+    """
+    state = inspect(suggestion)
+    payload = {"id": suggestion.id}
+
+    if is_new:
+        payload["event"] = "created"
+    elif state.attrs.status.history.has_changes():
+        payload["event"] = "status"
+    elif state.attrs.deployed.history.has_changes():
+        payload["event"] = "deployed" if state.dict.get("deployed") else "undeployed"
+    elif state.attrs.generated_code.history.has_changes():
+        payload["event"] = "updated"
+    else:
+        return None
+
+    # Only include values that are already loaded, never trigger a refresh
+    for key in ("status", "deployed"):
+        if key in state.dict:
+            payload[key] = state.dict[key]
+    return payload
+
+
+def describe_job_change(job: Job, is_new: bool) -> Optional[dict]:
+    """Notification payload for a flushed job: creation and status changes"""
+    state = inspect(job)
+    if is_new:
+        return {"id": job.id, "event": "created", "kind": job.kind}
+    if state.attrs.status.history.has_changes():
+        return {"id": job.id, "event": "status", "status": state.dict.get("status")}
+    return None
+
+
+@event.listens_for(Session, "after_flush")
+def notify_suggestion_changes(session, flush_context):
+    """
+    Queue a NOTIFY for every suggestion and job written in this flush.
+
+    Postgres delivers notifications only when the transaction commits and
+    drops them on rollback, so listeners never see uncommitted state.
+    """
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Suggestion):
+            changes.append((SUGGESTION_CHANNEL, describe_change(obj, is_new=True)))
+        elif isinstance(obj, Job):
+            changes.append((JOB_CHANNEL, describe_job_change(obj, is_new=True)))
+    for obj in session.dirty:
+        if isinstance(obj, Suggestion):
+            changes.append((SUGGESTION_CHANNEL, describe_change(obj, is_new=False)))
+        elif isinstance(obj, Job):
+            changes.append((JOB_CHANNEL, describe_job_change(obj, is_new=False)))
+
+    for channel, payload in changes:
+        if payload is None:
+            continue
+        session.connection().execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": channel, "payload": json.dumps(payload)}
+        )
+
+
+def listen_connection(*channels: str):
+    """Open a dedicated autocommit psycopg2 connection listening on channels"""
+    conn = psycopg2.connect(DATABASE_URL)
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    with conn.cursor() as cur:
+        for channel in channels:
+            cur.execute(f"LISTEN {channel}")
+    return conn
+
+
+class EventBroker:
+    """
+    Single LISTEN connection per process, fanned out to asyncio subscribers.
+
+    The database sees one listener no matter how many clients are connected.
+    """
+
+    def __init__(self, channel: str = SUGGESTION_CHANNEL, queue_size: int = 100):
+        self.channel = channel
+        self.queue_size = queue_size
+        self._subscribers: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start the listener thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="event-broker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def subscribe(self) -> asyncio.Queue:
+        """Register a subscriber on the running event loop"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers = {s for s in self._subscribers if s[1] is not queue}
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def _publish(self, payload: str):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._offer, queue, payload)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, payload: str):
+        # A slow client misses events rather than stalling everyone else;
+        # events only trigger a delta sync so nothing is lost for good
+        try:
+            queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            pass
+
+    def _run(self):
+        backoff = 1
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = listen_connection(self.channel)
+                logger.info(f"Listening for notifications on '{self.channel}'")
+                backoff = 1
+                while not self._stopped.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._publish(notify.payload)
+            except Exception as e:
+                logger.error(f"Event listener error: {str(e)}, reconnecting in {backoff}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+broker = EventBroker()
+
+
+class NotificationWaiter:
+    """
+    Blocking wait for a notification, used by workers to wake up early.
+
+    Falls back to a plain sleep while the database is unreachable.
+    """
+
+    def __init__(
+        self,
+        channels: Tuple[str, ...] = (SUGGESTION_CHANNEL, JOB_CHANNEL),
+        events: Tuple[str, ...] = ("created",)
+    ):
+        self.channels = channels
+        self.events = events
+        self._conn = None
+
+    def wait(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds; True if a matching event arrived"""
+        deadline = time.monotonic() + timeout
+        try:
+            if self._conn is None:
+                self._conn = listen_connection(*self.channels)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                if select.select([self._conn], [], [], remaining) == ([], [], []):
+                    return False
+                self._conn.poll()
+                woken = False
+                while self._conn.notifies:
+                    notify = self._conn.notifies.pop(0)
+                    try:
+                        woken = woken or json.loads(notify.payload).get("event") in self.events
+                    except ValueError:
+                        woken = True
+                if woken:
+                    return True
+        except Exception as e:
+            logger.error(f"Notification wait failed: {str(e)}")
+            self.close()
+            time.sleep(max(0, deadline - time.monotonic()))
+            return False
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            finally:
+                self._conn = None
@@ -1,7 +1,12 @@
 import os
 import logging
+import posixpath
+import tempfile
+from io import BytesIO
 from git import Repo, GitCommandError
-from typing import Dict, List
+from gitdb import IStream
+from gitdb.typ import str_blob_type
+from typing import Dict, Iterator, List, Optional, Tuple
 import re
 
 logging.basicConfig(level=logging.INFO)
@@ -11,8 +16,13 @@ logger = logging.getLogger(__name__)
 class GitManager:
     """Manages git operations for the self-improving codebase"""
     
-    def __init__(self, repo_path: str = "/Users/bennyjohansson/Documents/Projects/theImprovingWebpage"):
+    def __init__(
+        self,
+        repo_path: str = os.getenv("REPO_PATH", "/Users/bennyjohansson/Documents/Projects/theImprovingWebpage"),
+        base_branch: str = "master"
+    ):
         self.repo_path = repo_path
+        self.base_branch = base_branch
         try:
             self.repo = Repo(repo_path)
             logger.info(f"Git repo initialized at {repo_path}")
@@ -20,138 +30,381 @@ class GitManager:
             logger.error(f"Failed to initialize git repo: {e}")
             raise
     
-    def create_branch(self, suggestion_id: int, description: str) -> str:
+    @staticmethod
+    def branch_name(suggestion_id: int, description: str) -> str:
+        """Branch name for a suggestion"""
+        # Sanitize description for branch name
+        safe_desc = re.sub(r'[^a-z0-9]+', '-', description.lower())[:30]
+        return f"suggestion-{suggestion_id}-{safe_desc}"
+    
+    def resolve(self, ref: str) -> Optional[str]:
+        """Commit hash a ref points to, None if it does not exist"""
+        try:
+            return self.repo.git.rev_parse('--verify', '--quiet', f"{ref}^{{commit}}")
+        except GitCommandError:
+            return None
+    
+    @staticmethod
+    def tree_path(file_path: str) -> str:
+        """Normalize a repo-relative path; reject paths escaping the repo"""
+        path = posixpath.normpath(file_path.replace(os.sep, '/'))
+        if path.startswith('/') or path == '.' or path.split('/')[0] == '..':
+            raise ValueError(f"Invalid path: {file_path}")
+        return path
+    
+    def write_blob(self, content: str) -> str:
+        """Store content in the object database and return the blob hash"""
+        data = content.encode()
+        # gitdb reports the hash as hex bytes; update-index needs text
+        return self.repo.odb.store(IStream(str_blob_type, len(data), BytesIO(data))).hexsha.decode()
+    
+    def file_modes(self, commit: str, paths: List[str]) -> Dict[str, str]:
+        """Modes of the given paths in a commit, so executables stay executable"""
+        listing = self.repo.git.ls_tree(commit, '--', *paths)
+        modes = {}
+        for line in listing.splitlines():
+            info, path = line.split('\t', 1)
+            modes[path] = info.split()[0]
+        return modes
+    
+    def commit_files(
+        self,
+        branch_name: str,
+        changes: Dict[str, str],
+        message: str,
+        retries: int = 3
+    ) -> Tuple[str, List[str]]:
         """
-        Create a new branch for the suggestion.
+        Commit file contents onto a branch without touching the working tree.
+        
+        Blobs go straight into the object database and the tree is built
+        in a throwaway index (GIT_INDEX_FILE), so concurrent calls never
+        see each other's files and the cost does not depend on repo size.
+        The branch starts from the base branch if it does not exist yet;
+        the ref is moved with a compare-and-swap and retried if another
+        writer got there first.
         
         Args:
-            suggestion_id: ID of the suggestion
-            description: Short description for branch name
+            branch_name: Branch to commit on
+            changes: Dict mapping file paths to new content
+            message: Commit message
             
         Returns:
-            Branch name
+            (commit hash, committed file paths)
         """
-        # Sanitize description for branch name
-        safe_desc = re.sub(r'[^a-z0-9]+', '-', description.lower())[:30]
-        branch_name = f"suggestion-{suggestion_id}-{safe_desc}"
+        files = {self.tree_path(path): content for path, content in changes.items()}
+        if not files:
+            raise ValueError("No changes to commit")
+        ref = f"refs/heads/{branch_name}"
+        blobs = {path: self.write_blob(content) for path, content in files.items()}
         
-        try:
-            # Make sure we're on main
-            self.repo.git.checkout('master')
+        for _ in range(retries):
+            tip = self.resolve(ref)
+            parent = tip or self.resolve(f"refs/heads/{self.base_branch}")
+            if parent is None:
+                raise ValueError(f"Base branch {self.base_branch} does not exist")
+            modes = self.file_modes(parent, list(blobs))
             
-            # Create and checkout new branch
-            self.repo.git.checkout('-b', branch_name)
-            logger.info(f"Created branch: {branch_name}")
-            
-            return branch_name
+            fd, index_path = tempfile.mkstemp(prefix="index-", dir=self.repo.git_dir)
+            os.close(fd)
+            # read-tree refuses an empty file but happily creates a missing one
+            os.unlink(index_path)
+            env = {"GIT_INDEX_FILE": index_path}
+            try:
+                self.repo.git.read_tree(parent, env=env)
+                cacheinfo = []
+                for path, sha in blobs.items():
+                    cacheinfo += ['--cacheinfo', f"{modes.get(path, '100644')},{sha},{path}"]
+                self.repo.git.update_index('--add', *cacheinfo, env=env)
+                tree = self.repo.git.write_tree(env=env)
+            finally:
+                if os.path.exists(index_path):
+                    os.unlink(index_path)
             
-        except GitCommandError as e:
-            logger.error(f"Failed to create branch: {e}")
-            # If branch exists, checkout it
+            commit = self.repo.git.commit_tree(tree, '-p', parent, '-m', message)
             try:
-                self.repo.git.checkout(branch_name)
-                return branch_name
-            except:
-                raise
+                # An empty old value asserts that the branch does not exist yet
+                self.repo.git.update_ref(ref, commit, tip or '')
+                logger.info(f"Committed {commit[:7]} on {branch_name}: {len(files)} file(s)")
+                return commit, list(files)
+            except GitCommandError:
+                logger.warning(f"{branch_name} moved while committing, retrying")
+        
+        raise RuntimeError(f"Could not update {branch_name}: too many concurrent writers")
     
-    def apply_changes(self, changes: Dict[str, str]) -> List[str]:
+    def suggestion_branches(self) -> List[Tuple[str, str]]:
         """
-        Write modified files to disk.
+        All suggestion branches as (name, commit), ordered by suggestion id.
         
-        Args:
-            changes: Dict mapping file paths to new content
-            
-        Returns:
-            List of modified file paths
+        Read with a single for-each-ref call.
         """
-        modified_files = []
+        listing = self.repo.git.for_each_ref(
+            '--format=%(refname:short)%09%(objectname)', 'refs/heads/suggestion-*'
+        )
+        branches = [tuple(line.split('\t', 1)) for line in listing.splitlines() if line]
         
-        for file_path, content in changes.items():
-            full_path = os.path.join(self.repo_path, file_path)
-            
-            try:
-                # Ensure directory exists
-                os.makedirs(os.path.dirname(full_path), exist_ok=True)
-                
-                # Write file
-                with open(full_path, 'w') as f:
-                    f.write(content)
-                
-                modified_files.append(file_path)
-                logger.info(f"Modified: {file_path}")
-                
-            except Exception as e:
-                logger.error(f"Failed to write {file_path}: {e}")
-        
-        return modified_files
-    
-    def commit_changes(self, message: str, files: List[str] = None) -> str:
+        def suggestion_id(branch: Tuple[str, str]) -> int:
+            parts = branch[0].split('-')
+            return int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+        
+        return sorted(branches, key=suggestion_id)
+    
+    def branch_stats(self, branches: List[Tuple[str, str]]) -> Dict[str, Dict]:
         """
-        Commit changes to the current branch.
+        Diffstats of many branches against the base branch, in two git calls.
+        
+        `rev-list --parents` lists every commit on the branches but not on
+        the base branch; following first parents out of that set gives each
+        branch's fork point. One `diff-tree --stdin --numstat` then diffs
+        every fork point against its branch tip.
         
         Args:
-            message: Commit message
-            files: List of files to commit (None = all)
+            branches: (name, tip commit) pairs, e.g. from suggestion_branches
             
         Returns:
-            Commit hash
+            Dict mapping branch name to base, tip, files [(path, added,
+            deleted)], added and deleted. Branches already contained in the
+            base branch are left out.
         """
+        if not branches:
+            return {}
+        listing = self.repo.git.rev_list('--parents', *[tip for _, tip in branches], f"^{self.base_branch}")
+        first_parents = {}
+        for line in listing.splitlines():
+            commit, *parents = line.split()
+            first_parents[commit] = parents[0] if parents else None
+        
+        forks = []
+        for name, tip in branches:
+            if tip not in first_parents:
+                continue
+            commit = tip
+            while first_parents.get(commit) in first_parents:
+                commit = first_parents[commit]
+            if first_parents[commit] is not None:
+                forks.append((name, first_parents[commit], tip))
+        if not forks:
+            return {}
+        
+        with tempfile.TemporaryFile('w+') as pairs:
+            # "<commit> <parent>" lines diff the tip against its fork point
+            pairs.write("".join(f"{tip} {base}\n" for _, base, tip in forks))
+            pairs.seek(0)
+            # --always prints a header per line, even for empty diffs
+            # -z: NUL separated records with raw (unquoted) paths
+            output = self.repo.git.diff_tree('--stdin', '--numstat', '-z', '-r', '--always', istream=pairs)
+        
+        blocks = []
+        for record in output.split('\0'):
+            if not record:
+                continue
+            if '\t' not in record:
+                blocks.append([])
+            elif blocks:
+                blocks[-1].append(self.parse_numstat(record))
+        
+        stats = {}
+        for (name, base, tip), files in zip(forks, blocks):
+            stats[name] = {
+                "base": base,
+                "tip": tip,
+                "files": files,
+                "added": sum(f[1] for f in files),
+                "deleted": sum(f[2] for f in files),
+            }
+        return stats
+    
+    def is_ancestor(self, commit: str, of: str) -> bool:
         try:
-            if files:
-                self.repo.index.add(files)
-            else:
-                self.repo.git.add(A=True)
-            
-            commit = self.repo.index.commit(message)
-            logger.info(f"Committed: {commit.hexsha[:7]} - {message}")
+            self.repo.git.merge_base('--is-ancestor', commit, of)
+            return True
+        except GitCommandError:
+            return False
+    
+    def integrate_branches(
+        self,
+        branches: List[str],
+        integration_branch: str = "integration",
+        fast_forward: bool = True
+    ) -> Dict:
+        """
+        Merge many branches onto the base branch in one pass (a merge train).
+        
+        Each branch is merged in order with `git merge-tree --write-tree`,
+        entirely in the object database. A branch that conflicts with the
+        train so far is dropped and the train continues without it. The
+        result is stored on `integration_branch`, and the base branch is
+        fast-forwarded to it once at the end.
+        
+        Returns dict with:
+            - merged: branches included in the train
+            - conflicts: branch -> conflicting files, for skipped branches
+            - up_to_date: branches already contained in the base branch
+            - commit: head of the integration branch
+            - fast_forwarded: whether the base branch was moved
+        """
+        base_ref = f"refs/heads/{self.base_branch}"
+        base = self.resolve(base_ref)
+        if base is None:
+            raise ValueError(f"Base branch {self.base_branch} does not exist")
+        
+        head = base
+        merged, up_to_date, conflicts = [], [], {}
+        for branch in branches:
+            tip = self.resolve(f"refs/heads/{branch}")
+            if tip is None:
+                raise ValueError(f"Branch {branch} does not exist")
+            if self.is_ancestor(tip, head):
+                up_to_date.append(branch)
+                continue
             
-            return commit.hexsha
+            status, output, error = self.repo.git.merge_tree(
+                '--write-tree', '--name-only', '--no-messages', head, tip,
+                with_extended_output=True, with_exceptions=False
+            )
+            lines = output.splitlines()
+            # Exit status 1 means conflicts; anything else is a real failure
+            if status == 1:
+                conflicts[branch] = lines[1:]
+                logger.info(f"Skipping {branch}: conflicts in {', '.join(lines[1:])}")
+                continue
+            if status != 0:
+                raise GitCommandError(['git', 'merge-tree', head, tip], status, error)
             
-        except Exception as e:
-            logger.error(f"Failed to commit: {e}")
-            raise
+            head = self.repo.git.commit_tree(
+                lines[0], '-p', head, '-p', tip,
+                '-m', f"Merge branch '{branch}' into {integration_branch}"
+            )
+            merged.append(branch)
+        
+        # The integration branch is rebuilt from scratch on every run
+        self.repo.git.update_ref(f"refs/heads/{integration_branch}", head)
+        
+        fast_forwarded = False
+        if fast_forward and head != base:
+            if self.get_current_branch() == self.base_branch:
+                # Keep the checked-out working tree in step with the branch
+                self.repo.git.merge('--ff-only', head)
+            else:
+                self.repo.git.update_ref(base_ref, head, base)
+            fast_forwarded = True
+            logger.info(f"Fast-forwarded {self.base_branch} to {head[:7]} ({len(merged)} branches)")
+        
+        return {
+            "merged": merged,
+            "conflicts": conflicts,
+            "up_to_date": up_to_date,
+            "commit": head,
+            "fast_forwarded": fast_forwarded,
+        }
+    
+    @staticmethod
+    def parse_numstat(record: str) -> Tuple[str, int, int]:
+        """(path, added, deleted) from one `--numstat -z` record"""
+        added, deleted, path = record.split('\t', 2)
+        # Binary files report "-" for both counts
+        return path, int(added) if added != '-' else 0, int(deleted) if deleted != '-' else 0
+    
+    def branch_numstat(self, branch_name: str) -> List[Tuple[str, int, int]]:
+        """(path, added, deleted) per file changed on a branch since it forked from the base"""
+        # Without rename detection every record is one path, and -z leaves
+        # it unquoted, so it can be handed back to stream_branch_diff as is
+        output = self.repo.git.diff('--numstat', '-z', '--no-renames', f"{self.base_branch}...{branch_name}")
+        return [self.parse_numstat(record) for record in output.split('\0') if record]
     
-    def get_diff(self, file_path: str = None) -> str:
+    def stream_branch_diff(
+        self,
+        branch_name: str,
+        paths: Optional[List[str]] = None,
+        chunk_size: int = 64 * 1024
+    ) -> Iterator[bytes]:
         """
-        Get diff of changes.
+        Diff of a branch since it forked from the base, read from git in chunks.
         
-        Args:
-            file_path: Specific file to diff (None = all)
-            
-        Returns:
-            Diff as string
+        Stopping the iteration early kills the git process, so a caller
+        only ever holds one chunk in memory. `paths` are matched literally,
+        not as globs, so "pages/[id].tsx" is just that file.
         """
+        args = ['--no-renames', f"{self.base_branch}...{branch_name}"]
+        if paths:
+            args += ['--'] + [f":(literal){path}" for path in paths]
+        process = self.repo.git.diff(*args, as_process=True)
         try:
-            if file_path:
-                return self.repo.git.diff('HEAD', file_path)
-            else:
-                return self.repo.git.diff('HEAD')
-        except:
-            # If no HEAD (new files), diff against empty tree
-            return self.repo.git.diff('--cached')
+            while True:
+                chunk = process.proc.stdout.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            if process.proc.poll() is None:
+                process.proc.kill()
+            process.proc.wait()
     
-    def switch_to_main(self):
-        """Switch back to main branch"""
+    def read_branch_diff(self, branch_name: str, max_bytes: int) -> Tuple[str, bool]:
+        """
+        At most `max_bytes` of a branch diff, cut at a line boundary.
+        
+        Returns:
+            (diff text, whether it was truncated)
+        """
+        data = b""
+        chunks = self.stream_branch_diff(branch_name, chunk_size=min(max_bytes + 1, 64 * 1024))
         try:
-            self.repo.git.checkout('master')
-            logger.info("Switched to master branch")
-        except Exception as e:
-            logger.error(f"Failed to switch to master: {e}")
+            for chunk in chunks:
+                data += chunk
+                if len(data) > max_bytes:
+                    return data[:max_bytes].rsplit(b"\n", 1)[0].decode(errors="replace"), True
+        finally:
+            chunks.close()
+        return data.decode(errors="replace"), False
     
-    def get_current_branch(self) -> str:
-        """Get name of current branch"""
+    def get_current_branch(self) -> Optional[str]:
+        """Get name of current branch (None on a detached HEAD)"""
+        if self.repo.head.is_detached:
+            return None
         return self.repo.active_branch.name
 
 
-if __name__ == "__main__":
-    # Test git operations
-    git = GitManager()
-    print(f"Current branch: {git.get_current_branch()}")
+def smoke_test():
+    """
+    Commit onto branches of a throwaway repository, concurrently, and check
+    the result: what /apply does, without touching a real checkout.
+    """
+    from concurrent.futures import ThreadPoolExecutor
     
-    # Test branch creation
-    # branch = git.create_branch(999, "test dark mode toggle")
-    # print(f"Created branch: {branch}")
+    with tempfile.TemporaryDirectory() as path:
+        repo = Repo.init(path, initial_branch='master')
+        with repo.config_writer() as config:
+            config.set_value('user', 'name', 'Smoke Test')
+            config.set_value('user', 'email', 'smoke@example.com')
+        with open(os.path.join(path, 'README.md'), 'w') as f:
+            f.write("base\n")
+        repo.index.add(['README.md'])
+        repo.index.commit("Initial commit")
+        
+        git = GitManager(path)
+        changes = {i: {'README.md': f"base\nchange {i}\n", f"src/file{i}.ts": f"export const n = {i}\n"} for i in range(8)}
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(
+                lambda i: git.commit_files(git.branch_name(i, f"smoke {i}"), changes[i], f"Smoke {i}"), changes
+            ))
+        
+        for i, (commit, files) in enumerate(results):
+            branch = git.branch_name(i, f"smoke {i}")
+            assert git.resolve(f"refs/heads/{branch}") == commit, branch
+            assert sorted(files) == sorted(changes[i]), files
+            assert git.repo.git.show(f"{branch}:README.md") == changes[i]['README.md'].rstrip("\n")
+        assert not git.repo.is_dirty(untracked_files=True), "working tree was modified"
+        assert git.get_current_branch() == 'master'
+        print(f"OK: {len(results)} concurrent commits, working tree untouched")
+
+
+if __name__ == "__main__":
+    import sys
     
-    # Test switching back
-    # git.switch_to_main()
-    # print(f"Back to: {git.get_current_branch()}")
+    if sys.argv[1:] == ["smoke"]:
+        smoke_test()
+    else:
+        git = GitManager()
+        print(f"Current branch: {git.get_current_branch()}")
+        print(f"Suggestion branches: {len(git.suggestion_branches())}")
@@ -0,0 +1,171 @@
+import logging
+from datetime import timedelta
+from typing import Optional
+from sqlalchemy import Select, and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from llm_resilience import LLMUnavailableError
+from models import Job, Suggestion
+from rate_limiter import BACKGROUND, PRIORITIES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Job kinds the worker knows how to run
+JOB_KINDS = ("analyze", "generate_changes")
+# Results of streamed generations are stored as already completed jobs
+STREAMED_JOB_KINDS = ("generate_file",)
+
+
+def enqueue_job(db: Session, kind: str, suggestion_id: int, priority: str = BACKGROUND) -> Job:
+    """
+    Create a pending job; the caller commits.
+
+    `priority` is the rate limiter priority of the job's LLM calls:
+    INTERACTIVE when a user is waiting for the result.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}")
+    job = Job(kind=kind, suggestion_id=suggestion_id, status="pending", priority=priority)
+    db.add(job)
+    return job
+
+
+def record_streamed_job(db: Session, kind: str, suggestion_id: int, result: dict) -> Job:
+    """Store the result of a generation streamed by the API; the caller commits"""
+    if kind not in STREAMED_JOB_KINDS:
+        raise ValueError(f"Unknown streamed job kind: {kind}")
+    job = Job(kind=kind, suggestion_id=suggestion_id, status="completed", result=result)
+    db.add(job)
+    return job
+
+
+def claim_query(model) -> Select:
+    """
+    The claim query for a leased work table (suggestions or jobs): the
+    oldest pending row or one whose lease expired, locked with SKIP LOCKED.
+
+    Shared by the workers and by `migrations.py verify`, which EXPLAINs it.
+    """
+    return select(model).where(
+        or_(
+            model.status == 'pending',
+            and_(
+                model.status == 'processing',
+                or_(model.lease_expires_at.is_(None), model.lease_expires_at < func.now())
+            )
+        )
+    ).order_by(model.created_at).limit(1).with_for_update(skip_locked=True)
+
+
+def claim_next_job(db: Session, worker_id: str, lease_seconds: int, max_attempts: int) -> Optional[Job]:
+    """
+    Atomically claim the oldest pending job or one with an expired lease.
+
+    Same FOR UPDATE SKIP LOCKED scheme as worker.claim_next_suggestion.
+    """
+    while True:
+        job = db.execute(claim_query(Job)).scalars().first()
+
+        if job is None:
+            db.commit()
+            return None
+
+        if job.attempts >= max_attempts:
+            logger.error(f"Job #{job.id} failed after {job.attempts} attempts")
+            job.status = 'failed'
+            job.error = f"Gave up after {job.attempts} attempts"
+            job.lease_owner = None
+            job.lease_expires_at = None
+            db.commit()
+            continue
+
+        job.status = 'processing'
+        job.lease_owner = worker_id
+        job.lease_expires_at = func.now() + timedelta(seconds=lease_seconds)
+        job.attempts = job.attempts + 1
+        db.commit()
+        return job
+
+
+def finish_job(db: Session, job: Job, worker_id: str, result: dict = None, error: str = None) -> bool:
+    """Store a job outcome if this worker still holds its lease"""
+    db.refresh(job, with_for_update=True)
+
+    if job.status != 'processing' or job.lease_owner != worker_id:
+        logger.warning(f"Lost lease on job #{job.id}, discarding result")
+        db.rollback()
+        return False
+
+    job.status = 'failed' if error else 'completed'
+    job.result = result
+    job.error = error
+    job.lease_owner = None
+    job.lease_expires_at = None
+    db.commit()
+    return True
+
+
+def defer_job(db: Session, job: Job, worker_id: str, seconds: float) -> bool:
+    """
+    Give a claimed job back without a result, to be claimed again after
+    `seconds`; same as worker.defer_suggestion.
+
+    Returns:
+        False when the lease was lost
+    """
+    db.refresh(job, with_for_update=True)
+
+    if job.status != 'processing' or job.lease_owner != worker_id:
+        db.rollback()
+        return False
+
+    job.lease_owner = None
+    job.lease_expires_at = func.now() + timedelta(seconds=seconds)
+    job.attempts = job.attempts - 1
+    db.commit()
+    return True
+
+
+def run_job(kind: str, suggestion_content: str, priority: str = BACKGROUND) -> dict:
+    """Execute the LLM work of a job and return its JSON result"""
+    from multi_agent import analyze_files_for_suggestion, generate_changes
+
+    if kind == "analyze":
+        return analyze_files_for_suggestion(suggestion_content, priority=priority)
+    if kind == "generate_changes":
+        return generate_changes(suggestion_content, priority=priority)
+    raise ValueError(f"Unknown job kind: {kind}")
+
+
+def process_job(db: Session, job: Job, worker_id: str, min_defer_seconds: float = 10):
+    """
+    Run a claimed job and store its result or error.
+
+    When the LLM API is unavailable the job is deferred instead, by at
+    least `min_defer_seconds`.
+    """
+    try:
+        logger.info(f"Running job #{job.id} ({job.kind}) for suggestion #{job.suggestion_id}")
+        suggestion = db.get(Suggestion, job.suggestion_id)
+        if suggestion is None:
+            finish_job(db, job, worker_id, error="Suggestion not found")
+            return
+
+        result = run_job(job.kind, suggestion.content, job.priority)
+        # Release the snapshot held while the LLM calls ran
+        db.commit()
+        if finish_job(db, job, worker_id, result=result):
+            logger.info(f"Job #{job.id} completed")
+
+    except LLMUnavailableError as e:
+        logger.warning(f"Deferring job #{job.id}: {str(e)}")
+        db.rollback()
+        defer_job(db, job, worker_id, max(e.retry_after, min_defer_seconds))
+
+    except Exception as e:
+        logger.error(f"Error running job #{job.id}: {str(e)}")
+        db.rollback()
+        finish_job(db, job, worker_id, error=str(e))
@@ -0,0 +1,334 @@
+import asyncio
+import itertools
+import os
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, Optional
+from openai import AsyncOpenAI, OpenAI
+
+from llm_cache import cache
+from llm_resilience import (
+    HEDGE_ENABLED,
+    HEDGE_PERCENTILE,
+    LLMUnavailableError,
+    breaker,
+    is_retryable,
+    latencies,
+    policy,
+)
+from rate_limiter import BACKGROUND, INTERACTIVE, RATE_LIMIT_ENABLED, estimate_tokens, limiter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Shared OpenAI clients for ai_agent and multi_agent. Retries are done by
+# llm_resilience's policy, not by the SDK, so they share one deadline.
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Runs hedged sync requests; a losing request finishes (or times out) here
+_hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+
+def _hedge_delay(key: tuple, timeout: float) -> Optional[float]:
+    """Seconds after which to send a duplicate request, None to not hedge"""
+    if not HEDGE_ENABLED:
+        return None
+    delay = latencies.percentile(key, HEDGE_PERCENTILE)
+    if delay is None or delay >= timeout:
+        return None
+    return delay
+
+
+def _with_retries(attempt: Callable[[float], object], deadline_at: float):
+    """
+    Run `attempt(deadline_at)` under the circuit breaker, retrying
+    transient errors until the deadline.
+
+    Raises:
+        LLMUnavailableError: circuit open, deadline passed or retries exhausted
+        Exception: non-retryable errors from the API, unchanged
+    """
+    for number in itertools.count():
+        breaker.before_call()
+        try:
+            result = attempt(deadline_at)
+        except Exception as e:
+            delay = _after_failure(number, e, deadline_at)
+            logger.warning(f"LLM call failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        except BaseException:
+            # Interrupted, not failed: a half-open circuit must not wait
+            # forever for this trial's outcome
+            breaker.release()
+            raise
+        breaker.record_success()
+        return result
+
+
+async def _with_retries_async(attempt, deadline_at: float):
+    """Async variant of _with_retries; `attempt` returns an awaitable"""
+    for number in itertools.count():
+        breaker.before_call()
+        try:
+            result = await attempt(deadline_at)
+        except Exception as e:
+            delay = _after_failure(number, e, deadline_at)
+            logger.warning(f"LLM call failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # Cancelled, e.g. an abandoned speculative generation
+            breaker.release()
+            raise
+        breaker.record_success()
+        return result
+
+
+def _after_failure(number: int, error: Exception, deadline_at: float) -> float:
+    """
+    Record a failed attempt with the circuit breaker.
+
+    Returns:
+        Seconds to wait before the next attempt; raises instead when giving up
+    """
+    if isinstance(error, LLMUnavailableError):
+        # Out of time before reaching the API: says nothing about its health
+        breaker.release()
+        raise error
+    if not is_retryable(error):
+        # The API answered, e.g. with a 400: not an outage
+        breaker.record_success()
+        raise error
+    breaker.record_failure()
+    delay = policy.next_delay(number, error, deadline_at)
+    if delay is None:
+        raise LLMUnavailableError(
+            f"LLM call failed after {number + 1} attempt(s): {type(error).__name__} {error}",
+            retry_after=policy.max_seconds
+        ) from error
+    return delay
+
+
+def _request(prompt: str, max_tokens: int, temperature: float, model: str, priority: str, deadline_at: float) -> str:
+    """One chat completion request within the deadline"""
+    if RATE_LIMIT_ENABLED:
+        limiter.acquire(estimate_tokens(prompt, max_tokens), priority, deadline_at)
+    timeout = policy.attempt_timeout(deadline_at)
+    started = time.monotonic()
+    response = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=temperature,
+        timeout=timeout
+    )
+    latencies.record((model, max_tokens), time.monotonic() - started)
+    return response.choices[0].message.content
+
+
+def _hedged_request(prompt: str, max_tokens: int, temperature: float, model: str, priority: str, deadline_at: float) -> str:
+    """
+    _request, plus a duplicate request when the first one is slower than
+    the usual latency for this model and size; the first answer wins.
+    """
+    args = (prompt, max_tokens, temperature, model, priority, deadline_at)
+    delay = _hedge_delay((model, max_tokens), policy.attempt_timeout(deadline_at))
+    if delay is None:
+        return _request(*args)
+
+    pending = {_hedge_pool.submit(_request, *args)}
+    done, pending = wait(pending, timeout=delay)
+    if not done:
+        logger.info(f"Hedging LLM call after {delay:.1f}s")
+        pending.add(_hedge_pool.submit(_request, *args))
+
+    error = None
+    while True:
+        for future in done:
+            if future.exception() is None:
+                # The other request cannot be aborted; its result is dropped
+                return future.result()
+            error = future.exception()
+        if not pending:
+            raise error
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+
+async def _request_async(
+    prompt: str, max_tokens: int, temperature: float, model: str, priority: str, deadline_at: float
+) -> str:
+    if RATE_LIMIT_ENABLED:
+        await limiter.acquire_async(estimate_tokens(prompt, max_tokens), priority, deadline_at)
+    timeout = policy.attempt_timeout(deadline_at)
+    started = time.monotonic()
+    response = await async_client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=temperature,
+        timeout=timeout
+    )
+    latencies.record((model, max_tokens), time.monotonic() - started)
+    return response.choices[0].message.content
+
+
+async def _hedged_request_async(
+    prompt: str, max_tokens: int, temperature: float, model: str, priority: str, deadline_at: float
+) -> str:
+    """Async variant of _hedged_request; the losing request is cancelled"""
+    args = (prompt, max_tokens, temperature, model, priority, deadline_at)
+    delay = _hedge_delay((model, max_tokens), policy.attempt_timeout(deadline_at))
+    if delay is None:
+        return await _request_async(*args)
+
+    pending = {asyncio.create_task(_request_async(*args))}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            logger.info(f"Hedging LLM call after {delay:.1f}s")
+            pending.add(asyncio.create_task(_request_async(*args)))
+
+        error = None
+        while True:
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            if not pending:
+                raise error
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def complete(
+    prompt: str,
+    max_tokens: int,
+    temperature: float,
+    model: str = "gpt-4o",
+    priority: str = BACKGROUND,
+    deadline: Optional[float] = None,
+) -> str:
+    """
+    Single-message chat completion, served from the response cache when the
+    exact same request was made before. Cache misses wait for the shared
+    rate limiter; `priority` is INTERACTIVE for calls a user is waiting on.
+
+    Transient failures are retried within `deadline` seconds (default
+    LLM_DEADLINE_SECONDS), see llm_resilience.
+
+    Returns:
+        The raw message content of the first choice
+
+    Raises:
+        LLMUnavailableError: the API is unavailable; try again later
+    """
+    key = cache.make_key(model, prompt, temperature, max_tokens)
+    if CACHE_ENABLED:
+        cached = cache.get(key)
+        if cached is not None:
+            logger.info(f"LLM cache hit ({key[:12]})")
+            return cached
+
+    content = _with_retries(
+        lambda deadline_at: _hedged_request(prompt, max_tokens, temperature, model, priority, deadline_at),
+        policy.deadline_at(deadline)
+    )
+
+    if CACHE_ENABLED:
+        cache.set(key, model, content)
+    return content
+
+
+async def complete_async(
+    prompt: str,
+    max_tokens: int,
+    temperature: float,
+    model: str = "gpt-4o",
+    priority: str = BACKGROUND,
+    deadline: Optional[float] = None,
+) -> str:
+    """Async variant of complete; cache and limiter I/O run in a thread"""
+    key = cache.make_key(model, prompt, temperature, max_tokens)
+    if CACHE_ENABLED:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            logger.info(f"LLM cache hit ({key[:12]})")
+            return cached
+
+    content = await _with_retries_async(
+        lambda deadline_at: _hedged_request_async(prompt, max_tokens, temperature, model, priority, deadline_at),
+        policy.deadline_at(deadline)
+    )
+
+    if CACHE_ENABLED:
+        await asyncio.to_thread(cache.set, key, model, content)
+    return content
+
+
+def _open_stream(prompt: str, max_tokens: int, temperature: float, model: str, priority: str, deadline_at: float):
+    """Start a streamed completion and wait for its first chunk"""
+    if RATE_LIMIT_ENABLED:
+        limiter.acquire(estimate_tokens(prompt, max_tokens), priority, deadline_at)
+    stream = iter(client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True,
+        timeout=policy.attempt_timeout(deadline_at)
+    ))
+    return next(stream, None), stream
+
+
+def stream_complete(
+    prompt: str,
+    max_tokens: int,
+    temperature: float,
+    model: str = "gpt-4o",
+    priority: str = INTERACTIVE,
+    deadline: Optional[float] = None,
+    refresh: bool = False,
+) -> Iterator[str]:
+    """
+    Streaming variant of complete: yields content deltas as the model emits
+    them. The full text is cached once the stream finishes; a cache hit is
+    yielded as a single chunk. Streams are watched live, so they default to
+    INTERACTIVE priority.
+
+    `refresh` skips the cache lookup, for callers asking for a new answer
+    to a prompt that was answered before; the new text is still cached.
+
+    Retries only happen until the first chunk arrives, since text already
+    yielded cannot be taken back. After that the per-attempt timeout
+    applies to each read of the stream.
+    """
+    key = cache.make_key(model, prompt, temperature, max_tokens)
+    if CACHE_ENABLED and not refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            logger.info(f"LLM cache hit ({key[:12]})")
+            yield cached
+            return
+
+    first, stream = _with_retries(
+        lambda deadline_at: _open_stream(prompt, max_tokens, temperature, model, priority, deadline_at),
+        policy.deadline_at(deadline)
+    )
+    parts = []
+    for chunk in itertools.chain([first] if first is not None else [], stream):
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+
+    if CACHE_ENABLED:
+        cache.set(key, model, "".join(parts))
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from database import SessionLocal
+from models import LLMCacheEntry
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class LLMCache:
+    """
+    Content-addressed cache of chat completion responses.
+
+    Two tiers: an in-process LRU and a Postgres table shared by every
+    process (API and workers). Both expire entries after `ttl_seconds`;
+    the persistent tier is additionally capped at `max_bytes` of responses,
+    evicting the least recently used entries first.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: int = 7 * 24 * 3600,
+        max_bytes: int = 50 * 1024 * 1024,
+        persistent: bool = True,
+        evict_every: int = 50,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.persistent = persistent
+        self.evict_every = evict_every
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def make_key(model: str, prompt: str, temperature: float, max_tokens: int) -> str:
+        """Hash of everything that determines the completion request"""
+        payload = json.dumps(
+            {"model": model, "prompt": prompt, "temperature": temperature, "max_tokens": max_tokens},
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Look a response up in memory, then in the persistent tier"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, stored_at = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return response
+                del self._memory[key]
+
+        response = self._get_persistent(key) if self.persistent else None
+        with self._lock:
+            if response is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["persistent_hits"] += 1
+        self._remember(key, response)
+        return response
+
+    def set(self, key: str, model: str, response: str):
+        """Store a response in both tiers"""
+        self._remember(key, response)
+        with self._lock:
+            self._stats["writes"] += 1
+            self._writes += 1
+            evict = self._writes % self.evict_every == 0
+        if self.persistent:
+            self._set_persistent(key, model, response)
+            if evict:
+                self.evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["persistent_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+    def evict(self):
+        """Drop expired persistent entries, then the LRU tail beyond max_bytes"""
+        db = SessionLocal()
+        try:
+            expired = db.execute(
+                text("DELETE FROM llm_cache WHERE created_at < now() - make_interval(secs => :ttl)"),
+                {"ttl": self.ttl_seconds}
+            ).rowcount
+            oversized = db.execute(
+                text("""
+                    DELETE FROM llm_cache WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key, sum(size) OVER (ORDER BY last_accessed_at DESC, key) AS running
+                            FROM llm_cache
+                        ) ranked WHERE running > :max_bytes
+                    )
+                """),
+                {"max_bytes": self.max_bytes}
+            ).rowcount
+            db.commit()
+            if expired or oversized:
+                logger.info(f"LLM cache evicted {expired} expired and {oversized} least recently used entries")
+            with self._lock:
+                self._stats["evictions"] += expired + oversized
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"LLM cache eviction failed: {str(e)}")
+        finally:
+            db.close()
+
+    def _remember(self, key: str, response: str):
+        with self._lock:
+            self._memory[key] = (response, time.monotonic())
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _get_persistent(self, key: str) -> Optional[str]:
+        # The cache is an optimization: database errors count as misses
+        db = SessionLocal()
+        try:
+            response = db.execute(
+                text("""
+                    UPDATE llm_cache SET last_accessed_at = now()
+                    WHERE key = :key AND created_at >= now() - make_interval(secs => :ttl)
+                    RETURNING response
+                """),
+                {"key": key, "ttl": self.ttl_seconds}
+            ).scalar()
+            db.commit()
+            return response
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"LLM cache lookup failed: {str(e)}")
+            return None
+        finally:
+            db.close()
+
+    def _set_persistent(self, key: str, model: str, response: str):
+        db = SessionLocal()
+        try:
+            statement = insert(LLMCacheEntry).values(
+                key=key, model=model, response=response, size=len(response.encode())
+            )
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[LLMCacheEntry.key],
+                set_={
+                    "response": statement.excluded.response,
+                    "size": statement.excluded.size,
+                    "created_at": text("now()"),
+                    "last_accessed_at": text("now()"),
+                }
+            ))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"LLM cache write failed: {str(e)}")
+        finally:
+            db.close()
+
+
+cache = LLMCache(
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")),
+    ttl_seconds=int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024))),
+    persistent=os.getenv("LLM_CACHE_PERSISTENT", "true").lower() in ("1", "true", "yes"),
+)
@@ -0,0 +1,205 @@
+"""
+Failure handling for LLM calls: deadlines, retries, a circuit breaker and
+latency tracking for hedged requests.
+
+llm.py runs every completion through these pieces:
+
+- each call has a deadline; each attempt gets a timeout within it;
+- transient errors (timeouts, connection errors, 429, 5xx) are retried
+  with jittered exponential backoff, honouring Retry-After;
+- consecutive transient failures open a circuit breaker, after which
+  calls fail fast until a trial call succeeds;
+- latencies are recorded per (model, max_tokens), so a duplicate request
+  can be sent when the first one is slower than the usual p95.
+
+When a call cannot succeed right now, LLMUnavailableError is raised; the
+caller should try again later instead of treating it as a final answer.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Hashable, Optional
+
+from openai import APIConnectionError, APIStatusError
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailableError(Exception):
+    """The API is failing or out of time for this call; it may succeed later"""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(error: Exception) -> bool:
+    """Errors worth retrying: the same status codes the OpenAI SDK retries"""
+    if isinstance(error, APIConnectionError):  # includes APITimeoutError
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error: Exception) -> float:
+    """Server-requested delay from a Retry-After header, 0 if absent"""
+    if not isinstance(error, APIStatusError):
+        return 0.0
+    try:
+        return max(0.0, float(error.response.headers.get("retry-after", 0)))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RetryPolicy:
+    """
+    Per-call deadline and retry schedule.
+
+    Each attempt may take up to `timeout_seconds`, cut short by what is
+    left of `deadline_seconds`. Retries back off exponentially from
+    `base_seconds` up to `max_seconds`, with full jitter so workers that
+    failed together do not retry together.
+    """
+
+    def __init__(
+        self,
+        timeout_seconds: float = 60.0,
+        deadline_seconds: float = 180.0,
+        max_retries: int = 3,
+        base_seconds: float = 1.0,
+        max_seconds: float = 20.0,
+    ):
+        self.timeout_seconds = timeout_seconds
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+
+    def deadline_at(self, deadline_seconds: Optional[float] = None) -> float:
+        return time.monotonic() + (deadline_seconds or self.deadline_seconds)
+
+    def attempt_timeout(self, deadline_at: float) -> float:
+        """
+        Timeout for the next attempt.
+
+        Raises:
+            LLMUnavailableError: the deadline has passed
+        """
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise LLMUnavailableError("LLM call deadline exceeded")
+        return min(self.timeout_seconds, remaining)
+
+    def next_delay(self, attempt: int, error: Exception, deadline_at: float) -> Optional[float]:
+        """
+        Seconds to wait before retrying after `error` on attempt `attempt`
+        (0-based), or None when the call should give up.
+        """
+        if not is_retryable(error) or attempt >= self.max_retries:
+            return None
+        delay = random.uniform(0, min(self.max_seconds, self.base_seconds * 2 ** attempt))
+        delay = max(delay, retry_after_seconds(error))
+        # A retry that cannot finish before the deadline only wastes quota
+        if time.monotonic() + delay >= deadline_at:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Fail fast while the API is down.
+
+    After `failure_threshold` consecutive transient failures the circuit
+    opens for `reset_seconds`. Then a single trial call is let through:
+    its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Raises:
+            LLMUnavailableError: the circuit is open
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_seconds - time.monotonic()
+            if remaining <= 0 and not self._trial_running:
+                self._trial_running = True
+                logger.info("LLM circuit half-open, sending a trial call")
+                return
+            raise LLMUnavailableError("LLM circuit open", retry_after=max(remaining, 1.0))
+
+    def record_success(self):
+        """The API answered (even if with a non-retryable error)"""
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("LLM circuit closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def release(self):
+        """The call ended without an answer from the API; allow another trial"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or (self._opened_at is None and self._failures >= self.failure_threshold):
+                logger.warning(f"LLM circuit open after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class LatencyTracker:
+    """Recent successful call latencies per key, for hedging thresholds"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[Hashable, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: Hashable, seconds: float):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key: Hashable, q: float) -> Optional[float]:
+        """q-th percentile latency, None until `min_samples` were recorded"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+
+
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+# Send the duplicate once the first request is slower than this percentile
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+
+policy = RetryPolicy(
+    timeout_seconds=float(os.getenv("LLM_TIMEOUT_SECONDS", "60")),
+    deadline_seconds=float(os.getenv("LLM_DEADLINE_SECONDS", "180")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+    base_seconds=float(os.getenv("LLM_RETRY_BASE_SECONDS", "1")),
+    max_seconds=float(os.getenv("LLM_RETRY_MAX_SECONDS", "20")),
+)
+breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURES", "5")),
+    reset_seconds=float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30")),
+)
+latencies = LatencyTracker(min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")))
@@ -1,13 +1,36 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import List, Optional, Tuple
+import asyncio
+import base64
+import hashlib
+import json
 import logging
 import os
 import re
+import shutil
+import tempfile
 
-from database import get_db, init_db
-from models import Suggestion, SuggestionCreate, SuggestionResponse
+from database import SessionLocal, async_engine, get_async_db, init_db
+from events import broker
+from similarity import index_suggestion
+from jobs import enqueue_job, record_streamed_job
+from rate_limiter import INTERACTIVE
+from models import (
+    BulkDeployRequest,
+    DeployedComponent,
+    Job,
+    JobResponse,
+    Suggestion,
+    SuggestionCode,
+    SuggestionCreate,
+    SuggestionPage,
+    SuggestionResponse,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -31,16 +54,65 @@ def startup_event():
     logger.info("Initializing database...")
     init_db()
     logger.info("Database initialized successfully")
+    broker.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    broker.stop()
+    await async_engine.dispose()
 
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "backend"}
 
+@app.get("/api/llm/cache")
+def llm_cache_stats():
+    """Hit/miss statistics of this process's LLM response cache"""
+    from llm_cache import cache
+    return cache.stats()
+
+def sse(event: str, data: dict) -> str:
+    """Format one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/events")
+async def stream_events(request: Request):
+    """
+    Server-sent event stream of suggestion changes.
+    
+    Events are fanned out from the process-wide LISTEN connection, so the
+    number of connected viewers does not add database load.
+    """
+    queue = broker.subscribe()
+    logger.info(f"Event stream opened ({broker.subscriber_count()} subscribers)")
+    
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=15)
+                    yield f"event: suggestion\ndata: {payload}\n\n"
+                except asyncio.TimeoutError:
+                    # Keep proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+        finally:
+            broker.unsubscribe(queue)
+    
+    return sse_response(event_stream())
+
 @app.post("/api/suggestions", response_model=SuggestionResponse, status_code=201)
-def create_suggestion(
+async def create_suggestion(
     suggestion: SuggestionCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new suggestion"""
     if not suggestion.content or not suggestion.content.strip():
@@ -57,27 +129,157 @@ def create_suggestion(
             status="pending"
         )
         db.add(db_suggestion)
-        db.commit()
-        db.refresh(db_suggestion)
+        await db.flush()
+        # Index in the same transaction so the worker can find near-duplicates
+        await db.run_sync(index_suggestion, db_suggestion)
+        await db.commit()
+        await db.refresh(db_suggestion)
         
         logger.info(f"Created suggestion with ID: {db_suggestion.id}")
         return db_suggestion
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error creating suggestion: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to create suggestion")
 
-@app.get("/api/suggestions", response_model=List[SuggestionResponse])
-def list_suggestions(db: Session = Depends(get_db)):
-    """List all suggestions"""
-    suggestions = db.query(Suggestion).order_by(Suggestion.created_at.desc()).all()
-    logger.info(f"Retrieved {len(suggestions)} suggestions")
-    return suggestions
+# Columns that can be requested through the `fields=` projection
+LIST_FIELDS = (
+    "id", "content", "status", "generated_code", "deployed",
+    "component_name", "created_at", "updated_at", "version",
+)
+# generated_code is a large Text blob, so it is only returned when asked for
+DEFAULT_LIST_FIELDS = tuple(f for f in LIST_FIELDS if f != "generated_code")
+
+
+def encode_cursor(created_at: datetime, suggestion_id: int) -> str:
+    """Encode the (created_at, id) keyset position as an opaque cursor"""
+    raw = f"{created_at.isoformat()}|{suggestion_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, suggestion_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(suggestion_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """Parse a comma separated `fields=` value into a list of column names"""
+    if not fields:
+        requested = list(DEFAULT_LIST_FIELDS)
+    else:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in LIST_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    
+    # id and created_at are always needed to build the next cursor
+    for required in ("created_at", "id"):
+        if required not in requested:
+            requested.insert(0, required)
+    return requested
+
+
+async def change_watermark(db: AsyncSession) -> int:
+    """
+    Oldest transaction id still in progress.
+    
+    Every row written by a transaction below the watermark is already
+    committed and visible, so clients can resume from it with `since=`.
+    Must be read before the rows it covers.
+    """
+    result = await db.execute(text("SELECT txid_snapshot_xmin(txid_current_snapshot())"))
+    return result.scalar()
+
+
+async def collection_etag(db: AsyncSession, request: Request, watermark: int) -> str:
+    """Build an ETag for a suggestion collection without reading row data"""
+    max_version = (await db.execute(select(func.max(Suggestion.version)))).scalar() or 0
+    digest = hashlib.sha1(f"{request.url.path}?{request.url.query}".encode()).hexdigest()[:12]
+    return f'"{max_version}-{watermark}-{digest}"'
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """Check whether the client already holds the current representation"""
+    if_none_match = request.headers.get("if-none-match", "")
+    return etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+@app.get(
+    "/api/suggestions",
+    response_model=SuggestionPage,
+    response_model_exclude_unset=True,
+)
+async def list_suggestions(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    since: Optional[int] = Query(None, ge=0),
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    List suggestions newest first, one keyset page at a time.
+    
+    With `since=<version>` only the rows changed since that watermark are
+    returned (oldest change first, unpaginated). An unchanged collection
+    answers If-None-Match with 304 Not Modified.
+    """
+    if since is not None and cursor:
+        raise HTTPException(status_code=400, detail="since and cursor cannot be combined")
+    
+    columns = parse_fields(fields)
+    
+    watermark = await change_watermark(db)
+    etag = await collection_etag(db, request, watermark)
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    
+    query = select(*[getattr(Suggestion, name) for name in columns])
+    
+    if since is not None:
+        # Rows from transactions at or above the watermark may be sent again
+        # on the next poll; clients upsert by id
+        rows = (await db.execute(
+            query.where(Suggestion.version >= since).order_by(Suggestion.version)
+        )).all()
+        items = [row._asdict() for row in rows]
+        logger.info(f"Retrieved {len(items)} suggestions changed since {since}")
+        return SuggestionPage(items=items, next_cursor=None, version=watermark)
+    
+    if cursor:
+        created_at, suggestion_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(Suggestion.created_at, Suggestion.id) < tuple_(created_at, suggestion_id)
+        )
+    
+    # Fetch one extra row to find out whether there is another page
+    rows = (await db.execute(query.order_by(
+        Suggestion.created_at.desc(),
+        Suggestion.id.desc()
+    ).limit(limit + 1))).all()
+    
+    has_more = len(rows) > limit
+    items = [row._asdict() for row in rows[:limit]]
+    next_cursor = None
+    if has_more:
+        last = items[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    
+    logger.info(f"Retrieved {len(items)} suggestions")
+    return SuggestionPage(items=items, next_cursor=next_cursor, version=watermark)
 
 @app.get("/api/suggestions/{suggestion_id}", response_model=SuggestionResponse)
-def get_suggestion(suggestion_id: int, db: Session = Depends(get_db)):
+async def get_suggestion(suggestion_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific suggestion by ID"""
-    suggestion = db.query(Suggestion).filter(Suggestion.id == suggestion_id).first()
+    suggestion = await db.get(Suggestion, suggestion_id)
     
     if not suggestion:
         logger.warning(f"Suggestion {suggestion_id} not found")
@@ -85,117 +287,432 @@ def get_suggestion(suggestion_id: int, db: Session = Depends(get_db)):
     
     return suggestion
 
-@app.post("/api/suggestions/{suggestion_id}/deploy")
-def deploy_suggestion(suggestion_id: int, db: Session = Depends(get_db)):
-    """Deploy an approved suggestion to the frontend"""
-    suggestion = db.query(Suggestion).filter(Suggestion.id == suggestion_id).first()
+@app.get("/api/suggestions/{suggestion_id}/code", response_model=SuggestionCode)
+async def get_suggestion_code(suggestion_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Get the generated code of a suggestion (loaded lazily by the UI)"""
+    row = (await db.execute(
+        select(Suggestion.id, Suggestion.generated_code).where(Suggestion.id == suggestion_id)
+    )).first()
     
-    if not suggestion:
+    if not row:
         raise HTTPException(status_code=404, detail="Suggestion not found")
     
-    if suggestion.status != "completed":
-        raise HTTPException(status_code=400, detail="Can only deploy completed suggestions")
+    return {"id": row.id, "generated_code": row.generated_code}
+
+# Frontend directory that receives deployed component files
+GENERATED_DIR = os.getenv("GENERATED_DIR", "/app/frontend/src/generated")
+# Arbitrary key for pg_advisory_xact_lock: one index rewrite at a time
+GENERATED_INDEX_LOCK_ID = 734_219_002
+
+def component_source(code: str, component_name: str) -> str:
+    """Ensure the code exports a default component"""
+    if "export default" not in code:
+        # Try to find the component name and add export
+        match = re.search(r'const\s+(\w+)\s*[:=]', code)
+        if match:
+            code += f"\n\nexport default {match.group(1)};"
+        elif re.match(r'\s*(\(|function\b)', code):
+            # A bare arrow function or function expression
+            code = f"const {component_name} = {code.strip().rstrip(';')};\n\nexport default {component_name};"
+    return code
+
+def has_default_export(source: str) -> bool:
+    """
+    Whether the module has a default export the index can re-export:
+    a declaration or expression, or an identifier the module defines.
+    """
+    match = re.search(r'^export\s+default\s+(\w+)\s*;?\s*$', source, re.MULTILINE)
+    if match and match.group(1) not in ("function", "class", "async"):
+        name = re.escape(match.group(1))
+        return bool(re.search(rf'\b(const|let|var|function|class)\s+{name}\b', source))
+    return re.search(r'^export\s+default\b', source, re.MULTILINE) is not None
+
+def generated_index_source(component_names: List[str]) -> str:
+    """
+    The index module re-exporting the deployed components.
+    
+    Component files are read from GENERATED_DIR. Components without a
+    valid default export are left out so one bad file can't break the index.
+    """
+    exported = []
+    for name in component_names:
+        try:
+            with open(os.path.join(GENERATED_DIR, f"{name}.tsx")) as f:
+                source = f.read()
+        except OSError:
+            logger.warning(f"Leaving {name} out of the generated index: file is missing")
+            continue
+        if not has_default_export(source):
+            logger.warning(f"Leaving {name} out of the generated index: no valid default export")
+            continue
+        exported.append(name)
+    
+    lines = ["// Generated by the backend on deploy/undeploy. Do not edit.", ""]
+    lines += [f"export {{ default as {name} }} from './{name}'" for name in exported]
+    lines += ["", f"export const deployedComponents = {json.dumps(exported)}", ""]
+    return "\n".join(lines)
+
+def publish_generated_files(files: dict):
+    """
+    Write {file name: content} into GENERATED_DIR as one batch.
+    
+    Everything is written to a staging directory first and then renamed
+    into place back to back, index.ts last, so the dev watcher sees a
+    single burst of complete files. Unchanged files are not touched.
+    """
+    os.makedirs(GENERATED_DIR, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=GENERATED_DIR, prefix=".staging-")
+    try:
+        staged = []
+        for name in sorted(files, key=lambda name: name == "index.ts"):
+            target = os.path.join(GENERATED_DIR, name)
+            try:
+                with open(target) as f:
+                    if f.read() == files[name]:
+                        continue
+            except OSError:
+                pass
+            with open(os.path.join(staging, name), 'w') as f:
+                f.write(files[name])
+            staged.append(name)
+        for name in staged:
+            os.replace(os.path.join(staging, name), os.path.join(GENERATED_DIR, name))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+def write_generated_index(component_names: List[str]):
+    publish_generated_files({"index.ts": generated_index_source(component_names)})
+
+async def deployed_component_names(db: AsyncSession) -> List[str]:
+    rows = (await db.execute(select(Suggestion.component_name).where(
+        Suggestion.deployed == True,
+        Suggestion.component_name.isnot(None)
+    ).order_by(Suggestion.id))).all()
+    return [row.component_name for row in rows]
+
+async def refresh_generated_index(db: AsyncSession):
+    """
+    Rewrite index.ts from the committed deployed components.
     
+    Runs in its own transaction after the deploy/undeploy commit, under an
+    advisory lock: concurrent batches take turns, and each reads every
+    batch committed before it, so the last rewrite is always complete.
+    """
+    try:
+        await db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": GENERATED_INDEX_LOCK_ID})
+        index_names = await deployed_component_names(db)
+        await asyncio.to_thread(write_generated_index, index_names)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error rewriting the generated index: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Saved, but failed to rewrite the component index: {str(e)}")
+
+def deploy_problem(suggestion: Optional[Suggestion]) -> Optional[Tuple[int, str]]:
+    """Why a suggestion cannot be deployed, as (status code, detail)"""
+    if not suggestion:
+        return 404, "Suggestion not found"
+    if suggestion.status != "completed":
+        return 400, "Can only deploy completed suggestions"
     if not suggestion.generated_code:
-        raise HTTPException(status_code=400, detail="No generated code available")
+        return 400, "No generated code available"
+    return None
+
+def undeploy_problem(suggestion: Optional[Suggestion]) -> Optional[Tuple[int, str]]:
+    """Why a suggestion cannot be undeployed, as (status code, detail)"""
+    if not suggestion:
+        return 404, "Suggestion not found"
+    if not suggestion.deployed:
+        return 400, "Suggestion is not deployed"
+    return None
+
+async def lock_suggestions(db: AsyncSession, ids: List[int], check) -> List[Suggestion]:
+    """
+    Lock the given suggestions for update and validate them with `check`.
+    
+    Raises a single HTTPException: the problem itself for one id, or a
+    400 listing every problem for a batch.
+    """
+    found = {
+        s.id: s for s in (await db.execute(
+            select(Suggestion).where(Suggestion.id.in_(ids))
+            .order_by(Suggestion.id).with_for_update()
+        )).scalars()
+    }
+    problems = []
+    for suggestion_id in ids:
+        problem = check(found.get(suggestion_id))
+        if problem:
+            problems.append((suggestion_id, problem))
+    
+    if len(ids) == 1 and problems:
+        raise HTTPException(status_code=problems[0][1][0], detail=problems[0][1][1])
+    if problems:
+        raise HTTPException(status_code=400, detail=[
+            {"id": suggestion_id, "detail": detail} for suggestion_id, (_, detail) in problems
+        ])
+    return [found[suggestion_id] for suggestion_id in ids]
+
+async def deploy_many(db: AsyncSession, ids: List[int]) -> List[str]:
+    """
+    Deploy suggestions in one transaction.
+    
+    The component files are published as one batch before the commit;
+    nothing imports them until index.ts lists them, which is rewritten
+    once after the commit, so the frontend rebuilds once. File I/O runs
+    in a thread to keep the event loop free.
+    """
+    ids = list(dict.fromkeys(ids))
+    suggestions = await lock_suggestions(db, ids, deploy_problem)
     
     try:
-        # Generate component name from suggestion ID
-        component_name = f"Generated{suggestion_id}"
-        
-        # Path to frontend generated components directory
-        generated_dir = "/app/frontend/src/generated"
-        os.makedirs(generated_dir, exist_ok=True)
-        
-        # Write component file
-        file_path = os.path.join(generated_dir, f"{component_name}.tsx")
-        
-        # Ensure the code exports a default component
-        code = suggestion.generated_code
-        if "export default" not in code:
-            # Try to find the component name and add export
-            match = re.search(r'const\s+(\w+)\s*[:=]', code)
-            if match:
-                comp_name = match.group(1)
-                code += f"\n\nexport default {comp_name};"
-            else:
-                code += f"\n\nexport default {component_name};"
+        sources = {}
+        for suggestion in suggestions:
+            # Generate component name from suggestion ID
+            component_name = f"Generated{suggestion.id}"
+            sources[component_name] = component_source(suggestion.generated_code, component_name)
+            
+            suggestion.deployed = True
+            suggestion.component_name = component_name
         
-        with open(file_path, 'w') as f:
-            f.write(code)
+        await asyncio.to_thread(
+            publish_generated_files, {f"{name}.tsx": source for name, source in sources.items()}
+        )
+        await db.commit()
         
-        # Update database
-        suggestion.deployed = True
-        suggestion.component_name = component_name
-        db.commit()
-        db.refresh(suggestion)
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error deploying suggestions {ids}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to deploy component: {str(e)}")
+    
+    await refresh_generated_index(db)
+    return list(sources)
+
+async def undeploy_many(db: AsyncSession, ids: List[int]):
+    """Undeploy suggestions in one transaction and rewrite the index module once"""
+    ids = list(dict.fromkeys(ids))
+    suggestions = await lock_suggestions(db, ids, undeploy_problem)
+    
+    try:
+        for suggestion in suggestions:
+            suggestion.deployed = False
         
-        logger.info(f"Deployed suggestion {suggestion_id} as {component_name}")
-        return {"message": "Component deployed successfully", "component_name": component_name}
+        await db.commit()
         
     except Exception as e:
-        db.rollback()
-        logger.error(f"Error deploying suggestion {suggestion_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to deploy component: {str(e)}")
+        await db.rollback()
+        logger.error(f"Error undeploying suggestions {ids}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to undeploy component: {str(e)}")
+    
+    await refresh_generated_index(db)
+
+@app.post("/api/suggestions/deploy")
+async def deploy_suggestions(request: BulkDeployRequest, db: AsyncSession = Depends(get_async_db)):
+    """Deploy a batch of approved suggestions at once"""
+    if not request.ids:
+        raise HTTPException(status_code=400, detail="No suggestion ids given")
+    
+    component_names = await deploy_many(db, request.ids)
+    logger.info(f"Deployed {len(component_names)} suggestions")
+    return {"message": f"Deployed {len(component_names)} components", "component_names": component_names}
+
+@app.post("/api/suggestions/undeploy")
+async def undeploy_suggestions(request: BulkDeployRequest, db: AsyncSession = Depends(get_async_db)):
+    """Undeploy a batch of suggestions at once"""
+    if not request.ids:
+        raise HTTPException(status_code=400, detail="No suggestion ids given")
+    
+    await undeploy_many(db, request.ids)
+    logger.info(f"Undeployed {len(request.ids)} suggestions")
+    return {"message": f"Undeployed {len(request.ids)} components"}
+
+@app.post("/api/suggestions/{suggestion_id}/deploy")
+async def deploy_suggestion(suggestion_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Deploy an approved suggestion to the frontend"""
+    component_name = (await deploy_many(db, [suggestion_id]))[0]
+    logger.info(f"Deployed suggestion {suggestion_id} as {component_name}")
+    return {"message": "Component deployed successfully", "component_name": component_name}
 
 @app.post("/api/suggestions/{suggestion_id}/undeploy")
-def undeploy_suggestion(suggestion_id: int, db: Session = Depends(get_db)):
+async def undeploy_suggestion(suggestion_id: int, db: AsyncSession = Depends(get_async_db)):
     """Undeploy a suggestion (mark as not deployed)"""
-    suggestion = db.query(Suggestion).filter(Suggestion.id == suggestion_id).first()
+    await undeploy_many(db, [suggestion_id])
+    logger.info(f"Undeployed suggestion {suggestion_id}")
+    return {"message": "Component undeployed successfully"}
+
+@app.get("/api/suggestions/deployed/list", response_model=List[DeployedComponent])
+async def list_deployed_suggestions(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    List all deployed suggestions.
+    
+    Entries carry a content hash instead of the code; the code is served
+    once per hash from the immutable /components/{code_hash} endpoint.
+    """
+    watermark = await change_watermark(db)
+    # Undeploying bumps the row version too, so the ETag covers all rows
+    etag = await collection_etag(db, request, watermark)
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    
+    deployed = (await db.execute(select(
+        Suggestion.id,
+        Suggestion.content,
+        Suggestion.component_name,
+        Suggestion.code_hash,
+        Suggestion.created_at
+    ).where(Suggestion.deployed == True).order_by(Suggestion.created_at.desc()))).all()
+    logger.info(f"Retrieved {len(deployed)} deployed suggestions")
+    return [row._asdict() for row in deployed]
+
+@app.get("/components/{code_hash}")
+async def get_component_code(code_hash: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Serve component code by its SHA-256.
+    
+    The body for a hash can never change, so browsers and proxies may
+    cache it forever.
+    """
+    if not re.fullmatch(r"[0-9a-f]{64}", code_hash):
+        raise HTTPException(status_code=404, detail="Component not found")
+    
+    row = (await db.execute(
+        select(Suggestion.generated_code).where(Suggestion.code_hash == code_hash).limit(1)
+    )).first()
+    
+    if not row or row.generated_code is None:
+        raise HTTPException(status_code=404, detail="Component not found")
+    
+    return Response(
+        content=row.generated_code,
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "ETag": f'"{code_hash}"',
+        },
+    )
+
+async def enqueue_suggestion_job(db: AsyncSession, suggestion_id: int, kind: str, action: str) -> Job:
+    """Validate the suggestion and enqueue a background job for it"""
+    suggestion = await db.get(Suggestion, suggestion_id)
     
     if not suggestion:
         raise HTTPException(status_code=404, detail="Suggestion not found")
     
-    if not suggestion.deployed:
-        raise HTTPException(status_code=400, detail="Suggestion is not deployed")
+    if suggestion.status != "completed":
+        raise HTTPException(status_code=400, detail=f"Can only {action} completed suggestions")
     
     try:
-        # Update database
-        suggestion.deployed = False
-        db.commit()
-        db.refresh(suggestion)
-        
-        logger.info(f"Undeployed suggestion {suggestion_id}")
-        return {"message": "Component undeployed successfully"}
-        
+        # Someone is waiting on the result: its LLM calls go ahead of background work
+        job = await db.run_sync(enqueue_job, kind, suggestion_id, INTERACTIVE)
+        await db.commit()
+        await db.refresh(job)
+        logger.info(f"Enqueued {kind} job #{job.id} for suggestion {suggestion_id}")
+        return job
     except Exception as e:
-        db.rollback()
-        logger.error(f"Error undeploying suggestion {suggestion_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to undeploy component: {str(e)}")
+        await db.rollback()
+        logger.error(f"Error enqueueing {kind} job for suggestion {suggestion_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to enqueue job")
 
-@app.get("/api/suggestions/deployed/list")
-def list_deployed_suggestions(db: Session = Depends(get_db)):
-    """List all deployed suggestions"""
-    deployed = db.query(Suggestion).filter(Suggestion.deployed == True).order_by(Suggestion.created_at.desc()).all()
-    logger.info(f"Retrieved {len(deployed)} deployed suggestions")
-    return deployed
+@app.post("/api/suggestions/{suggestion_id}/analyze", response_model=JobResponse, status_code=202)
+async def analyze_suggestion(suggestion_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Enqueue analysis of which files need modification for a suggestion"""
+    return await enqueue_suggestion_job(db, suggestion_id, "analyze", "analyze")
 
-@app.post("/api/suggestions/{suggestion_id}/analyze")
-def analyze_suggestion(suggestion_id: int, db: Session = Depends(get_db)):
-    """Analyze which files need modification for a suggestion"""
-    from multi_agent import analyze_files_for_suggestion
+@app.post("/api/suggestions/{suggestion_id}/generate-changes", response_model=JobResponse, status_code=202)
+async def generate_changes(suggestion_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Enqueue multi-file change generation for a suggestion"""
+    return await enqueue_suggestion_job(db, suggestion_id, "generate_changes", "generate changes for")
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Get status and result of a background job"""
+    job = await db.get(Job, job_id)
     
-    suggestion = db.query(Suggestion).filter(Suggestion.id == suggestion_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return job
+
+@app.post("/api/suggestions/{suggestion_id}/code/stream")
+async def stream_suggestion_code(suggestion_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Regenerate the component code of a suggestion, streaming tokens as SSE.
+    
+    Emits `token` events while the model writes, then stores the final
+    code and emits `done` with it. Nothing is stored if the client leaves.
+    The generator is synchronous, so Starlette runs it in the threadpool.
+    
+    Only completed (validated) suggestions can be regenerated, and their
+    status is left alone. This is a POST read with fetch, not an
+    EventSource, which would reconnect and regenerate again after `done`.
+    """
+    from ai_agent import clean_generated_code, stream_component_code
+    
+    suggestion = await db.get(Suggestion, suggestion_id)
     
     if not suggestion:
         raise HTTPException(status_code=404, detail="Suggestion not found")
     
     if suggestion.status != "completed":
-        raise HTTPException(status_code=400, detail="Can only analyze completed suggestions")
+        raise HTTPException(status_code=400, detail="Can only regenerate completed suggestions")
     
-    try:
-        analysis = analyze_files_for_suggestion(suggestion.content)
-        return analysis
-    except Exception as e:
-        logger.error(f"Error analyzing suggestion {suggestion_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    content = suggestion.content
+    
+    def events():
+        parts = []
+        try:
+            # The worker's generation is cached under the same prompt; skip it
+            for token in stream_component_code(content, refresh=True):
+                parts.append(token)
+                yield sse("token", {"text": token})
+        except Exception as e:
+            logger.error(f"Error streaming code for suggestion {suggestion_id}: {str(e)}")
+            yield sse("error", {"detail": f"Generation failed: {str(e)}"})
+            return
+        
+        code = clean_generated_code("".join(parts))
+        # The request session is closed once streaming starts
+        stream_db = SessionLocal()
+        try:
+            stored = stream_db.query(Suggestion).filter(
+                Suggestion.id == suggestion_id
+            ).with_for_update().first()
+            if stored is None or stored.status != "completed":
+                stream_db.rollback()
+                yield sse("error", {"detail": "Suggestion changed while generating, code not stored"})
+                return
+            stored.generated_code = code
+            stream_db.commit()
+            logger.info(f"Stored streamed code for suggestion {suggestion_id}")
+        except Exception as e:
+            stream_db.rollback()
+            logger.error(f"Error storing streamed code for suggestion {suggestion_id}: {str(e)}")
+            yield sse("error", {"detail": "Failed to store generated code"})
+            return
+        finally:
+            stream_db.close()
+        yield sse("done", {"generated_code": code})
+    
+    return sse_response(events())
 
-@app.post("/api/suggestions/{suggestion_id}/generate-changes")
-def generate_changes(suggestion_id: int, db: Session = Depends(get_db)):
-    """Generate multi-file changes for a suggestion"""
-    from multi_agent import analyze_files_for_suggestion, generate_file_modification, review_changes
+@app.post("/api/suggestions/{suggestion_id}/changes/stream")
+async def stream_file_changes(suggestion_id: int, file_path: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Generate the modification of one file, streaming tokens as SSE.
     
-    suggestion = db.query(Suggestion).filter(Suggestion.id == suggestion_id).first()
+    The final content is stored as a completed `generate_file` job whose
+    id is sent with the `done` event. A POST for the same reason as
+    /code/stream: it has side effects.
+    """
+    from multi_agent import read_repo_file, stream_file_modification
+    
+    suggestion = await db.get(Suggestion, suggestion_id)
     
     if not suggestion:
         raise HTTPException(status_code=404, detail="Suggestion not found")
@@ -203,88 +720,152 @@ def generate_changes(suggestion_id: int, db: Session = Depends(get_db)):
     if suggestion.status != "completed":
         raise HTTPException(status_code=400, detail="Can only generate changes for completed suggestions")
     
-    try:
-        # Step 1: Analyze which files to modify
-        analysis = analyze_files_for_suggestion(suggestion.content)
-        files_to_modify = analysis.get("files_to_modify", [])
-        
-        if not files_to_modify:
-            return {"error": "No files identified for modification"}
+    content = suggestion.content
+    
+    def events():
+        parts = []
+        try:
+            for token in stream_file_modification(content, file_path, read_repo_file(file_path)):
+                parts.append(token)
+                yield sse("token", {"text": token})
+        except Exception as e:
+            logger.error(f"Error streaming changes for suggestion {suggestion_id}: {str(e)}")
+            yield sse("error", {"detail": f"Generation failed: {str(e)}"})
+            return
         
-        # Step 2: Generate modifications for each file
-        changes = {}
-        for file_path in files_to_modify[:2]:  # Limit to 2 files for simplicity
-            # Read current file content (if exists)
-            full_path = os.path.join("/Users/bennyjohansson/Documents/Projects/theImprovingWebpage", file_path)
-            current_content = ""
-            if os.path.exists(full_path):
-                with open(full_path, 'r') as f:
-                    current_content = f.read()
-            
-            # Generate modification
-            modified_content = generate_file_modification(
-                suggestion.content,
-                file_path,
-                current_content
+        modified_content = "".join(parts).strip()
+        stream_db = SessionLocal()
+        try:
+            job = record_streamed_job(
+                stream_db, "generate_file", suggestion_id,
+                {"changes": {file_path: modified_content}}
             )
-            changes[file_path] = modified_content
-        
-        # Step 3: Review changes
-        review = review_changes(suggestion.content, changes)
-        
-        return {
-            "analysis": analysis,
-            "changes": changes,
-            "review": review,
-            "suggestion_id": suggestion_id
-        }
-        
-    except Exception as e:
-        logger.error(f"Error generating changes for suggestion {suggestion_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
+            stream_db.commit()
+            job_id = job.id
+        except Exception as e:
+            stream_db.rollback()
+            logger.error(f"Error storing streamed changes for suggestion {suggestion_id}: {str(e)}")
+            yield sse("error", {"detail": "Failed to store generated changes"})
+            return
+        finally:
+            stream_db.close()
+        yield sse("done", {"job_id": job_id, "file_path": file_path})
+    
+    return sse_response(events())
+
+# Cap on the diff embedded in /apply responses (0 = diffstat only); the
+# full diff is paged from /api/suggestions/{id}/diff
+APPLY_DIFF_MAX_BYTES = int(os.getenv("APPLY_DIFF_MAX_BYTES", str(64 * 1024)))
+# Files per page of the streamed diff endpoint
+DIFF_PAGE_FILES = int(os.getenv("DIFF_PAGE_FILES", "20"))
+
+def diffstat_summary(files: List[Tuple[str, int, int]]) -> dict:
+    return {
+        "files": [{"path": path, "added": added, "deleted": deleted} for path, added, deleted in files],
+        "added": sum(added for _, added, _ in files),
+        "deleted": sum(deleted for _, _, deleted in files),
+    }
+
+def commit_to_branch(suggestion_id: int, content: str, changes: dict) -> dict:
+    """
+    Commit the changes on the suggestion branch (blocking git I/O).
+    
+    The commit is built from git objects without a checkout, so applies
+    for different suggestions can run at the same time. The response
+    carries a diffstat and at most APPLY_DIFF_MAX_BYTES of the diff.
+    """
+    from git_manager import GitManager
+    
+    git = GitManager()
+    branch_name = git.branch_name(suggestion_id, content[:30])
+    commit_message = f"AI: {content}\n\nSuggestion #{suggestion_id}"
+    commit_hash, modified_files = git.commit_files(branch_name, changes, commit_message)
+    
+    # Summarize the diff for review
+    diff, truncated = "", False
+    if APPLY_DIFF_MAX_BYTES > 0:
+        diff, truncated = git.read_branch_diff(branch_name, APPLY_DIFF_MAX_BYTES)
+    
+    return {
+        "success": True,
+        "branch": branch_name,
+        "commit": commit_hash[:7],
+        "modified_files": modified_files,
+        "diffstat": diffstat_summary(git.branch_numstat(branch_name)),
+        "diff": diff,
+        "diff_truncated": truncated,
+        "diff_url": f"/api/suggestions/{suggestion_id}/diff",
+    }
 
 @app.post("/api/suggestions/{suggestion_id}/apply")
-def apply_changes(
+async def apply_changes(
     suggestion_id: int,
     changes: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Apply changes and create git branch"""
-    from git_manager import GitManager
-    
-    suggestion = db.query(Suggestion).filter(Suggestion.id == suggestion_id).first()
+    suggestion = await db.get(Suggestion, suggestion_id)
     
     if not suggestion:
         raise HTTPException(status_code=404, detail="Suggestion not found")
     
+    if not changes:
+        raise HTTPException(status_code=400, detail="No changes given")
+    
     try:
-        git = GitManager()
-        
-        # Create branch
-        branch_name = git.create_branch(suggestion_id, suggestion.content[:30])
-        
-        # Apply changes
-        modified_files = git.apply_changes(changes)
-        
-        # Commit
-        commit_message = f"AI: {suggestion.content}\n\nSuggestion #{suggestion_id}"
-        commit_hash = git.commit_changes(commit_message, modified_files)
-        
-        # Get diff for review
-        diff = git.get_diff()
-        
-        logger.info(f"Applied changes for suggestion {suggestion_id}: {branch_name}")
-        
-        return {
-            "success": True,
-            "branch": branch_name,
-            "commit": commit_hash[:7],
-            "modified_files": modified_files,
-            "diff": diff
-        }
+        result = await asyncio.to_thread(commit_to_branch, suggestion_id, suggestion.content, changes)
+        logger.info(f"Applied changes for suggestion {suggestion_id}: {result['branch']}")
+        return result
         
     except Exception as e:
         logger.error(f"Error applying changes for suggestion {suggestion_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to apply changes: {str(e)}")
 
+def suggestion_branch_diff(suggestion_id: int, content: str, offset: int, limit: int):
+    """
+    Page through the files of a suggestion branch (blocking git I/O).
+    
+    Returns:
+        (chunk iterator of the page's diff, total files), or None if no
+        changes were applied for the suggestion
+    """
+    from git_manager import GitManager
+    
+    git = GitManager()
+    branch_name = git.branch_name(suggestion_id, content[:30])
+    if git.resolve(f"refs/heads/{branch_name}") is None:
+        return None
+    files = git.branch_numstat(branch_name)
+    page = [path for path, _, _ in files[offset:offset + limit]]
+    return (git.stream_branch_diff(branch_name, page) if page else iter(())), len(files)
 
+@app.get("/api/suggestions/{suggestion_id}/diff")
+async def stream_suggestion_diff(
+    suggestion_id: int,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(DIFF_PAGE_FILES, ge=1, le=200),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Stream the diff of a suggestion branch, `limit` files at a time.
+    
+    The diff is piped from git in chunks, so memory stays bounded however
+    large the change is. X-Total-Files and X-Next-Offset tell the client
+    how to fetch the next page.
+    """
+    suggestion = await db.get(Suggestion, suggestion_id)
+    
+    if not suggestion:
+        raise HTTPException(status_code=404, detail="Suggestion not found")
+    
+    paged = await asyncio.to_thread(suggestion_branch_diff, suggestion_id, suggestion.content, offset, limit)
+    if paged is None:
+        raise HTTPException(status_code=404, detail="No changes applied for this suggestion")
+    
+    body, total_files = paged
+    headers = {"X-Total-Files": str(total_files), "Cache-Control": "no-cache"}
+    if offset + limit < total_files:
+        headers["X-Next-Offset"] = str(offset + limit)
+    
+    # The chunk generator is synchronous, so Starlette runs it in the threadpool
+    return StreamingResponse(body, media_type="text/x-diff; charset=utf-8", headers=headers)
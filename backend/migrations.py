@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations.
+
+The initial schema comes from Base.metadata.create_all; every change after
+that is a numbered migration below. Applied versions are recorded in
+schema_migrations. Migrations run at startup (init_db) or from the CLI:
+
+    python migrations.py upgrade   - apply pending migrations
+    python migrations.py status    - list applied and pending migrations
+    python migrations.py verify    - check hot queries are planned on indexes
+"""
+import json
+import logging
+import sys
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from database import engine
+from jobs import claim_query
+from models import Job, Suggestion
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_xact_lock: API and workers start together
+MIGRATION_LOCK_ID = 734_219_001
+
+# (version, name, statements). Statements must be safe on a database that
+# create_all has just built with the current models, hence IF NOT EXISTS.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "suggestion change version", [
+        "ALTER TABLE suggestions ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS ix_suggestions_version ON suggestions (version)",
+    ]),
+    (2, "suggestion worker leases", [
+        "ALTER TABLE suggestions ADD COLUMN IF NOT EXISTS lease_owner VARCHAR(100)",
+        "ALTER TABLE suggestions ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE",
+        "ALTER TABLE suggestions ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+    ]),
+    (3, "suggestion minhash signature", [
+        "ALTER TABLE suggestions ADD COLUMN IF NOT EXISTS minhash BIGINT[]",
+    ]),
+    (4, "suggestion code hash", [
+        "ALTER TABLE suggestions ADD COLUMN IF NOT EXISTS code_hash VARCHAR(64)",
+        "CREATE INDEX IF NOT EXISTS ix_suggestions_code_hash ON suggestions (code_hash)",
+        "UPDATE suggestions SET code_hash = encode(sha256(convert_to(generated_code, 'UTF8')), 'hex') "
+        "WHERE code_hash IS NULL AND generated_code IS NOT NULL",
+    ]),
+    (5, "indexes for worker claims, gallery and listing", [
+        # Worker: WHERE status = ... ORDER BY created_at
+        "CREATE INDEX IF NOT EXISTS ix_suggestions_status_created_at ON suggestions (status, created_at)",
+        # Gallery: WHERE deployed ORDER BY created_at DESC
+        "CREATE INDEX IF NOT EXISTS ix_suggestions_deployed_created_at ON suggestions (created_at) WHERE deployed = true",
+        # Listing: keyset pagination on (created_at, id)
+        "CREATE INDEX IF NOT EXISTS ix_suggestions_created_at_id ON suggestions (created_at, id)",
+        # Job claims
+        "CREATE INDEX IF NOT EXISTS ix_jobs_status_created_at ON jobs (status, created_at)",
+    ]),
+    (6, "job priority", [
+        "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS priority VARCHAR(20) NOT NULL DEFAULT 'background'",
+    ]),
+]
+
+# Hot queries and the index each one must be able to use. The claims are
+# the exact statements the workers run (see jobs.claim_query).
+INDEXED_QUERIES = [
+    (
+        "worker claim",
+        claim_query(Suggestion),
+        "ix_suggestions_status_created_at",
+    ),
+    (
+        "gallery",
+        "SELECT id FROM suggestions WHERE deployed = true ORDER BY created_at DESC",
+        "ix_suggestions_deployed_created_at",
+    ),
+    (
+        "listing page",
+        "SELECT id FROM suggestions WHERE (created_at, id) < (now(), 0) ORDER BY created_at DESC, id DESC LIMIT 50",
+        "ix_suggestions_created_at_id",
+    ),
+    (
+        "job claim",
+        claim_query(Job),
+        "ix_jobs_status_created_at",
+    ),
+]
+
+
+def ensure_migrations_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(200) NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        )
+    """))
+
+
+def applied_versions(conn) -> set:
+    return {row.version for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations() -> List[int]:
+    """
+    Apply pending migrations in one transaction.
+
+    Returns:
+        The versions that were applied
+    """
+    applied = []
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        ensure_migrations_table(conn)
+        done = applied_versions(conn)
+
+        for version, name, statements in MIGRATIONS:
+            if version in done:
+                continue
+            logger.info(f"Applying migration {version}: {name}")
+            for statement in statements:
+                conn.execute(text(statement))
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                {"version": version, "name": name}
+            )
+            applied.append(version)
+
+    if applied:
+        logger.info(f"Applied migrations: {applied}")
+    return applied
+
+
+def migration_status() -> List[Tuple[int, str, bool]]:
+    with engine.begin() as conn:
+        ensure_migrations_table(conn)
+        done = applied_versions(conn)
+    return [(version, name, version in done) for version, name, _ in MIGRATIONS]
+
+
+def query_sql(query) -> str:
+    """SQL text of a hot query, given as a string or a SQLAlchemy statement"""
+    if isinstance(query, str):
+        return query
+    return str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def plan_indexes(plan: dict) -> set:
+    """Collect every index name in an EXPLAIN (FORMAT JSON) plan tree"""
+    names = set()
+    if "Index Name" in plan:
+        names.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        names |= plan_indexes(child)
+    return names
+
+
+def verify_indexes() -> List[str]:
+    """
+    EXPLAIN each hot query and check it is planned on its index.
+
+    Sequential scans are disabled for the check: on a small table the
+    planner rightly prefers them, and what matters is that the index can
+    serve the query once the table grows.
+
+    Returns:
+        Failure messages (empty when every query uses its index)
+    """
+    failures = []
+    with engine.begin() as conn:
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        for label, query, index_name in INDEXED_QUERIES:
+            raw = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query_sql(query)}")).scalar()
+            plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+            used = plan_indexes(plan)
+            if index_name not in used:
+                failures.append(f"{label}: expected {index_name}, plan uses {sorted(used) or 'no index'}")
+            else:
+                logger.info(f"{label}: uses {index_name}")
+    return failures
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+
+    if command == "upgrade":
+        # Make sure the base tables exist before migrating them
+        from database import Base
+        Base.metadata.create_all(bind=engine)
+        applied = run_migrations()
+        print(f"Applied {len(applied)} migration(s)")
+    elif command == "status":
+        for version, name, done in migration_status():
+            print(f"{'applied' if done else 'pending':8} {version:3}  {name}")
+    elif command == "verify":
+        failures = verify_indexes()
+        for failure in failures:
+            print(f"FAIL {failure}")
+        if failures:
+            sys.exit(1)
+        print("All hot queries use their indexes")
+    else:
+        print(f"Usage: {sys.argv[0]} [upgrade|status|verify]")
+        sys.exit(1)
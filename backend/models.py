@@ -1,9 +1,11 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Text, DateTime, Boolean, ForeignKey, event, inspect
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.sql import func
 from database import Base
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, List, Optional
 from datetime import datetime
+import hashlib
 
 # SQLAlchemy Model
 class Suggestion(Base):
@@ -17,6 +19,87 @@ class Suggestion(Base):
     component_name = Column(String(100), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Change version: id of the transaction that last wrote the row
+    version = Column(BigInteger, default=0, nullable=False, index=True)
+    # Worker lease: which worker is processing the row and until when
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    # MinHash signature of the content, see similarity.py
+    minhash = Column(ARRAY(BigInteger), nullable=True)
+    # SHA-256 of generated_code; addresses the immutable /components/{hash}
+    code_hash = Column(String(64), nullable=True, index=True)
+
+@event.listens_for(Suggestion, "before_insert")
+@event.listens_for(Suggestion, "before_update")
+def bump_suggestion_version(mapper, connection, target):
+    """
+    Stamp every write with the writing transaction id.
+    
+    Transaction ids only become visible on commit, so readers can use the
+    oldest still-running transaction (the snapshot xmin) as a watermark
+    without missing rows committed out of order by concurrent writers.
+    """
+    target.version = func.txid_current()
+
+def hash_code(code: Optional[str]) -> Optional[str]:
+    return hashlib.sha256(code.encode()).hexdigest() if code is not None else None
+
+@event.listens_for(Suggestion, "before_insert")
+def hash_new_suggestion_code(mapper, connection, target):
+    target.code_hash = hash_code(target.generated_code)
+
+@event.listens_for(Suggestion, "before_update")
+def hash_updated_suggestion_code(mapper, connection, target):
+    """Keep code_hash in step with generated_code"""
+    if inspect(target).attrs.generated_code.history.has_changes():
+        target.code_hash = hash_code(target.generated_code)
+
+class SuggestionBand(Base):
+    """LSH band index used to find near-duplicate suggestions"""
+    __tablename__ = "suggestion_lsh_bands"
+    
+    band_key = Column(BigInteger, primary_key=True)
+    suggestion_id = Column(Integer, ForeignKey("suggestions.id", ondelete="CASCADE"), primary_key=True)
+
+class Job(Base):
+    """Background job (analyze / generate-changes) executed by the worker tier"""
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    suggestion_id = Column(Integer, ForeignKey("suggestions.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String(50), default="pending", nullable=False)
+    result = Column(JSONB, nullable=True)
+    error = Column(Text, nullable=True)
+    # LLM rate limiter priority: "interactive" for jobs a user requested
+    priority = Column(String(20), default="background", nullable=False)
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class LLMCacheEntry(Base):
+    """Persistent tier of the LLM response cache"""
+    __tablename__ = "llm_cache"
+    
+    key = Column(String(64), primary_key=True)
+    model = Column(String(100), nullable=False)
+    response = Column(Text, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_accessed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+class LLMRateLimit(Base):
+    """Token bucket shared by every process calling the LLM API, see rate_limiter.py"""
+    __tablename__ = "llm_rate_limits"
+    
+    name = Column(String(100), primary_key=True)
+    # Remaining budget when the bucket was last updated
+    requests = Column(Float, nullable=False)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
 # Pydantic Models for API
 class SuggestionCreate(BaseModel):
@@ -31,6 +114,56 @@ class SuggestionResponse(BaseModel):
     component_name: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
+    version: int = 0
+    
+    class Config:
+        from_attributes = True
+
+class BulkDeployRequest(BaseModel):
+    ids: List[int]
+
+class DeployedComponent(BaseModel):
+    """Gallery entry; the code itself is fetched from /components/{code_hash}"""
+    id: int
+    content: str
+    component_name: Optional[str] = None
+    code_hash: Optional[str] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class SuggestionSummary(BaseModel):
+    """Projected suggestion row; only the requested fields are serialized"""
+    id: int
+    content: Optional[str] = None
+    status: Optional[str] = None
+    generated_code: Optional[str] = None
+    deployed: Optional[bool] = None
+    component_name: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    version: Optional[int] = None
+
+class SuggestionPage(BaseModel):
+    items: List[SuggestionSummary]
+    next_cursor: Optional[str] = None
+    # Watermark to pass as `since=` on the next poll
+    version: Optional[int] = None
+
+class SuggestionCode(BaseModel):
+    id: int
+    generated_code: Optional[str] = None
+
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    suggestion_id: int
+    status: str
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -1,39 +1,81 @@
 import os
 import logging
-from openai import OpenAI
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List
 import json
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+from llm import complete, stream_complete
+from llm_resilience import LLMUnavailableError
+from rate_limiter import BACKGROUND
+from patching import PatchError, apply_patch_response, build_patch_prompt, validate_patched
+from regions import (
+    build_region_prompt,
+    build_region_selection_prompt,
+    clean_region,
+    parse_region_selection,
+    region_token_budget,
+    split_regions,
+    stitch_regions,
+)
+from repo_index import RepoIndex
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Checkout of the codebase the agents modify
+REPO_PATH = os.getenv("REPO_PATH", "/Users/bennyjohansson/Documents/Projects/theImprovingWebpage")
+# Concurrent file modification calls per suggestion
+MODIFICATION_FANOUT = int(os.getenv("MULTI_AGENT_FANOUT", "4"))
+# Optional cap on files modified per suggestion (0 = no cap)
+MAX_FILES = int(os.getenv("MULTI_AGENT_MAX_FILES", "0"))
+# "full": the model rewrites whole files; "patch": it returns search/replace
+# edit blocks; "regions": large files are rewritten region by region.
+# Patch and region edits fall back to a full rewrite when they fail.
+MODIFICATION_MODE = os.getenv("MODIFICATION_MODE", "full")
+# Smaller files are rewritten whole even in "regions" mode
+REGION_MIN_LINES = int(os.getenv("REGION_MIN_LINES", "150"))
+# Candidate files (with snippets) shown to the analyzer
+MAX_CANDIDATES = int(os.getenv("MULTI_AGENT_MAX_CANDIDATES", "8"))
+
+# Index of REPO_PATH; also caches file contents for the modification agents
+repo_index = RepoIndex(
+    REPO_PATH,
+    index_path=os.getenv("REPO_INDEX_PATH") or None,
+    refresh_seconds=float(os.getenv("REPO_INDEX_REFRESH_SECONDS", "5")),
+)
 
 
-def analyze_files_for_suggestion(suggestion: str) -> Dict:
+def analyze_files_for_suggestion(suggestion: str, priority: str = BACKGROUND) -> Dict:
     """
     Analyze which files need to be modified for a suggestion.
     
     Returns dict with:
     - files_to_modify: list of file paths
     - reasoning: why these files
+    
+    Raises:
+        LLMUnavailableError: the API is unavailable; retry the job later
     """
+    # Files matching the suggestion are described with snippets; the
+    # outline of top-level files is always included, since matches on
+    # names alone miss files like App.tsx or index.css
+    context = f"Repository files:\n{repo_index.outline()}"
+    candidates = repo_index.describe(suggestion, MAX_CANDIDATES)
+    if candidates:
+        context += f"\n\nCandidate files, most relevant first:\n{candidates}"
+    
     prompt = f"""You are analyzing a codebase for a self-improving web application.
 
 User Suggestion: "{suggestion}"
 
-Current codebase structure:
-- frontend/src/App.tsx - Main React app component
-- frontend/src/components/ - React components
-- frontend/src/types.ts - TypeScript type definitions
-- backend/main.py - FastAPI backend with endpoints
-- backend/models.py - Database models
+{context}
 
 Analyze which files need modification to implement this suggestion.
+Prefer the files listed above; name a new path only if a new file is needed.
 
 Respond ONLY with JSON in this exact format:
 {{
@@ -43,14 +85,7 @@ Respond ONLY with JSON in this exact format:
 }}"""
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=300,
-            temperature=0.3
-        )
-        
-        result_text = response.choices[0].message.content.strip()
+        result_text = complete(prompt, max_tokens=300, temperature=0.3, priority=priority).strip()
         logger.info(f"File analysis: {result_text}")
         
         # Strip markdown code blocks if present
@@ -66,6 +101,8 @@ Respond ONLY with JSON in this exact format:
         result = json.loads(result_text)
         return result
         
+    except LLMUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error analyzing files: {str(e)}")
         return {
@@ -75,13 +112,9 @@ Respond ONLY with JSON in this exact format:
         }
 
 
-def generate_file_modification(suggestion: str, file_path: str, current_content: str) -> str:
-    """
-    Generate modifications for a specific file.
-    
-    Returns the complete modified file content.
-    """
-    prompt = f"""You are modifying code files for a self-improving web application.
+def build_modification_prompt(suggestion: str, file_path: str, current_content: str) -> str:
+    """Prompt asking for the complete modified content of one file"""
+    return f"""You are modifying code files for a self-improving web application.
 
 User Suggestion: "{suggestion}"
 
@@ -103,25 +136,109 @@ Rules:
 
 Return ONLY the complete modified file content, no explanations, no markdown fences."""
 
+
+def generate_file_patch(suggestion: str, file_path: str, current_content: str, priority: str = BACKGROUND) -> str:
+    """
+    Modify a file through search/replace edit blocks applied locally.
+    
+    Raises PatchError when the blocks do not apply or break the file.
+    """
+    prompt = build_patch_prompt(suggestion, file_path, current_content)
+    response = complete(prompt, max_tokens=2000, temperature=0.3, priority=priority)
+    modified_content = apply_patch_response(file_path, current_content, response)
+    logger.info(
+        f"Patched {file_path}: {len(response)} chars of edits for {len(modified_content)} chars of file"
+    )
+    return modified_content
+
+
+def generate_file_by_regions(suggestion: str, file_path: str, current_content: str, priority: str = BACKGROUND) -> str:
+    """
+    Rewrite only the top-level regions a suggestion touches, concurrently.
+    
+    One call picks the regions, then each picked region gets its own call
+    with a token budget sized to the region, so nothing is truncated and
+    latency follows the largest changed region rather than the file.
+    
+    Raises PatchError when the file has no regions to work with or the
+    stitched file is broken.
+    """
+    regions = split_regions(file_path, current_content)
+    if len(regions) < 2:
+        raise PatchError("File has no top-level regions")
+    
+    selection = complete(
+        build_region_selection_prompt(suggestion, file_path, regions), max_tokens=100, temperature=0.3,
+        priority=priority
+    )
+    indexes = parse_region_selection(selection, len(regions))
+    logger.info(f"Rewriting {len(indexes)} of {len(regions)} regions in {file_path}: {indexes}")
+    
+    def rewrite(index: int) -> str:
+        prompt = build_region_prompt(suggestion, file_path, regions, index)
+        return clean_region(complete(
+            prompt, max_tokens=region_token_budget(regions[index]), temperature=0.7, priority=priority
+        ))
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(MODIFICATION_FANOUT, len(indexes)))) as pool:
+        replacements = dict(zip(indexes, pool.map(rewrite, indexes)))
+    
+    modified_content = stitch_regions(regions, replacements)
+    validate_patched(file_path, current_content, modified_content)
+    return modified_content
+
+
+def generate_file_modification(suggestion: str, file_path: str, current_content: str, priority: str = BACKGROUND) -> str:
+    """
+    Generate modifications for a specific file.
+    
+    Returns the complete modified file content.
+    """
+    edit = None
+    if MODIFICATION_MODE == "regions" and current_content.count("\n") >= REGION_MIN_LINES:
+        edit, description = generate_file_by_regions, "region edit"
+    # New files have nothing to patch against
+    elif MODIFICATION_MODE == "patch" and current_content.strip():
+        edit, description = generate_file_patch, "patch"
+    
+    if edit:
+        try:
+            return edit(suggestion, file_path, current_content, priority)
+        except PatchError as e:
+            logger.warning(f"{description.capitalize()} of {file_path} failed ({e}), regenerating the full file")
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            logger.error(f"Error generating {description} for {file_path}: {str(e)}")
+    
+    prompt = build_modification_prompt(suggestion, file_path, current_content)
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=2000,
-            temperature=0.7
-        )
-        
-        modified_content = response.choices[0].message.content.strip()
+        modified_content = complete(prompt, max_tokens=2000, temperature=0.7, priority=priority).strip()
         logger.info(f"Generated modification for {file_path}: {len(modified_content)} chars")
         
         return modified_content
         
+    except LLMUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error generating modification for {file_path}: {str(e)}")
         return current_content  # Return original if error
 
 
-def review_changes(suggestion: str, changes: Dict[str, str]) -> Dict:
+def stream_file_modification(suggestion: str, file_path: str, current_content: str) -> Iterator[str]:
+    """Stream the modified file content as the model emits it"""
+    logger.info(f"Streaming modification for {file_path}")
+    prompt = build_modification_prompt(suggestion, file_path, current_content)
+    yield from stream_complete(prompt, max_tokens=2000, temperature=0.7)
+
+
+def read_repo_file(file_path: str) -> str:
+    """Current content of a file in REPO_PATH, empty if it does not exist"""
+    return repo_index.read(file_path)
+
+
+def review_changes(suggestion: str, changes: Dict[str, str], priority: str = BACKGROUND) -> Dict:
     """
     Review the proposed changes before applying them.
     
@@ -161,14 +278,7 @@ Respond ONLY with JSON:
 }}"""
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=500,
-            temperature=0.3
-        )
-        
-        review_text = response.choices[0].message.content.strip()
+        review_text = complete(prompt, max_tokens=500, temperature=0.3, priority=priority).strip()
         logger.info(f"Review result: {review_text}")
         
         # Strip markdown code blocks if present
@@ -183,6 +293,8 @@ Respond ONLY with JSON:
         review = json.loads(review_text)
         return review
         
+    except LLMUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error reviewing changes: {str(e)}")
         return {
@@ -193,6 +305,45 @@ Respond ONLY with JSON:
         }
 
 
+def generate_changes(suggestion: str, priority: str = BACKGROUND) -> Dict:
+    """
+    Run the full multi-agent pipeline: analyze, modify each file, review.
+    
+    Returns dict with analysis, changes (file path -> new content) and
+    review, or with an error when no files were identified.
+    
+    Raises:
+        LLMUnavailableError: the API is unavailable; retry the job later
+    """
+    # Step 1: Analyze which files to modify
+    analysis = analyze_files_for_suggestion(suggestion, priority)
+    files_to_modify = analysis.get("files_to_modify", [])
+    
+    if not files_to_modify:
+        return {"error": "No files identified for modification"}
+    
+    if MAX_FILES:
+        files_to_modify = files_to_modify[:MAX_FILES]
+    
+    def modify(file_path: str) -> str:
+        return generate_file_modification(suggestion, file_path, read_repo_file(file_path), priority)
+    
+    # Step 2: Generate modifications for all files concurrently, so an
+    # N-file change takes about as long as the slowest file
+    with ThreadPoolExecutor(max_workers=max(1, min(MODIFICATION_FANOUT, len(files_to_modify)))) as pool:
+        modified = list(pool.map(modify, files_to_modify))
+    changes = dict(zip(files_to_modify, modified))
+    
+    # Step 3: Review changes once every file is in
+    review = review_changes(suggestion, changes, priority)
+    
+    return {
+        "analysis": analysis,
+        "changes": changes,
+        "review": review
+    }
+
+
 if __name__ == "__main__":
     # Test the multi-agent system
     test_suggestion = "Add a dark mode toggle button"
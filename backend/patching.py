@@ -0,0 +1,205 @@
+"""
+Search/replace edit blocks for patch-based file modification.
+
+Instead of reproducing a whole file, the model answers with blocks like
+
+    <<<<<<< SEARCH
+    exact lines from the current file
+    =======
+    replacement lines
+    >>>>>>> REPLACE
+
+which are applied locally. Anything that does not apply cleanly raises
+PatchError so the caller can fall back to full-file generation.
+"""
+import ast
+import json
+import os
+import re
+from typing import List, Optional, Tuple
+
+SEARCH_MARKER = "<<<<<<< SEARCH"
+DIVIDER = "======="
+REPLACE_MARKER = ">>>>>>> REPLACE"
+
+EditBlock = Tuple[str, str]
+
+
+class PatchError(Exception):
+    """Edit blocks could not be parsed, applied or validated"""
+
+
+def build_patch_prompt(suggestion: str, file_path: str, current_content: str) -> str:
+    """Prompt asking for search/replace edit blocks instead of the whole file"""
+    return f"""You are modifying code files for a self-improving web application.
+
+User Suggestion: "{suggestion}"
+
+File to modify: {file_path}
+
+Current file content:
+```
+{current_content}
+```
+
+Describe the change as one or more search/replace edit blocks:
+
+{SEARCH_MARKER}
+lines copied exactly from the current file
+{DIVIDER}
+the lines that replace them
+{REPLACE_MARKER}
+
+Rules:
+- SEARCH text must match the current file exactly, including indentation
+- Include just enough lines to make each SEARCH text unique in the file
+- Blocks are applied in order; do not overlap them
+- To add code, search for the neighbouring lines and repeat them in the replacement
+- Preserve existing code that doesn't need changes
+- Add necessary imports with their own edit block
+- Maintain code style
+
+Return ONLY the edit blocks, no explanations, no markdown fences."""
+
+
+def parse_edit_blocks(text: str) -> List[EditBlock]:
+    """
+    Parse the model output into (search, replace) pairs.
+
+    Raises:
+        PatchError: no blocks, or a block is not terminated (e.g. the
+            output was cut off at max_tokens)
+    """
+    blocks = []
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        if lines[i].strip() != SEARCH_MARKER:
+            i += 1
+            continue
+        search, replace = [], []
+        i += 1
+        while i < len(lines) and lines[i].strip() != DIVIDER:
+            search.append(lines[i])
+            i += 1
+        i += 1
+        while i < len(lines) and lines[i].strip() != REPLACE_MARKER:
+            replace.append(lines[i])
+            i += 1
+        if i >= len(lines):
+            raise PatchError("Unterminated edit block")
+        blocks.append(("\n".join(search), "\n".join(replace)))
+        i += 1
+
+    if not blocks:
+        raise PatchError("No edit blocks in response")
+    return blocks
+
+
+def _find_loose(content: str, search: str) -> Optional[Tuple[int, int]]:
+    """
+    Locate `search` ignoring trailing whitespace on each line.
+
+    Returns:
+        (start, end) character offsets of the unique match, or None
+    """
+    content_lines = content.splitlines(keepends=True)
+    search_lines = [line.rstrip() for line in search.splitlines()]
+    if not search_lines:
+        return None
+    matches = []
+    for start in range(len(content_lines) - len(search_lines) + 1):
+        window = content_lines[start:start + len(search_lines)]
+        if [line.rstrip() for line in window] == search_lines:
+            matches.append(start)
+    if len(matches) != 1:
+        return None
+    offset = sum(len(line) for line in content_lines[:matches[0]])
+    length = sum(len(line) for line in content_lines[matches[0]:matches[0] + len(search_lines)])
+    # Keep the newline that ends the matched region
+    if content_lines[matches[0] + len(search_lines) - 1].endswith("\n"):
+        length -= 1
+    return offset, offset + length
+
+
+def apply_edit_blocks(content: str, blocks: List[EditBlock]) -> str:
+    """
+    Apply edit blocks in order.
+
+    Each SEARCH text must occur exactly once; an exact match is tried
+    first, then one that ignores trailing whitespace.
+
+    Raises:
+        PatchError: a SEARCH text is missing or ambiguous
+    """
+    for number, (search, replace) in enumerate(blocks, start=1):
+        if not search.strip():
+            if content.strip():
+                raise PatchError(f"Edit block {number} has an empty SEARCH on a non-empty file")
+            content = replace + "\n"
+            continue
+
+        count = content.count(search)
+        if count == 1:
+            content = content.replace(search, replace, 1)
+            continue
+        if count > 1:
+            raise PatchError(f"Edit block {number} matches {count} places")
+
+        span = _find_loose(content, search)
+        if span is None:
+            raise PatchError(f"Edit block {number} does not match the file")
+        content = content[:span[0]] + replace + content[span[1]:]
+    return content
+
+
+_JS_TOKENS = re.compile(r"//[^\n]*|/\*.*?\*/|'(?:\\.|[^'\\\n])*'|\"(?:\\.|[^\"\\\n])*\"|`(?:\\.|[^`\\])*`", re.DOTALL)
+_PAIRS = {")": "(", "]": "[", "}": "{"}
+
+
+def brackets_balanced(code: str) -> bool:
+    """Whether (), [] and {} nest properly outside strings and comments"""
+    stack = []
+    for char in _JS_TOKENS.sub("", code):
+        if char in "([{":
+            stack.append(char)
+        elif char in _PAIRS:
+            if not stack or stack.pop() != _PAIRS[char]:
+                return False
+    return not stack
+
+
+def validate_patched(file_path: str, original: str, patched: str):
+    """
+    Cheap local checks on a patched file.
+
+    Syntax is checked where the standard library can (Python, JSON).
+    Other sources must keep their brackets balanced, unless the original
+    file was already unbalanced to our scanner.
+
+    Raises:
+        PatchError: the patched file is broken or unchanged
+    """
+    if patched == original:
+        raise PatchError("Edit blocks did not change the file")
+
+    ext = os.path.splitext(file_path)[1]
+    if ext == ".py":
+        try:
+            ast.parse(patched)
+        except SyntaxError as e:
+            raise PatchError(f"Patched file does not parse: {e}")
+    elif ext == ".json":
+        try:
+            json.loads(patched)
+        except ValueError as e:
+            raise PatchError(f"Patched file is not valid JSON: {e}")
+    elif brackets_balanced(original) and not brackets_balanced(patched):
+        raise PatchError("Patched file has unbalanced brackets")
+
+
+def apply_patch_response(file_path: str, original: str, response: str) -> str:
+    """Parse, apply and validate a model response; raises PatchError"""
+    patched = apply_edit_blocks(original, parse_edit_blocks(response))
+    validate_patched(file_path, original, patched)
+    return patched
@@ -0,0 +1,261 @@
+"""
+Shared rate limiting and prioritization of LLM calls.
+
+A token bucket budgets requests and tokens per minute for every process
+that calls the API (API server and workers). Its state lives in Postgres
+(one row of llm_rate_limits, updated under a row lock) or, for single
+process setups, in memory.
+
+On top of the bucket, callers are ordered by priority:
+
+- within a process, waiting calls form a priority queue and only the
+  head of the queue draws from the bucket;
+- across processes, background calls leave a reserve of the bucket
+  untouched, so interactive calls get through while workers are busy.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import text
+
+from database import SessionLocal
+from llm_resilience import LLMUnavailableError
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = {INTERACTIVE: 0, BACKGROUND: 1}
+
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    """
+    Tokens a request counts against the quota.
+
+    The API reserves max_tokens up front, so that is what is budgeted,
+    plus roughly four characters per prompt token.
+    """
+    return len(prompt) // 4 + max_tokens
+
+
+def refill(level: float, capacity: float, per_minute: float, elapsed: float) -> float:
+    return min(capacity, level + max(0.0, elapsed) * per_minute / 60.0)
+
+
+def seconds_until(level: float, needed: float, per_minute: float) -> float:
+    return max(0.0, (needed - level) * 60.0 / per_minute)
+
+
+class LocalBucket:
+    """In-process token bucket: a stand-in when Postgres is not shared"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = requests_per_minute
+        self._tokens = tokens_per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: int, reserve: float) -> float:
+        """
+        Take one request and `tokens` tokens if the bucket holds them plus
+        `reserve` (a fraction of capacity).
+
+        Returns:
+            0.0 when granted, otherwise the seconds until it could be
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait, self._requests, self._tokens = self.take(
+                self._requests, self._tokens, now - self._updated, tokens, reserve
+            )
+            self._updated = now
+            return wait
+
+    def take(self, requests: float, tokens_left: float, elapsed: float, tokens: int, reserve: float) -> tuple:
+        """
+        Refill a bucket state by `elapsed` seconds and try to take a call from it.
+
+        Returns:
+            (seconds to wait, 0.0 if granted; new requests level; new tokens level)
+        """
+        requests = refill(requests, self.requests_per_minute, self.requests_per_minute, elapsed)
+        tokens_left = refill(tokens_left, self.tokens_per_minute, self.tokens_per_minute, elapsed)
+        # A call bigger than the whole bucket would otherwise wait forever
+        need_requests = min(self.requests_per_minute, 1 + reserve * self.requests_per_minute)
+        need_tokens = min(self.tokens_per_minute, tokens + reserve * self.tokens_per_minute)
+        if requests >= need_requests and tokens_left >= need_tokens:
+            return 0.0, requests - 1, tokens_left - min(tokens, self.tokens_per_minute)
+        wait = max(
+            seconds_until(requests, need_requests, self.requests_per_minute),
+            seconds_until(tokens_left, need_tokens, self.tokens_per_minute),
+        )
+        return wait, requests, tokens_left
+
+
+class PostgresBucket(LocalBucket):
+    """
+    Token bucket stored in one llm_rate_limits row.
+
+    Each attempt locks the row, refills it by the time elapsed since its
+    last update (database clock), and deducts the request if it fits.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float):
+        super().__init__(requests_per_minute, tokens_per_minute)
+        self.name = name
+
+    def try_acquire(self, tokens: int, reserve: float) -> float:
+        db = SessionLocal()
+        try:
+            db.execute(
+                text("""
+                    INSERT INTO llm_rate_limits (name, requests, tokens, updated_at)
+                    VALUES (:name, :requests, :tokens, now())
+                    ON CONFLICT (name) DO NOTHING
+                """),
+                {"name": self.name, "requests": self.requests_per_minute, "tokens": self.tokens_per_minute}
+            )
+            row = db.execute(
+                text("""
+                    SELECT requests, tokens, extract(epoch FROM now() - updated_at) AS elapsed
+                    FROM llm_rate_limits WHERE name = :name FOR UPDATE
+                """),
+                {"name": self.name}
+            ).one()
+            wait, requests, tokens_left = self.take(row.requests, row.tokens, float(row.elapsed), tokens, reserve)
+            if wait == 0.0:
+                db.execute(
+                    text("""
+                        UPDATE llm_rate_limits SET requests = :requests, tokens = :tokens, updated_at = now()
+                        WHERE name = :name
+                    """),
+                    {"name": self.name, "requests": requests, "tokens": tokens_left}
+                )
+            db.commit()
+            return wait
+        except Exception as e:
+            # Never block LLM calls on a limiter failure; the upstream 429s remain
+            db.rollback()
+            logger.warning(f"Rate limiter unavailable, not throttling: {str(e)}")
+            return 0.0
+        finally:
+            db.close()
+
+
+class RateLimiter:
+    """
+    Priority queue in front of a token bucket.
+
+    Only the highest-priority, longest-waiting call of this process draws
+    from the bucket; the others wait their turn. Background calls
+    additionally keep `reserve` of the bucket free for interactive ones.
+    """
+
+    def __init__(self, bucket: LocalBucket, reserve: float = 0.2, poll_seconds: float = 0.25):
+        self.bucket = bucket
+        self.reserve = reserve
+        self.poll_seconds = poll_seconds
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _enqueue(self, priority: str) -> tuple:
+        ticket = (PRIORITIES[priority], next(self._seq))
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            self._cond.notify_all()
+        return ticket
+
+    def _dequeue(self, ticket: tuple):
+        with self._cond:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._cond.notify_all()
+
+    def _is_head(self, ticket: tuple) -> bool:
+        with self._cond:
+            return self._queue[0] == ticket
+
+    def _try(self, tokens: int, priority: str) -> float:
+        return self.bucket.try_acquire(tokens, 0.0 if priority == INTERACTIVE else self.reserve)
+
+    @staticmethod
+    def _check_deadline(wait: float, deadline_at: Optional[float]):
+        """Give up when the call could not be made before its deadline (time.monotonic)"""
+        if deadline_at is not None and time.monotonic() + wait > deadline_at:
+            raise LLMUnavailableError("Rate limited past the LLM call deadline", retry_after=wait)
+
+    def acquire(self, tokens: int, priority: str = BACKGROUND, deadline_at: Optional[float] = None) -> float:
+        """
+        Block until the call may be made.
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            LLMUnavailableError: the bucket would not allow the call before `deadline_at`
+        """
+        started = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                if self._is_head(ticket):
+                    wait = self._try(tokens, priority)
+                    self._check_deadline(wait, deadline_at)
+                else:
+                    wait = self.poll_seconds
+                    self._check_deadline(0.0, deadline_at)
+                if wait == 0.0:
+                    break
+                # Wakes early when the queue changes, e.g. a more urgent call arrives
+                with self._cond:
+                    self._cond.wait(timeout=min(wait, self.poll_seconds))
+        finally:
+            self._dequeue(ticket)
+        waited = time.monotonic() - started
+        if waited > 1:
+            logger.info(f"Rate limited {priority} LLM call for {waited:.1f}s")
+        return waited
+
+    async def acquire_async(self, tokens: int, priority: str = BACKGROUND, deadline_at: Optional[float] = None) -> float:
+        """Async variant of acquire; bucket I/O runs in a thread"""
+        started = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                if self._is_head(ticket):
+                    wait = await asyncio.to_thread(self._try, tokens, priority)
+                    self._check_deadline(wait, deadline_at)
+                else:
+                    wait = self.poll_seconds
+                    self._check_deadline(0.0, deadline_at)
+                if wait == 0.0:
+                    break
+                await asyncio.sleep(min(wait, self.poll_seconds))
+        finally:
+            self._dequeue(ticket)
+        waited = time.monotonic() - started
+        if waited > 1:
+            logger.info(f"Rate limited {priority} LLM call for {waited:.1f}s")
+        return waited
+
+
+RATE_LIMIT_ENABLED = os.getenv("LLM_RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+_requests_per_minute = float(os.getenv("LLM_RATE_LIMIT_RPM", "500"))
+_tokens_per_minute = float(os.getenv("LLM_RATE_LIMIT_TPM", "30000"))
+
+if os.getenv("LLM_RATE_LIMIT_BACKEND", "postgres") == "local":
+    _bucket = LocalBucket(_requests_per_minute, _tokens_per_minute)
+else:
+    _bucket = PostgresBucket(os.getenv("LLM_RATE_LIMIT_NAME", "openai"), _requests_per_minute, _tokens_per_minute)
+
+limiter = RateLimiter(_bucket, reserve=float(os.getenv("LLM_RATE_LIMIT_RESERVE", "0.2")))
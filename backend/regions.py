@@ -0,0 +1,195 @@
+"""
+Region-level editing for large files.
+
+A file is split into top-level regions (functions, classes, components,
+the import block). The model first picks the regions a suggestion needs,
+then each picked region is rewritten by its own call, and the file is
+stitched back together. Output per call is bounded by the region size
+rather than the file size.
+"""
+import ast
+import json
+import os
+import re
+from typing import Dict, List
+
+from patching import PatchError
+
+_JS_DECLARATION = re.compile(
+    r"^(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:function\*?|const|let|var|class|interface|type|enum)\s+(\w+)"
+)
+_JS_IMPORT = re.compile(r"^import\b")
+_COMMENT_PREFIXES = ("//", "/*", "*", "@")
+
+
+def _make_regions(lines: List[str], starts: List[int], names: List[str]) -> List[Dict]:
+    """Cut lines at the given start indexes; the first region also takes the file header"""
+    starts = [0] + starts[1:] if starts else [0]
+    regions = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(lines)
+        regions.append({
+            "name": names[i] if names else "file",
+            "start": start + 1,
+            "end": end,
+            "text": "".join(lines[start:end]),
+        })
+    return regions
+
+
+def _python_regions(content: str) -> List[Dict]:
+    lines = content.splitlines(keepends=True)
+    try:
+        tree = ast.parse(content)
+    except SyntaxError:
+        return _make_regions(lines, [], [])
+
+    starts, names = [], []
+    previous_end = 0
+    for node in tree.body:
+        is_definition = isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+        name = node.name if is_definition else "module code"
+        # Consecutive module-level statements form one region
+        if not is_definition and names and names[-1] == "module code":
+            previous_end = node.end_lineno
+            continue
+        # Comments and blank lines before a node belong to it
+        starts.append(previous_end)
+        names.append(name)
+        previous_end = node.end_lineno
+    return _make_regions(lines, starts, names)
+
+
+def _js_regions(content: str) -> List[Dict]:
+    lines = content.splitlines(keepends=True)
+    starts, names = [], []
+    for i, line in enumerate(lines):
+        if _JS_IMPORT.match(line):
+            name = "imports"
+        else:
+            match = _JS_DECLARATION.match(line)
+            if not match:
+                continue
+            name = match.group(1)
+        if name == "imports" and names and names[-1] == "imports":
+            continue
+        start = i
+        floor = starts[-1] + 1 if starts else 0
+        while start > floor and lines[start - 1].strip().startswith(_COMMENT_PREFIXES):
+            start -= 1
+        starts.append(start)
+        names.append(name)
+    return _make_regions(lines, starts, names)
+
+
+def split_regions(file_path: str, content: str) -> List[Dict]:
+    """
+    Split a file into top-level regions that concatenate back to it.
+
+    Returns:
+        Dicts with name, start and end (1-based lines) and text. Files in
+        other languages come back as a single region.
+    """
+    ext = os.path.splitext(file_path)[1]
+    if ext == ".py":
+        return _python_regions(content)
+    if ext in (".ts", ".tsx", ".js", ".jsx"):
+        return _js_regions(content)
+    return _make_regions(content.splitlines(keepends=True), [], [])
+
+
+def outline(regions: List[Dict]) -> str:
+    """One line per region: index, name, line range and first code line"""
+    entries = []
+    for index, region in enumerate(regions):
+        first_line = next(
+            (line.strip() for line in region["text"].splitlines()
+             if line.strip() and not line.strip().startswith(_COMMENT_PREFIXES + ("#",))),
+            ""
+        )
+        entries.append(
+            f"[{index}] {region['name']} (lines {region['start']}-{region['end']}): {first_line[:100]}"
+        )
+    return "\n".join(entries)
+
+
+def build_region_selection_prompt(suggestion: str, file_path: str, regions: List[Dict]) -> str:
+    """Prompt asking which regions of a file a suggestion needs to change"""
+    return f"""You are planning changes to a code file for a self-improving web application.
+
+User Suggestion: "{suggestion}"
+
+File: {file_path}
+
+The file consists of these top-level regions:
+{outline(regions)}
+
+Which regions must change to implement the suggestion? New top-level code
+is added by changing the region it should follow. Imports live in the
+first region.
+
+Respond ONLY with JSON: {{"regions": [0, 3]}}"""
+
+
+def parse_region_selection(text: str, count: int) -> List[int]:
+    """Region indexes picked by the model; raises PatchError if unusable"""
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    try:
+        picked = json.loads(match.group(0))["regions"] if match else None
+        indexes = sorted({int(index) for index in picked})
+    except (ValueError, TypeError, KeyError):
+        raise PatchError("Unreadable region selection")
+    if not indexes or any(index < 0 or index >= count for index in indexes):
+        raise PatchError(f"Invalid region selection: {picked}")
+    return indexes
+
+
+def build_region_prompt(suggestion: str, file_path: str, regions: List[Dict], index: int) -> str:
+    """Prompt asking for the rewritten text of one region"""
+    region = regions[index]
+    return f"""You are modifying one part of a code file for a self-improving web application.
+
+User Suggestion: "{suggestion}"
+
+File: {file_path}
+
+Outline of the whole file:
+{outline(regions)}
+
+Region [{index}] {region['name']} (lines {region['start']}-{region['end']}):
+```
+{region['text']}
+```
+
+Rewrite ONLY this region so the file implements the suggestion. Other
+regions are being updated separately; do not repeat them. Keep code in
+this region that doesn't need changes, and maintain the code style.
+
+Return ONLY the complete new text of this region, no explanations, no markdown fences."""
+
+
+def region_token_budget(region: Dict) -> int:
+    """max_tokens for rewriting a region: room for its size plus additions"""
+    return min(4096, max(1000, len(region["text"]) // 3 + 500))
+
+
+def clean_region(text: str) -> str:
+    """Strip markdown fences the model may add anyway"""
+    fenced = re.fullmatch(r"```[\w+-]*\n(.*?)\n?```", text.strip(), re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    return text.strip("\n")
+
+
+def stitch_regions(regions: List[Dict], replacements: Dict[int, str]) -> str:
+    """Reassemble a file, keeping the original blank lines around replaced regions"""
+    parts = []
+    for index, region in enumerate(regions):
+        text = region["text"]
+        if index in replacements:
+            body = text.strip("\n")
+            leading = text[:text.index(body)] if body else ""
+            trailing = text[len(leading) + len(body):] or "\n"
+            text = leading + replacements[index].strip("\n") + trailing
+        parts.append(text)
+    return "".join(parts)
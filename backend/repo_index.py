@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+On-disk index of the repository the agents modify.
+
+For every source file the index records its size, mtime, content hash, a
+one-line summary and the symbols it defines or exports. It is refreshed
+incrementally: only files whose mtime or size changed are read again.
+File contents are cached in memory, so the agents do not reread a file
+on every request.
+
+    python repo_index.py <repo>               - refresh and print index stats
+    python repo_index.py <repo> "dark mode"   - show the candidates for a query
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT = 2
+
+SOURCE_EXTENSIONS = (".py", ".ts", ".tsx", ".js", ".jsx", ".css", ".html", ".sql", ".sh", ".conf")
+SKIP_DIRS = {".git", "node_modules", "__pycache__", "build", "dist", "venv", ".venv", "generated"}
+
+_PY_SYMBOL = re.compile(r"^(?:async\s+)?(?:def|class)\s+(\w+)", re.MULTILINE)
+_PY_ROUTE = re.compile(r"^@app\.(?:get|post|put|patch|delete)\(\s*\"([^\"]+)\"", re.MULTILINE)
+_JS_EXPORT = re.compile(
+    r"^export\s+(?:default\s+)?(?:async\s+)?(?:function|const|let|class|interface|type|enum)\s+(\w+)",
+    re.MULTILINE
+)
+_JS_DEFAULT = re.compile(r"^export\s+default\s+(\w+)\s*;?\s*$", re.MULTILINE)
+# Top-level React components that are not exported inline
+_JS_COMPONENT = re.compile(r"^(?:const|function)\s+([A-Z]\w*)\s*[(:=]", re.MULTILINE)
+_CSS_CLASS = re.compile(r"^\.([\w-]+)", re.MULTILINE)
+
+_STOPWORDS = {
+    "a", "an", "the", "please", "to", "of", "and", "or", "some", "can", "you", "we", "i",
+    "add", "make", "with", "for", "on", "in", "it", "is", "be", "that", "this", "should",
+    "would", "like", "page", "new", "more", "when", "from", "into", "show",
+}
+
+
+def split_words(value: str) -> List[str]:
+    """Lowercase words of a path, identifier or sentence (camelCase aware)"""
+    value = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", value)
+    return re.findall(r"[a-z0-9]+", value.lower())
+
+
+def stem(word: str) -> str:
+    """
+    Crude suffix stripping so word forms match: "models" -> "model",
+    "toggling" and "toggles" -> "toggl", while "mode" stays apart
+    from "model".
+    """
+    for suffix in ("ing", "ies", "es", "ed", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3 and not word.endswith("ss"):
+            word = word[:-len(suffix)] + ("y" if suffix == "ies" else "")
+            break
+    if word.endswith("e") and len(word) > 3:
+        word = word[:-1]
+    return word
+
+
+def word_stems(value: str) -> Set[str]:
+    return {stem(w) for w in split_words(value) if len(w) > 2}
+
+
+def query_terms(query: str) -> Set[str]:
+    """Stems of the meaningful words of a query"""
+    return {stem(w) for w in split_words(query) if len(w) > 2 and w not in _STOPWORDS}
+
+
+def extract_symbols(path: str, content: str) -> List[str]:
+    """Names a file defines or exports, in order of appearance"""
+    ext = os.path.splitext(path)[1]
+    if ext == ".py":
+        found = _PY_SYMBOL.findall(content) + _PY_ROUTE.findall(content)
+    elif ext in (".ts", ".tsx", ".js", ".jsx"):
+        found = _JS_EXPORT.findall(content) + _JS_DEFAULT.findall(content) + _JS_COMPONENT.findall(content)
+    elif ext == ".css":
+        found = _CSS_CLASS.findall(content)
+    else:
+        found = []
+    return list(dict.fromkeys(found))
+
+
+def extract_summary(content: str) -> str:
+    """First comment or docstring line, if the file starts with one"""
+    in_comment = False
+    for line in content.splitlines()[:15]:
+        line = line.strip()
+        if not line or line.startswith("#!"):
+            continue
+        if line in ('"""', "'''", "/**", "/*"):
+            in_comment = True
+            continue
+        uncommented = re.sub(r"^(\"\"\"|'''|//+|#+|/\*+|\*+)\s*", "", line)
+        text = uncommented.strip(" */\"'")
+        if text and (in_comment or uncommented != line):
+            return text[:120]
+        break
+    return ""
+
+
+class RepoIndex:
+    """
+    Incrementally refreshed index of the source files under `repo_path`.
+
+    Metadata is persisted as JSON at `index_path` so a restarted process
+    only rereads files that changed in the meantime. Refreshes walk the
+    tree at most once per `refresh_seconds`.
+    """
+
+    def __init__(
+        self,
+        repo_path: str,
+        index_path: Optional[str] = None,
+        refresh_seconds: float = 5.0,
+        max_file_bytes: int = 256 * 1024,
+    ):
+        self.repo_path = os.path.realpath(repo_path)
+        if index_path is None:
+            digest = hashlib.sha1(self.repo_path.encode()).hexdigest()[:12]
+            index_path = os.path.join(tempfile.gettempdir(), f"repo_index-{digest}.json")
+        self.index_path = index_path
+        self.refresh_seconds = refresh_seconds
+        self.max_file_bytes = max_file_bytes
+        self._entries: Dict[str, dict] = {}
+        # path -> (mtime_ns, size, content)
+        self._contents: Dict[str, tuple] = {}
+        self._lock = threading.RLock()
+        self._last_refresh = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+            if data.get("format") == INDEX_FORMAT and data.get("repo_path") == self.repo_path:
+                self._entries = data["files"]
+        except (OSError, ValueError, KeyError):
+            self._entries = {}
+
+    def _save(self):
+        directory = os.path.dirname(self.index_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"format": INDEX_FORMAT, "repo_path": self.repo_path, "files": self._entries}, f)
+            os.replace(tmp_path, self.index_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _walk(self):
+        for root, dirs, files in os.walk(self.repo_path):
+            dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith("."))
+            for name in sorted(files):
+                if name.endswith(SOURCE_EXTENSIONS):
+                    full_path = os.path.join(root, name)
+                    yield os.path.relpath(full_path, self.repo_path), full_path
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Re-index files whose mtime or size changed and drop deleted ones.
+
+        Returns:
+            Number of files (re)indexed or removed
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._last_refresh is not None and now - self._last_refresh < self.refresh_seconds:
+                return 0
+            self._last_refresh = now
+
+            changed = 0
+            seen = set()
+            for path, full_path in self._walk():
+                try:
+                    st = os.stat(full_path)
+                except OSError:
+                    continue
+                if st.st_size > self.max_file_bytes:
+                    continue
+                seen.add(path)
+                entry = self._entries.get(path)
+                if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                    continue
+
+                content = self._read_file(path, full_path, st)
+                if content is None:
+                    continue
+                sha1 = hashlib.sha1(content.encode()).hexdigest()
+                if entry and entry["sha1"] == sha1:
+                    # Touched but unchanged: skip re-parsing
+                    entry["mtime_ns"] = st.st_mtime_ns
+                else:
+                    self._entries[path] = {
+                        "size": st.st_size,
+                        "mtime_ns": st.st_mtime_ns,
+                        "sha1": sha1,
+                        "lines": content.count("\n") + 1,
+                        "symbols": extract_symbols(path, content),
+                        "summary": extract_summary(content),
+                    }
+                changed += 1
+
+            for path in set(self._entries) - seen:
+                del self._entries[path]
+                self._contents.pop(path, None)
+                changed += 1
+
+            if changed:
+                self._save()
+                logger.info(f"Repo index refreshed: {changed} file(s) changed, {len(self._entries)} indexed")
+            return changed
+
+    def files(self) -> Dict[str, dict]:
+        self.refresh()
+        with self._lock:
+            return dict(self._entries)
+
+    def _full_path(self, path: str) -> Optional[str]:
+        """Absolute path of a repo-relative path, None if it escapes the repo"""
+        full_path = os.path.realpath(os.path.join(self.repo_path, path))
+        if not full_path.startswith(self.repo_path + os.sep):
+            return None
+        return full_path
+
+    def _read_file(self, path: str, full_path: str, st: os.stat_result) -> Optional[str]:
+        try:
+            with open(full_path, "r", encoding="utf-8", errors="replace") as f:
+                content = f.read()
+        except OSError:
+            return None
+        with self._lock:
+            self._contents[path] = (st.st_mtime_ns, st.st_size, content)
+        return content
+
+    def read(self, path: str) -> str:
+        """
+        Current content of a repo file, empty if it does not exist.
+
+        Served from memory while the file's mtime and size are unchanged.
+        """
+        path = os.path.normpath(path)
+        full_path = self._full_path(path)
+        if full_path is None:
+            logger.warning(f"Refusing to read {path}: outside the repository")
+            return ""
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            return ""
+        with self._lock:
+            cached = self._contents.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        return self._read_file(path, full_path, st) or ""
+
+    def candidates(self, query: str, limit: int = 8) -> List[dict]:
+        """
+        Files most likely relevant to a query, best first.
+
+        Query words are matched as whole stems against path words, symbols
+        and the summary, so only the metadata in the index is needed. Each
+        match is weighted by how few files share the stem, so a rare term
+        ("toggle") outranks one most files mention ("suggestion"). Files
+        without any match are left out.
+        """
+        terms = query_terms(query)
+        entries = self.files()
+        fields = {
+            path: (
+                word_stems(path),
+                set().union(*(word_stems(symbol) for symbol in entry["symbols"])),
+                word_stems(entry["summary"]),
+            )
+            for path, entry in entries.items()
+        }
+        rarity = {}
+        for term in terms:
+            files_with_term = sum(1 for stems in fields.values() if any(term in field for field in stems))
+            if files_with_term:
+                rarity[term] = math.log(1 + len(fields) / files_with_term)
+
+        scored = []
+        for path, (path_stems, symbol_stems, summary_stems) in fields.items():
+            score = 0.0
+            for term, term_rarity in rarity.items():
+                weight = 3 * (term in path_stems) + 2 * (term in symbol_stems) + (term in summary_stems)
+                score += weight * term_rarity
+            if score:
+                scored.append((-score, path.count(os.sep), path))
+        scored.sort()
+        return [dict(entries[path], path=path, score=round(-score, 2)) for score, _, path in scored[:limit]]
+
+    def snippet(self, path: str, terms: Set[str], max_lines: int = 24, context: int = 2) -> str:
+        """
+        Numbered lines of a file around mentions of the terms.
+
+        Terms are weighted by how rarely they occur in the file, so a line
+        naming the specific feature beats the tenth mention of "suggestion".
+        """
+        lines = [line.lower() for line in self.read(path).splitlines()]
+        counts = {term: sum(1 for line in lines if term in line) for term in terms}
+        scored = []
+        for i, line in enumerate(lines):
+            score = sum(1 / counts[term] for term in terms if term in line)
+            if score:
+                scored.append((-score, i))
+
+        keep = set()
+        for _, i in sorted(scored):
+            window = set(range(max(0, i - context), min(len(lines), i + context + 1)))
+            if len(keep | window) > max_lines:
+                break
+            keep |= window
+
+        original = self.read(path).splitlines()
+        return "\n".join(f"{j + 1}: {original[j]}" for j in sorted(keep))
+
+    def outline(self, limit: int = 40) -> str:
+        """Compact listing of the shallowest files, the entry points of the repository"""
+        entries = self.files()
+        paths = sorted(entries, key=lambda path: (path.count(os.sep), path))[:limit]
+        return "\n".join(f"- {path} ({entries[path]['lines']} lines)" for path in paths)
+
+    def describe(self, query: str, limit: int = 8) -> str:
+        """Prompt section listing the candidate files for a query with snippets"""
+        terms = query_terms(query)
+        sections = []
+        for entry in self.candidates(query, limit):
+            header = f"- {entry['path']} ({entry['lines']} lines)"
+            if entry["summary"]:
+                header += f" - {entry['summary']}"
+            parts = [header]
+            if entry["symbols"]:
+                parts.append(f"  defines: {', '.join(entry['symbols'][:20])}")
+            snippet = self.snippet(entry["path"], terms)
+            if snippet:
+                parts.append(f"  ```\n{snippet}\n  ```")
+            sections.append("\n".join(parts))
+        return "\n".join(sections)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} <repo_path> [query]")
+        sys.exit(1)
+
+    repo_index = RepoIndex(sys.argv[1], os.getenv("REPO_INDEX_PATH") or None)
+    repo_index.refresh(force=True)
+    if len(sys.argv) > 2:
+        print(repo_index.describe(" ".join(sys.argv[2:])) or "No candidate files")
+    else:
+        entries = repo_index.files()
+        total = sum(entry["size"] for entry in entries.values())
+        print(f"{len(entries)} files, {total / 1024:.1f} KB indexed at {repo_index.index_path}")
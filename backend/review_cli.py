@@ -1,126 +1,236 @@
 #!/usr/bin/env python3
 """
 CLI tool to review and approve code changes from AI suggestions.
+
+Nothing is checked out while reviewing: branches, diffstats and diffs are
+read straight from the object database, and approved branches are merged
+into master in one merge train.
 """
 import sys
 import os
+import json
+import subprocess
+from datetime import datetime, timezone
+from fnmatch import fnmatch
+from typing import Dict, List, Tuple
 from git_manager import GitManager
 from colorama import init, Fore, Style
 
 # Initialize colorama for colored output
 init(autoreset=True)
 
+# Review decisions, kept inside the repository's .git directory
+REVIEWS_FILE = "suggestion-reviews.json"
 
-def print_diff(diff: str):
-    """Print colored diff output"""
-    for line in diff.split('\n'):
-        if line.startswith('+') and not line.startswith('+++'):
-            print(Fore.GREEN + line)
-        elif line.startswith('-') and not line.startswith('---'):
-            print(Fore.RED + line)
-        elif line.startswith('@@'):
-            print(Fore.CYAN + line)
-        else:
-            print(line)
 
+def load_reviews(git: GitManager) -> Dict[str, Dict]:
+    """Recorded decisions: branch -> {decision, commit, reviewed_at}"""
+    try:
+        with open(os.path.join(git.repo.git_dir, REVIEWS_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_reviews(git: GitManager, reviews: Dict[str, Dict]):
+    path = os.path.join(git.repo.git_dir, REVIEWS_FILE)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(reviews, f, indent=2)
+    os.replace(path + ".tmp", path)
 
-def review_suggestion(suggestion_id: int):
-    """Review changes for a specific suggestion"""
-    git = GitManager()
-    
-    # Check if branch exists
-    branch_name = f"suggestion-{suggestion_id}"
-    branches = [b.name for b in git.repo.branches]
-    
-    matching_branches = [b for b in branches if b.startswith(branch_name)]
-    
-    if not matching_branches:
-        print(f"{Fore.RED}No branch found for suggestion #{suggestion_id}")
-        return
-    
-    branch = matching_branches[0]
-    print(f"\n{Fore.CYAN}{'='*60}")
-    print(f"{Fore.YELLOW}Reviewing: {branch}")
-    print(f"{Fore.CYAN}{'='*60}\n")
-    
-    # Checkout the branch
-    git.repo.git.checkout(branch)
-    
-    # Get diff
-    diff = git.get_diff()
-    
-    if not diff:
-        print(f"{Fore.YELLOW}No changes found")
-        return
-    
-    print(f"{Fore.WHITE}Changes:\n")
-    print_diff(diff)
-    
-    print(f"\n{Fore.CYAN}{'='*60}\n")
-    
-    # Prompt for action
-    while True:
-        choice = input(f"{Fore.YELLOW}Action? [a]pprove / [r]eject / [e]dit / [q]uit: {Style.RESET_ALL}").lower()
-        
-        if choice == 'a':
-            print(f"{Fore.GREEN}✓ Approved! Merging to master...")
-            try:
-                git.repo.git.checkout('master')
-                git.repo.git.merge(branch, '--no-ff')
-                print(f"{Fore.GREEN}✓ Merged successfully!")
-            except Exception as e:
-                print(f"{Fore.RED}✗ Merge failed: {e}")
-            break
-            
-        elif choice == 'r':
-            print(f"{Fore.RED}✗ Rejected. Switching back to master...")
-            git.switch_to_main()
-            break
-            
-        elif choice == 'e':
-            print(f"{Fore.YELLOW}Opening files for editing...")
-            print(f"{Fore.CYAN}Edit the files, then run this command again.")
-            break
-            
-        elif choice == 'q':
-            print(f"{Fore.CYAN}Exiting...")
-            git.switch_to_main()
-            break
-        else:
-            print(f"{Fore.RED}Invalid choice")
+
+def select_branches(git: GitManager, selectors: List[str]) -> List[Tuple[str, str]]:
+    """
+    Suggestion branches matching ids or glob patterns (all if none), in
+    suggestion order, as (name, tip commit)
+    """
+    branches = git.suggestion_branches()
+    if not selectors:
+        return branches
+    return [
+        (name, tip) for name, tip in branches
+        if any(
+            name.startswith(f"suggestion-{selector}-") if selector.isdigit() else fnmatch(name, selector)
+            for selector in selectors
+        )
+    ]
+
+
+def current_decision(reviews: Dict[str, Dict], name: str, tip: str) -> str:
+    """Decision recorded for a branch at its current tip, "" if unreviewed"""
+    review = reviews.get(name)
+    # A decision only counts for the commit that was reviewed
+    return review["decision"] if review and review["commit"] == tip else ""
+
+
+def format_stat(stat: Dict) -> str:
+    return (f"{len(stat['files'])} file(s) "
+            f"{Fore.GREEN}+{stat['added']}{Style.RESET_ALL} {Fore.RED}-{stat['deleted']}{Style.RESET_ALL}")
+
+
+def page_diff(git: GitManager, base: str, tip: str):
+    """Stream a diff through git's pager; nothing is buffered or checked out"""
+    subprocess.run(['git', '--paginate', 'diff', base, tip], cwd=git.repo_path)
 
 
 def list_pending_suggestions():
-    """List all suggestion branches"""
+    """List all unmerged suggestion branches with their diffstats"""
     git = GitManager()
-    branches = [b.name for b in git.repo.branches if 'suggestion-' in b.name]
-    
-    if not branches:
+    branches = select_branches(git, [])
+    stats = git.branch_stats(branches)
+    reviews = load_reviews(git)
+
+    if not stats:
         print(f"{Fore.YELLOW}No pending suggestions")
         return
-    
+
     print(f"\n{Fore.CYAN}Pending Suggestions:")
-    for i, branch in enumerate(branches, 1):
-        # Extract suggestion ID
-        parts = branch.split('-')
-        if len(parts) >= 2 and parts[1].isdigit():
-            print(f"{Fore.GREEN}{i}. {Fore.WHITE}Suggestion #{parts[1]}: {'-'.join(parts[2:])}")
+    for i, (branch, tip) in enumerate([b for b in branches if b[0] in stats], 1):
+        decision = current_decision(reviews, branch, tip)
+        decision = f" [{decision}]" if decision else ""
+        print(f"{Fore.GREEN}{i}. {Fore.WHITE}{branch}{Fore.YELLOW}{decision}{Style.RESET_ALL}  {format_stat(stats[branch])}")
     print()
 
 
+def integrate_suggestions(selectors: List[str], dry_run: bool = False, include_unreviewed: bool = False):
+    """
+    Merge many suggestion branches into master in one merge train.
+
+    Only branches approved at their current tip are integrated, unless
+    `include_unreviewed` is set; rejected branches never are.
+    """
+    git = GitManager()
+    reviews = load_reviews(git)
+    allowed = ("approved", "") if include_unreviewed else ("approved",)
+
+    branches, skipped = [], 0
+    for name, tip in select_branches(git, selectors):
+        if current_decision(reviews, name, tip) in allowed:
+            branches.append(name)
+        else:
+            skipped += 1
+    if skipped:
+        reason = "rejected" if include_unreviewed else "not approved at their current commit"
+        print(f"{Fore.YELLOW}Skipping {skipped} branch(es) {reason}")
+    integrate(git, branches, dry_run)
+
+
+def integrate(git: GitManager, branches: List[str], dry_run: bool = False):
+    if not branches:
+        print(f"{Fore.YELLOW}No matching suggestion branches")
+        return
+
+    print(f"\n{Fore.CYAN}Integrating {len(branches)} branches into {git.base_branch}...\n")
+    result = git.integrate_branches(branches, fast_forward=not dry_run)
+
+    for branch in result["merged"]:
+        print(f"{Fore.GREEN}✓ {branch}")
+    for branch in result["up_to_date"]:
+        print(f"{Fore.YELLOW}= {branch} (already merged)")
+    for branch, files in result["conflicts"].items():
+        print(f"{Fore.RED}✗ {branch} (conflicts: {', '.join(files)})")
+
+    print(f"\n{Fore.CYAN}{len(result['merged'])} merged, {len(result['conflicts'])} conflicting, "
+          f"{len(result['up_to_date'])} already merged")
+    if result["fast_forwarded"]:
+        print(f"{Fore.GREEN}✓ {git.base_branch} fast-forwarded to {result['commit'][:7]}")
+    elif dry_run:
+        print(f"{Fore.CYAN}Dry run: result is on branch 'integration', {git.base_branch} unchanged")
+
+
+def batch_review(selectors: List[str], include_reviewed: bool = False):
+    """
+    Review many suggestion branches in one session.
+
+    Branches already decided at their current commit are skipped unless
+    `include_reviewed` is set. Decisions are saved as they are made, and
+    the approved branches can be integrated at the end.
+    """
+    git = GitManager()
+    branches = select_branches(git, selectors)
+    stats = git.branch_stats(branches)
+    reviews = load_reviews(git)
+
+    pending = [
+        (name, tip) for name, tip in branches
+        if name in stats and (include_reviewed or not current_decision(reviews, name, tip))
+    ]
+    if not pending:
+        print(f"{Fore.YELLOW}No suggestion branches to review")
+        return
+
+    print(f"\n{Fore.CYAN}{len(pending)} branch(es) to review\n")
+    for i, (branch, tip) in enumerate(pending, 1):
+        stat = stats[branch]
+        print(f"{Fore.CYAN}{'='*60}")
+        print(f"{Fore.YELLOW}[{i}/{len(pending)}] {branch}{Style.RESET_ALL}  {format_stat(stat)}")
+        for path, added, deleted in stat["files"]:
+            print(f"    {path}  {Fore.GREEN}+{added} {Fore.RED}-{deleted}")
+
+        choice = None
+        while choice not in ('a', 'r', 's', 'q'):
+            choice = input(
+                f"{Fore.YELLOW}Action? [v]iew diff / [a]pprove / [r]eject / [s]kip / [q]uit: {Style.RESET_ALL}"
+            ).lower()
+            if choice == 'v':
+                page_diff(git, stat["base"], tip)
+            elif choice not in ('a', 'r', 's', 'q'):
+                print(f"{Fore.RED}Invalid choice")
+
+        if choice == 'q':
+            break
+        if choice in ('a', 'r'):
+            reviews[branch] = {
+                "decision": "approved" if choice == 'a' else "rejected",
+                "commit": tip,
+                "reviewed_at": datetime.now(timezone.utc).isoformat(),
+            }
+            save_reviews(git, reviews)
+            print(f"{Fore.GREEN}✓ Approved" if choice == 'a' else f"{Fore.RED}✗ Rejected")
+
+    approved = [
+        name for name, tip in branches
+        if name in stats and current_decision(reviews, name, tip) == "approved"
+    ]
+    if approved:
+        answer = input(f"\n{Fore.YELLOW}Integrate {len(approved)} approved branch(es) into "
+                       f"{git.base_branch} now? [y/N]: {Style.RESET_ALL}").lower()
+        if answer == 'y':
+            integrate(git, approved)
+
+
+def review_suggestion(suggestion_id: int):
+    """Review changes for a specific suggestion"""
+    batch_review([str(suggestion_id)], include_reviewed=True)
+
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print(f"{Fore.CYAN}Usage:")
         print(f"  {sys.argv[0]} list              - List pending suggestions")
         print(f"  {sys.argv[0]} review <id>       - Review suggestion by ID")
+        print(f"  {sys.argv[0]} batch [<id|pattern> ...] [--all]")
+        print(f"                              - Review many suggestions in one session")
+        print(f"  {sys.argv[0]} integrate [<id|pattern> ...] [--all] [--dry-run]")
+        print(f"                              - Merge approved suggestion branches into master in one pass")
+        print(f"                                (--all: also unreviewed ones; rejected ones never)")
         sys.exit(1)
-    
+
     command = sys.argv[1]
-    
+    args = sys.argv[2:]
+
     if command == 'list':
         list_pending_suggestions()
     elif command == 'review' and len(sys.argv) >= 3:
         suggestion_id = int(sys.argv[2])
         review_suggestion(suggestion_id)
+    elif command == 'batch':
+        batch_review([a for a in args if a != '--all'], include_reviewed='--all' in args)
+    elif command == 'integrate':
+        integrate_suggestions(
+            [a for a in args if a not in ('--dry-run', '--all')],
+            dry_run='--dry-run' in args,
+            include_unreviewed='--all' in args
+        )
     else:
         print(f"{Fore.RED}Invalid command")
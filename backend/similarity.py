@@ -0,0 +1,150 @@
+"""
+Near-duplicate detection for suggestions using MinHash and LSH.
+
+Suggestions are normalized, split into character shingles and summarized
+by a MinHash signature. The signature is cut into bands; suggestions that
+share any band hash are candidates, confirmed by the estimated Jaccard
+similarity of their signatures. Everything lives in Postgres, no external
+service is needed.
+"""
+import hashlib
+import logging
+import os
+import random
+import re
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import Suggestion, SuggestionBand
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 4
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+NUM_PERMUTATIONS = NUM_BANDS * ROWS_PER_BAND
+
+# Minimum estimated Jaccard similarity for reusing a completed suggestion
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+# Suggestions with fewer distinct words after normalization are not deduplicated
+DEDUP_MIN_WORDS = int(os.getenv("DEDUP_MIN_WORDS", "3"))
+# Placeholder code stored when generation failed (ai_agent.generation_error_code)
+ERROR_CODE_PREFIX = "// Error"
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1729)
+# Fixed seeds: signatures are stored, so they must be stable across processes
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+_STOPWORDS = {"a", "an", "the", "please", "to", "of", "and", "some", "can", "you", "we", "i"}
+
+
+def normalize(content: str) -> str:
+    """Lowercase, drop punctuation and filler words, collapse whitespace"""
+    words = re.sub(r"[^a-z0-9]+", " ", content.lower()).split()
+    return " ".join(w for w in words if w not in _STOPWORDS)
+
+
+def is_indexable(content: str) -> bool:
+    """
+    Whether a suggestion says enough to be compared.
+
+    Content of only stopwords or punctuation normalizes to (nearly)
+    nothing, and all such suggestions would share one signature.
+    """
+    return len(set(normalize(content).split())) >= DEDUP_MIN_WORDS
+
+
+def shingles(content: str) -> Set[str]:
+    """Character shingles of the normalized text"""
+    text = normalize(content)
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def minhash(content: str) -> List[int]:
+    """MinHash signature with NUM_PERMUTATIONS values below 2**61"""
+    hashes = [_hash64(s) for s in shingles(content)]
+    return [
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def band_keys(signature: List[int]) -> List[int]:
+    """One signed 64-bit key per LSH band (fits a BIGINT column)"""
+    keys = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(f"{band}:{rows}".encode(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+
+def estimate_similarity(first: List[int], second: List[int]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for a, b in zip(first, second) if a == b) / NUM_PERMUTATIONS
+
+
+def index_suggestion(db: Session, suggestion: Suggestion):
+    """
+    Add a suggestion to the similarity index.
+
+    Call with the suggestion flushed (it needs an id); the caller commits.
+    Suggestions that are not is_indexable are left out.
+    """
+    if not is_indexable(suggestion.content):
+        return
+    signature = minhash(suggestion.content)
+    suggestion.minhash = signature
+    db.add_all(
+        SuggestionBand(band_key=key, suggestion_id=suggestion.id)
+        for key in set(band_keys(signature))
+    )
+
+
+def find_duplicate(db: Session, suggestion: Suggestion) -> Optional[Tuple[Suggestion, float]]:
+    """
+    Find the most similar completed suggestion above DEDUP_THRESHOLD.
+
+    Suggestions created before the index existed are indexed on the fly.
+
+    Returns:
+        (suggestion, similarity) or None
+    """
+    if not is_indexable(suggestion.content):
+        return None
+    if not suggestion.minhash:
+        index_suggestion(db, suggestion)
+        db.commit()
+
+    signature = list(suggestion.minhash)
+    candidates = db.query(Suggestion).join(
+        SuggestionBand, SuggestionBand.suggestion_id == Suggestion.id
+    ).filter(
+        SuggestionBand.band_key.in_(band_keys(signature)),
+        Suggestion.id != suggestion.id,
+        Suggestion.status == 'completed',
+        Suggestion.generated_code.isnot(None),
+        ~Suggestion.generated_code.startswith(ERROR_CODE_PREFIX)
+    ).distinct().all()
+
+    best = None
+    for candidate in candidates:
+        if not candidate.minhash:
+            continue
+        similarity = estimate_similarity(signature, list(candidate.minhash))
+        if similarity >= DEDUP_THRESHOLD and (best is None or similarity > best[1]):
+            best = (candidate, similarity)
+    return best
@@ -1,9 +1,25 @@
+import asyncio
+import os
+import socket
+import threading
 import time
 import logging
+from datetime import timedelta
+from typing import Optional, Tuple
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from database import SessionLocal, init_db
-from models import Suggestion
-from ai_agent import validate_suggestion, generate_component_code
+from models import Job, Suggestion
+from events import NotificationWaiter  # also emits NOTIFY on suggestion writes
+from similarity import DEDUP_ENABLED, find_duplicate
+from jobs import claim_next_job, claim_query, process_job
+from llm_resilience import LLMUnavailableError
+from ai_agent import (
+    validate_suggestion,
+    generate_component_code,
+    validate_suggestion_async,
+    generate_component_code_async,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -12,88 +28,506 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def process_pending_suggestions():
+# Identifies this replica in lease columns; must be unique per worker process
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+# How long a claim stays valid without a heartbeat
+LEASE_SECONDS = int(os.getenv("WORKER_LEASE_SECONDS", "120"))
+HEARTBEAT_SECONDS = int(os.getenv("WORKER_HEARTBEAT_SECONDS", "30"))
+# Give up on a suggestion whose lease expired this many times (crash loop)
+MAX_ATTEMPTS = int(os.getenv("WORKER_MAX_ATTEMPTS", "3"))
+# Fallback sweep interval; new suggestions wake the worker via NOTIFY
+POLL_SECONDS = int(os.getenv("WORKER_POLL_SECONDS", "10"))
+# Work this replica picks up: suggestion processing and/or background jobs
+WORKER_QUEUES = [q.strip() for q in os.getenv("WORKER_QUEUES", "suggestions,jobs").split(",") if q.strip()]
+# "sync" processes one suggestion at a time, "async" many concurrently
+WORKER_MODE = os.getenv("WORKER_MODE", "sync")
+# Async mode: suggestions claimed at once, and LLM calls in flight per stage
+MAX_IN_FLIGHT = int(os.getenv("WORKER_MAX_IN_FLIGHT", "20"))
+VALIDATE_CONCURRENCY = int(os.getenv("WORKER_VALIDATE_CONCURRENCY", "10"))
+GENERATE_CONCURRENCY = int(os.getenv("WORKER_GENERATE_CONCURRENCY", "10"))
+# Async mode: start generation alongside validation instead of after it
+SPECULATIVE_GENERATION = os.getenv("WORKER_SPECULATIVE_GENERATION", "false").lower() in ("1", "true", "yes")
+
+
+def claim_next_suggestion(db: Session) -> Optional[Suggestion]:
+    """
+    Atomically claim the oldest claimable suggestion for this worker.
+
+    Pending rows and rows whose lease has expired are claimable. FOR UPDATE
+    SKIP LOCKED lets any number of workers claim concurrently without ever
+    handing the same row to two of them.
+
+    Returns:
+        The claimed suggestion, or None when there is nothing to do
+    """
+    while True:
+        suggestion = db.execute(claim_query(Suggestion)).scalars().first()
+
+        if suggestion is None:
+            db.commit()
+            return None
+
+        if suggestion.status == 'processing' and suggestion.lease_owner is not None:
+            logger.warning(f"Reclaiming suggestion #{suggestion.id} from expired lease of {suggestion.lease_owner}")
+
+        if suggestion.attempts >= MAX_ATTEMPTS:
+            logger.error(f"Suggestion #{suggestion.id} failed after {suggestion.attempts} attempts")
+            suggestion.status = 'failed'
+            suggestion.generated_code = f"// Error: gave up after {suggestion.attempts} attempts"
+            suggestion.lease_owner = None
+            suggestion.lease_expires_at = None
+            db.commit()
+            continue
+
+        suggestion.status = 'processing'
+        suggestion.lease_owner = WORKER_ID
+        suggestion.lease_expires_at = func.now() + timedelta(seconds=LEASE_SECONDS)
+        suggestion.attempts = suggestion.attempts + 1
+        db.commit()
+        return suggestion
+
+
+def finish_suggestion(db: Session, suggestion: Suggestion, status: str, generated_code: str) -> bool:
+    """
+    Store the result of a claimed suggestion if this worker still owns it.
+
+    Returns:
+        False when the lease was lost (expired and reclaimed by another worker)
+    """
+    db.refresh(suggestion, with_for_update=True)
+
+    if suggestion.status != 'processing' or suggestion.lease_owner != WORKER_ID:
+        logger.warning(f"Lost lease on suggestion #{suggestion.id}, discarding result")
+        db.rollback()
+        return False
+
+    suggestion.status = status
+    suggestion.generated_code = generated_code
+    suggestion.lease_owner = None
+    suggestion.lease_expires_at = None
+    db.commit()
+    return True
+
+
+def defer_suggestion(db: Session, suggestion: Suggestion, seconds: float) -> bool:
     """
-    Main worker function that polls for pending suggestions and processes them.
+    Give a claimed suggestion back without a result, to be claimed again
+    after `seconds`. Used when the LLM API is unavailable: the attempt
+    is not counted, as no work was done.
+
+    Returns:
+        False when the lease was lost
+    """
+    db.refresh(suggestion, with_for_update=True)
+
+    if suggestion.status != 'processing' or suggestion.lease_owner != WORKER_ID:
+        db.rollback()
+        return False
+
+    # Unowned, so heartbeats leave it alone and it becomes claimable on expiry
+    suggestion.lease_owner = None
+    suggestion.lease_expires_at = func.now() + timedelta(seconds=seconds)
+    suggestion.attempts = suggestion.attempts - 1
+    db.commit()
+    return True
+
+
+def extend_leases():
+    """
+    Push out the lease of every row (suggestion or job) this worker is processing.
+
+    A bulk UPDATE on purpose: heartbeats are not user visible changes, so
+    they skip the version bump and the change notification.
     """
     db: Session = SessionLocal()
-    
     try:
-        # Query for pending suggestions
-        pending = db.query(Suggestion).filter(
-            Suggestion.status == 'pending'
-        ).order_by(Suggestion.created_at).all()
-        
-        if not pending:
+        extended = 0
+        for model in (Suggestion, Job):
+            extended += db.query(model).filter(
+                model.status == 'processing',
+                model.lease_owner == WORKER_ID
+            ).update(
+                {model.lease_expires_at: func.now() + timedelta(seconds=LEASE_SECONDS)},
+                synchronize_session=False
+            )
+        db.commit()
+        if extended:
+            logger.debug(f"Extended {extended} lease(s)")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error extending leases: {str(e)}")
+    finally:
+        db.close()
+
+
+def start_heartbeat() -> threading.Event:
+    """Run extend_leases every HEARTBEAT_SECONDS in a daemon thread"""
+    stopped = threading.Event()
+
+    def beat():
+        while not stopped.wait(HEARTBEAT_SECONDS):
+            extend_leases()
+
+    threading.Thread(target=beat, name="lease-heartbeat", daemon=True).start()
+    return stopped
+
+
+def reuse_duplicate(db: Session, suggestion: Suggestion) -> bool:
+    """
+    Complete a claimed suggestion with the code of a near-duplicate.
+
+    Returns:
+        True when a completed near-duplicate was found and reused
+    """
+    if not DEDUP_ENABLED:
+        return False
+
+    duplicate = find_duplicate(db, suggestion)
+    if duplicate is None:
+        return False
+
+    original, similarity = duplicate
+    logger.info(f"Suggestion #{suggestion.id} reuses code of #{original.id} (similarity {similarity:.2f})")
+    finish_suggestion(db, suggestion, 'completed', original.generated_code)
+    return True
+
+
+def reuse_duplicate_by_id(suggestion_id: int) -> bool:
+    """reuse_duplicate in a short-lived session, for the async worker"""
+    db: Session = SessionLocal()
+    try:
+        suggestion = db.get(Suggestion, suggestion_id)
+        return suggestion is not None and reuse_duplicate(db, suggestion)
+    finally:
+        db.close()
+
+
+def process_suggestion(db: Session, suggestion: Suggestion):
+    """Validate a claimed suggestion and generate its component code"""
+    try:
+        logger.info(f"Processing suggestion #{suggestion.id}: {suggestion.content[:50]}...")
+
+        if reuse_duplicate(db, suggestion):
             return
-        
-        logger.info(f"Found {len(pending)} pending suggestion(s)")
-        
-        for suggestion in pending:
-            try:
-                logger.info(f"Processing suggestion #{suggestion.id}: {suggestion.content[:50]}...")
-                
-                # Update status to processing
-                suggestion.status = 'processing'
-                db.commit()
-                
-                # Validate suggestion
-                validation_result = validate_suggestion(suggestion.content)
-                
-                if not validation_result["approved"]:
-                    logger.warning(f"Suggestion #{suggestion.id} rejected: {validation_result['reason']}")
-                    suggestion.status = 'failed'
-                    suggestion.generated_code = f"// Validation failed: {validation_result['reason']}"
-                    db.commit()
-                    continue
-                
-                logger.info(f"Suggestion #{suggestion.id} validated successfully")
-                
-                # Generate code
-                generated_code = generate_component_code(suggestion.content)
-                
-                # Update suggestion with generated code
-                suggestion.generated_code = generated_code
-                suggestion.status = 'completed'
-                db.commit()
-                
-                logger.info(f"Suggestion #{suggestion.id} completed successfully")
-                
-            except Exception as e:
-                logger.error(f"Error processing suggestion #{suggestion.id}: {str(e)}")
-                suggestion.status = 'failed'
-                suggestion.generated_code = f"// Error: {str(e)}"
-                db.commit()
-                
+
+        # Validate suggestion
+        validation_result = validate_suggestion(suggestion.content)
+
+        if not validation_result["approved"]:
+            logger.warning(f"Suggestion #{suggestion.id} rejected: {validation_result['reason']}")
+            finish_suggestion(db, suggestion, 'failed', f"// Validation failed: {validation_result['reason']}")
+            return
+
+        logger.info(f"Suggestion #{suggestion.id} validated successfully")
+
+        # Generate code
+        generated_code = generate_component_code(suggestion.content)
+
+        # Update suggestion with generated code
+        if finish_suggestion(db, suggestion, 'completed', generated_code):
+            logger.info(f"Suggestion #{suggestion.id} completed successfully")
+
+    except LLMUnavailableError as e:
+        logger.warning(f"Deferring suggestion #{suggestion.id}: {str(e)}")
+        db.rollback()
+        defer_suggestion(db, suggestion, max(e.retry_after, POLL_SECONDS))
+
+    except Exception as e:
+        logger.error(f"Error processing suggestion #{suggestion.id}: {str(e)}")
+        db.rollback()
+        finish_suggestion(db, suggestion, 'failed', f"// Error: {str(e)}")
+
+
+def process_pending_suggestions():
+    """
+    Claim and process suggestions until none are left.
+    """
+    db: Session = SessionLocal()
+
+    try:
+        while True:
+            suggestion = claim_next_suggestion(db)
+            if suggestion is None:
+                return
+            process_suggestion(db, suggestion)
+
     except Exception as e:
         logger.error(f"Error querying database: {str(e)}")
     finally:
         db.close()
 
 
+def process_pending_jobs():
+    """
+    Claim and run background jobs until none are left.
+    """
+    db: Session = SessionLocal()
+
+    try:
+        while True:
+            job = claim_next_job(db, WORKER_ID, LEASE_SECONDS, MAX_ATTEMPTS)
+            if job is None:
+                return
+            process_job(db, job, WORKER_ID, POLL_SECONDS)
+
+    except Exception as e:
+        logger.error(f"Error querying jobs: {str(e)}")
+    finally:
+        db.close()
+
+
+def claim_job_id() -> Optional[int]:
+    """Claim a job in a short-lived session, for the async worker"""
+    db: Session = SessionLocal()
+    try:
+        job = claim_next_job(db, WORKER_ID, LEASE_SECONDS, MAX_ATTEMPTS)
+        return job.id if job else None
+    finally:
+        db.close()
+
+
+def run_claimed_job(job_id: int):
+    """Run a job claimed by claim_job_id in its own session"""
+    db: Session = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        if job is not None:
+            process_job(db, job, WORKER_ID, POLL_SECONDS)
+    finally:
+        db.close()
+
+
+def claim_one() -> Optional[Tuple[int, str]]:
+    """Claim a suggestion in a short-lived session; returns (id, content)"""
+    db: Session = SessionLocal()
+    try:
+        suggestion = claim_next_suggestion(db)
+        return (suggestion.id, suggestion.content) if suggestion else None
+    finally:
+        db.close()
+
+
+def store_result(suggestion_id: int, status: str, generated_code: str) -> bool:
+    """Store the result of a claimed suggestion in a short-lived session"""
+    db: Session = SessionLocal()
+    try:
+        suggestion = db.get(Suggestion, suggestion_id)
+        if suggestion is None:
+            return False
+        return finish_suggestion(db, suggestion, status, generated_code)
+    finally:
+        db.close()
+
+
+def defer_result(suggestion_id: int, seconds: float) -> bool:
+    """defer_suggestion in a short-lived session"""
+    db: Session = SessionLocal()
+    try:
+        suggestion = db.get(Suggestion, suggestion_id)
+        if suggestion is None:
+            return False
+        return defer_suggestion(db, suggestion, seconds)
+    finally:
+        db.close()
+
+
+class Stages:
+    """Per-stage concurrency limits for the async worker"""
+
+    def __init__(self):
+        self.validate = asyncio.Semaphore(VALIDATE_CONCURRENCY)
+        self.generate = asyncio.Semaphore(GENERATE_CONCURRENCY)
+
+
+class SpeculationStats:
+    """Counters for speculative generation, logged as they change"""
+
+    def __init__(self):
+        self.started = 0
+        self.used = 0
+        # Rejected after generation finished: the full call was wasted
+        self.discarded = 0
+        # Rejected while generation was still running: request cancelled
+        self.cancelled = 0
+
+    def wasted(self) -> int:
+        return self.discarded + self.cancelled
+
+    def log(self):
+        rate = self.wasted() / self.started * 100 if self.started else 0
+        logger.info(
+            f"Speculation: {self.started} started, {self.used} used, "
+            f"{self.discarded} discarded, {self.cancelled} cancelled ({rate:.1f}% wasted)"
+        )
+
+
+speculation_stats = SpeculationStats()
+
+
+async def generate_with_slot(content: str, stages: Stages) -> str:
+    async with stages.generate:
+        return await generate_component_code_async(content)
+
+
+def drain_task(task: asyncio.Task):
+    """Retrieve the outcome of a task nobody awaits, so failures are not reported as unretrieved"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.debug(f"Abandoned task failed: {task.exception()}")
+
+
+def abandon_speculation(generation: asyncio.Task):
+    """Drop a speculative generation whose suggestion was not approved"""
+    generation.add_done_callback(drain_task)
+    if generation.done():
+        speculation_stats.discarded += 1
+    else:
+        generation.cancel()
+        speculation_stats.cancelled += 1
+    speculation_stats.log()
+
+
+async def process_suggestion_async(suggestion_id: int, content: str, stages: Stages):
+    """Async counterpart of process_suggestion; DB work runs in threads"""
+    generation = None
+    try:
+        logger.info(f"Processing suggestion #{suggestion_id}: {content[:50]}...")
+
+        if await asyncio.to_thread(reuse_duplicate_by_id, suggestion_id):
+            return
+
+        if SPECULATIVE_GENERATION:
+            # Nearly every suggestion is approved, so generate while validating
+            generation = asyncio.create_task(generate_with_slot(content, stages))
+            speculation_stats.started += 1
+
+        async with stages.validate:
+            validation_result = await validate_suggestion_async(content)
+
+        if not validation_result["approved"]:
+            logger.warning(f"Suggestion #{suggestion_id} rejected: {validation_result['reason']}")
+            if generation is not None:
+                abandon_speculation(generation)
+                generation = None
+            await asyncio.to_thread(
+                store_result, suggestion_id, 'failed',
+                f"// Validation failed: {validation_result['reason']}"
+            )
+            return
+
+        logger.info(f"Suggestion #{suggestion_id} validated successfully")
+
+        if generation is not None:
+            generated_code = await generation
+            generation = None
+            speculation_stats.used += 1
+        else:
+            generated_code = await generate_with_slot(content, stages)
+
+        if await asyncio.to_thread(store_result, suggestion_id, 'completed', generated_code):
+            logger.info(f"Suggestion #{suggestion_id} completed successfully")
+
+    except LLMUnavailableError as e:
+        logger.warning(f"Deferring suggestion #{suggestion_id}: {str(e)}")
+        if generation is not None:
+            abandon_speculation(generation)
+        await asyncio.to_thread(defer_result, suggestion_id, max(e.retry_after, POLL_SECONDS))
+
+    except Exception as e:
+        logger.error(f"Error processing suggestion #{suggestion_id}: {str(e)}")
+        if generation is not None:
+            abandon_speculation(generation)
+        await asyncio.to_thread(store_result, suggestion_id, 'failed', f"// Error: {str(e)}")
+
+
+async def run_async_worker(waiter: NotificationWaiter):
+    """
+    Keep up to MAX_IN_FLIGHT suggestions and jobs processing concurrently.
+
+    Claims are topped up whenever a task finishes; with free slots and
+    nothing claimable the worker sleeps on LISTEN like the sync loop.
+    """
+    stages = Stages()
+    tasks = set()
+
+    def track(task: asyncio.Task):
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    while True:
+        try:
+            if "suggestions" in WORKER_QUEUES:
+                while len(tasks) < MAX_IN_FLIGHT:
+                    claimed = await asyncio.to_thread(claim_one)
+                    if claimed is None:
+                        break
+                    track(asyncio.create_task(process_suggestion_async(*claimed, stages)))
+
+            if "jobs" in WORKER_QUEUES:
+                while len(tasks) < MAX_IN_FLIGHT:
+                    job_id = await asyncio.to_thread(claim_job_id)
+                    if job_id is None:
+                        break
+                    # Jobs run the sync multi-agent pipeline in a worker thread
+                    track(asyncio.create_task(asyncio.to_thread(run_claimed_job, job_id)))
+
+        except Exception as e:
+            # Same as the sync loop: e.g. a database outage, keep running
+            logger.error(f"Unexpected error in worker loop: {str(e)}")
+            await asyncio.sleep(POLL_SECONDS)  # Wait before retrying
+            continue
+
+        if len(tasks) >= MAX_IN_FLIGHT:
+            await asyncio.wait(set(tasks), return_when=asyncio.FIRST_COMPLETED)
+        else:
+            await asyncio.to_thread(waiter.wait, POLL_SECONDS)
+
+
 def main():
     """
     Main worker loop - runs indefinitely checking for pending suggestions.
     """
-    logger.info("🤖 Worker started - monitoring for pending suggestions...")
+    logger.info(f"🤖 Worker {WORKER_ID} started - monitoring for pending suggestions...")
     logger.info("Press Ctrl+C to stop")
-    
+
     # Initialize database tables
     init_db()
     logger.info("Database initialized")
-    
+
+    heartbeat = start_heartbeat()
+    waiter = NotificationWaiter()
+
+    if WORKER_MODE == "async":
+        logger.info(f"Async mode: {MAX_IN_FLIGHT} in flight, {VALIDATE_CONCURRENCY} validating, {GENERATE_CONCURRENCY} generating")
+        if SPECULATIVE_GENERATION:
+            logger.info("Speculative generation enabled")
+        try:
+            asyncio.run(run_async_worker(waiter))
+        except KeyboardInterrupt:
+            logger.info("Worker stopped by user")
+        finally:
+            heartbeat.set()
+            waiter.close()
+        return
+
     # Main loop
     while True:
         try:
-            process_pending_suggestions()
-            time.sleep(10)  # Wait 10 seconds before checking again
-            
+            if "suggestions" in WORKER_QUEUES:
+                process_pending_suggestions()
+            if "jobs" in WORKER_QUEUES:
+                process_pending_jobs()
+            # Sleep until a suggestion or job is created, sweeping for expired
+            # leases at least every POLL_SECONDS
+            waiter.wait(POLL_SECONDS)
+
         except KeyboardInterrupt:
             logger.info("Worker stopped by user")
+            heartbeat.set()
+            waiter.close()
             break
         except Exception as e:
             logger.error(f"Unexpected error in worker loop: {str(e)}")
-            time.sleep(10)  # Wait before retrying
+            time.sleep(POLL_SECONDS)  # Wait before retrying
 
 
 if __name__ == "__main__":
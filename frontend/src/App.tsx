@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import SuggestionForm from './components/SuggestionForm'
 import SuggestionList from './components/SuggestionList'
 import Footer from './components/Footer'
@@ -7,24 +7,61 @@ export interface Suggestion {
   id: number
   content: string
   status: string
-  generated_code: string | null
+  generated_code?: string | null
   deployed: boolean
   component_name: string | null
   created_at: string
   updated_at: string | null
+  version?: number
+}
+
+interface SuggestionPage {
+  items: Suggestion[]
+  next_cursor: string | null
+  version: number
+}
+
+const PAGE_SIZE = 50
+
+// Upsert incoming rows into the current list, keeping it newest first
+const mergeSuggestions = (current: Suggestion[], incoming: Suggestion[]) => {
+  const byId = new Map(current.map((s) => [s.id, s]))
+  incoming.forEach((s) => byId.set(s.id, { ...byId.get(s.id), ...s }))
+  return Array.from(byId.values()).sort(
+    (a, b) => Date.parse(b.created_at) - Date.parse(a.created_at) || b.id - a.id
+  )
 }
 
 function App() {
   const [suggestions, setSuggestions] = useState<Suggestion[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState<string | null>(null)
 
+  // Change watermark of the last sync; polls only fetch rows changed since
+  const versionRef = useRef<number | null>(null)
+
+  const fetchPage = async (params: URLSearchParams): Promise<SuggestionPage> => {
+    // The browser cache revalidates with If-None-Match, so an unchanged
+    // collection comes back as a cheap 304
+    const response = await fetch(`http://localhost:8000/api/suggestions?${params}`)
+    if (!response.ok) throw new Error('Failed to fetch suggestions')
+    return response.json()
+  }
+
   const fetchSuggestions = async () => {
     try {
-      const response = await fetch('http://localhost:8000/api/suggestions')
-      if (!response.ok) throw new Error('Failed to fetch suggestions')
-      const data = await response.json()
-      setSuggestions(data)
+      if (versionRef.current === null) {
+        const page = await fetchPage(new URLSearchParams({ limit: String(PAGE_SIZE) }))
+        setSuggestions((current) => mergeSuggestions(current, page.items))
+        setNextCursor(page.next_cursor)
+        versionRef.current = page.version
+      } else {
+        const page = await fetchPage(new URLSearchParams({ since: String(versionRef.current) }))
+        setSuggestions((current) => mergeSuggestions(current, page.items))
+        versionRef.current = page.version
+      }
       setError(null)
     } catch (err) {
       setError(err instanceof Error ? err.message : 'An error occurred')
@@ -33,10 +70,34 @@ function App() {
     }
   }
 
+  const loadMore = async () => {
+    if (!nextCursor) return
+    setLoadingMore(true)
+    try {
+      const page = await fetchPage(
+        new URLSearchParams({ limit: String(PAGE_SIZE), cursor: nextCursor })
+      )
+      setSuggestions((current) => mergeSuggestions(current, page.items))
+      setNextCursor(page.next_cursor)
+    } catch (err) {
+      setError(err instanceof Error ? err.message : 'Failed to load more suggestions')
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   useEffect(() => {
     fetchSuggestions()
-    const interval = setInterval(fetchSuggestions, 5000)
-    return () => clearInterval(interval)
+    
+    // Status changes are pushed by the server; each event triggers a delta
+    // sync. The slow poll only covers events missed while reconnecting.
+    const events = new EventSource('http://localhost:8000/api/events')
+    events.addEventListener('suggestion', () => fetchSuggestions())
+    const interval = setInterval(fetchSuggestions, 30000)
+    return () => {
+      events.close()
+      clearInterval(interval)
+    }
   }, [])
 
   const handleSubmit = async (content: string) => {
@@ -82,7 +143,20 @@ function App() {
               <p className="mt-4 text-gray-600">Loading suggestions...</p>
             </div>
           ) : (
-            <SuggestionList suggestions={suggestions} onRefresh={fetchSuggestions} />
+            <>
+              <SuggestionList suggestions={suggestions} onRefresh={fetchSuggestions} />
+              {nextCursor && (
+                <div className="text-center">
+                  <button
+                    onClick={loadMore}
+                    disabled={loadingMore}
+                    className="bg-white hover:bg-indigo-50 disabled:opacity-50 text-indigo-700 font-medium py-2 px-6 rounded-lg shadow transition-colors"
+                  >
+                    {loadingMore ? '⏳ Loading...' : 'Load older suggestions'}
+                  </button>
+                </div>
+              )}
+            </>
           )}
         </div>
 
@@ -1,25 +1,37 @@
 import React, { useEffect, useState } from 'react';
 import { LiveProvider, LiveError, LivePreview } from 'react-live';
 
-interface Suggestion {
+interface DeployedComponent {
   id: number;
   content: string;
-  status: string;
-  generated_code: string | null;
-  deployed: boolean;
   component_name: string | null;
+  code_hash: string | null;
   created_at: string;
 }
 
 const ComponentGallery: React.FC = () => {
-  const [deployed, setDeployed] = useState<Suggestion[]>([]);
+  const [deployed, setDeployed] = useState<DeployedComponent[]>([]);
+  // Component code by content hash; a hash's code never changes
+  const [code, setCode] = useState<Record<string, string>>({});
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
 
   useEffect(() => {
     fetchDeployedComponents();
-    const interval = setInterval(fetchDeployedComponents, 5000);
-    return () => clearInterval(interval);
+    
+    // Refetch only when a component is deployed or undeployed
+    const events = new EventSource('http://localhost:8000/api/events');
+    events.addEventListener('suggestion', (e) => {
+      const change = JSON.parse((e as MessageEvent).data);
+      if (change.event === 'deployed' || change.event === 'undeployed') {
+        fetchDeployedComponents();
+      }
+    });
+    const interval = setInterval(fetchDeployedComponents, 30000);
+    return () => {
+      events.close();
+      clearInterval(interval);
+    };
   }, []);
 
   const fetchDeployedComponents = async () => {
@@ -27,9 +39,12 @@ const ComponentGallery: React.FC = () => {
       const response = await fetch('http://localhost:8000/api/suggestions/deployed/list');
       if (!response.ok) throw new Error('Failed to fetch deployed components');
       
-      const data = await response.json();
+      const data: DeployedComponent[] = await response.json();
       setDeployed(data);
       setLoading(false);
+      data.forEach((component) => {
+        if (component.code_hash) fetchCode(component.code_hash);
+      });
     } catch (err) {
       console.error('Error fetching deployed components:', err);
       setError(err instanceof Error ? err.message : 'Failed to load components');
@@ -37,6 +52,18 @@ const ComponentGallery: React.FC = () => {
     }
   };
 
+  const fetchCode = async (hash: string) => {
+    // Immutable: cached by the browser and by the nginx proxy in front of the API
+    try {
+      const response = await fetch(`/components/${hash}`);
+      if (!response.ok) throw new Error('Failed to fetch component code');
+      const body = await response.text();
+      setCode((current) => (current[hash] === undefined ? { ...current, [hash]: body } : current));
+    } catch (err) {
+      console.error('Error fetching component code:', err);
+    }
+  };
+
   if (loading && deployed.length === 0) {
     return (
       <div className="bg-white rounded-lg shadow p-6">
@@ -95,7 +122,7 @@ const ComponentGallery: React.FC = () => {
                   <div className="bg-white p-4 rounded border-2 border-green-300 mb-4">
                     <p className="text-xs text-green-700 font-semibold mb-2">✨ Live Component:</p>
                     <LiveProvider 
-                      code={suggestion.generated_code || ''} 
+                      code={(suggestion.code_hash && code[suggestion.code_hash]) || ''} 
                       scope={{ React }}
                       noInline={false}
                     >
@@ -112,7 +139,7 @@ const ComponentGallery: React.FC = () => {
                       📄 View Source Code
                     </summary>
                     <pre className="text-xs overflow-x-auto bg-gray-50 p-2 rounded mt-2">
-                      <code>{suggestion.generated_code}</code>
+                      <code>{suggestion.code_hash && code[suggestion.code_hash]}</code>
                     </pre>
                   </details>
                 </div>
@@ -1,6 +1,25 @@
 import { useState } from 'react'
 import { Suggestion } from '../App'
 
+interface Job {
+  id: number
+  kind: string
+  status: string
+  result: any
+  error: string | null
+}
+
+// Analysis and generation run as background jobs; poll until they finish
+const waitForJob = async (jobId: number): Promise<Job> => {
+  while (true) {
+    const response = await fetch(`http://localhost:8000/api/jobs/${jobId}`)
+    if (!response.ok) throw new Error('Failed to fetch job status')
+    const job: Job = await response.json()
+    if (job.status === 'completed' || job.status === 'failed') return job
+    await new Promise((resolve) => setTimeout(resolve, 1000))
+  }
+}
+
 interface SuggestionListProps {
   suggestions: Suggestion[]
   onRefresh: () => void
@@ -14,6 +33,7 @@ function SuggestionList({ suggestions, onRefresh }: SuggestionListProps) {
   const [generatingId, setGeneratingId] = useState<number | null>(null)
   const [analysis, setAnalysis] = useState<Record<number, any>>({})
   const [changes, setChanges] = useState<Record<number, any>>({})
+  const [code, setCode] = useState<Record<number, string>>({})
 
   const getStatusColor = (status: string) => {
     switch (status) {
@@ -51,8 +71,24 @@ function SuggestionList({ suggestions, onRefresh }: SuggestionListProps) {
     setTimeout(() => setCopiedId(null), 2000)
   }
 
-  const toggleExpand = (id: number) => {
-    setExpandedId(expandedId === id ? null : id)
+  const toggleExpand = async (id: number) => {
+    if (expandedId === id) {
+      setExpandedId(null)
+      return
+    }
+    setExpandedId(id)
+    
+    // The list endpoint omits generated_code, so load it on first expand
+    if (code[id] === undefined) {
+      try {
+        const response = await fetch(`http://localhost:8000/api/suggestions/${id}/code`)
+        if (!response.ok) throw new Error('Failed to load code')
+        const data = await response.json()
+        setCode((current) => ({ ...current, [id]: data.generated_code ?? '' }))
+      } catch (error) {
+        console.error('Code load error:', error)
+      }
+    }
   }
 
   const handleDeploy = async (id: number) => {
@@ -114,8 +150,12 @@ function SuggestionList({ suggestions, onRefresh }: SuggestionListProps) {
         return
       }
       
-      const data = await response.json()
-      setAnalysis({ ...analysis, [id]: data })
+      const job = await waitForJob((await response.json()).id)
+      if (job.status === 'failed') {
+        alert(`Analysis failed: ${job.error}`)
+        return
+      }
+      setAnalysis((current) => ({ ...current, [id]: job.result }))
     } catch (error) {
       console.error('Analysis error:', error)
       alert('Failed to analyze suggestion')
@@ -137,8 +177,12 @@ function SuggestionList({ suggestions, onRefresh }: SuggestionListProps) {
         return
       }
       
-      const data = await response.json()
-      setChanges({ ...changes, [id]: data })
+      const job = await waitForJob((await response.json()).id)
+      if (job.status === 'failed' || job.result.error) {
+        alert(`Generation failed: ${job.error ?? job.result.error}`)
+        return
+      }
+      setChanges((current) => ({ ...current, [id]: job.result }))
       alert('Multi-file changes generated! Review the results below.')
     } catch (error) {
       console.error('Generation error:', error)
@@ -188,7 +232,7 @@ function SuggestionList({ suggestions, onRefresh }: SuggestionListProps) {
             </span>
           </div>
 
-          {suggestion.status === 'completed' && suggestion.generated_code && (
+          {suggestion.status === 'completed' && (
             <div className="mt-4">
               <div className="flex gap-2 mb-2">
                 <button
@@ -238,14 +282,14 @@ function SuggestionList({ suggestions, onRefresh }: SuggestionListProps) {
                   <div className="flex justify-between items-center mb-2">
                     <span className="text-sm font-medium text-gray-700">Generated Component:</span>
                     <button
-                      onClick={() => handleCopyCode(suggestion.generated_code!, suggestion.id)}
+                      onClick={() => handleCopyCode(code[suggestion.id] ?? '', suggestion.id)}
                       className="text-sm bg-gray-100 hover:bg-gray-200 px-3 py-1 rounded transition-colors"
                     >
                       {copiedId === suggestion.id ? '✓ Copied!' : '📋 Copy'}
                     </button>
                   </div>
                   <pre className="bg-gray-900 text-gray-100 p-4 rounded-lg overflow-x-auto">
-                    <code>{suggestion.generated_code}</code>
+                    <code>{code[suggestion.id] ?? 'Loading...'}</code>
                   </pre>
                 </div>
               )}
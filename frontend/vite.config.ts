@@ -6,5 +6,9 @@ export default defineConfig({
   server: {
     host: true,
     port: 3000,
+    // Same-origin like behind nginx, so component bodies share its cache
+    proxy: {
+      '/components': 'http://localhost:8000',
+    },
   },
 })
@@ -5,16 +5,36 @@ echo ""
 
 SUGGESTION_ID=14
 
+# Analysis and generation run as background jobs: enqueue, then poll until done
+wait_for_job() {
+    local job_id=$1
+    while true; do
+        local job=$(curl -s "http://localhost:8000/api/jobs/$job_id")
+        local status=$(echo "$job" | python3 -c "import json, sys; print(json.load(sys.stdin)['status'])")
+        if [ "$status" = "completed" ] || [ "$status" = "failed" ]; then
+            echo "$job"
+            return
+        fi
+        sleep 1
+    done
+}
+
+job_id() {
+    python3 -c "import json, sys; print(json.load(sys.stdin)['id'])"
+}
+
 # Step 1: Analyze
 echo "Step 1: Analyzing which files to modify..."
-curl -s -X POST "http://localhost:8000/api/suggestions/$SUGGESTION_ID/analyze" | python3 -m json.tool
+JOB_ID=$(curl -s -X POST "http://localhost:8000/api/suggestions/$SUGGESTION_ID/analyze" | job_id)
+wait_for_job $JOB_ID | python3 -c "import json, sys; print(json.dumps(json.load(sys.stdin)['result'], indent=4))"
 echo ""
 echo "---"
 echo ""
 
 # Step 2: Generate changes
 echo "Step 2: Generating multi-file changes with AI review..."
-curl -s -X POST "http://localhost:8000/api/suggestions/$SUGGESTION_ID/generate-changes" > /tmp/multi_agent_result.json
+JOB_ID=$(curl -s -X POST "http://localhost:8000/api/suggestions/$SUGGESTION_ID/generate-changes" | job_id)
+wait_for_job $JOB_ID | python3 -c "import json, sys; print(json.dumps(json.load(sys.stdin)['result']))" > /tmp/multi_agent_result.json
 cat /tmp/multi_agent_result.json | python3 -c "
 import json
 import sys